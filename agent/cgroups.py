@@ -0,0 +1,157 @@
+"""Ресурсы контейнеров напрямую из cgroup v2 (cpu.stat, memory.*, io.stat, pids.current) — вместо docker stats."""
+from __future__ import annotations
+
+import os
+import re
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+# Где docker кладёт cgroup контейнера: драйвер systemd и cgroupfs (в т.ч. с --cgroup-parent по умолчанию)
+CANDIDATES = ("system.slice/docker-{id}.scope", "docker/{id}", "docker.slice/docker-{id}.scope")
+
+
+def unified(root: str = "/sys/fs/cgroup") -> bool:
+    # Чистый cgroup v2: в корне есть cgroup.controllers (у гибридной v1/v2 — только в подкаталоге unified)
+    return os.path.exists(os.path.join(root, "cgroup.controllers"))
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb", buffering=0) as fh:
+            return fh.read(65536).decode("ascii", "replace")
+    except OSError:
+        return None
+
+
+def _keyed(text: Optional[str]) -> Dict[str, int]:
+    # cpu.stat, memory.stat: "ключ значение" построчно
+    out = {}
+    for line in (text or "").splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            out[key] = int(value)
+    return out
+
+
+def _io_totals(text: Optional[str]) -> Dict[str, int]:
+    # io.stat: "8:0 rbytes=.. wbytes=.. rios=.. wios=.. dbytes=.. dios=.." по устройствам — суммируем
+    out = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    for line in (text or "").splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key in out and value.isdigit():
+                out[key] += int(value)
+    return out
+
+
+def container_of(pid: int, proc_root: str = "/proc") -> Optional[str]:
+    # Полный id контейнера процесса по его cgroup (v1 и v2: docker-<id>.scope, /docker/<id>,
+    # cri-containerd-<id>.scope); None — процесс хоста или уже завершился
+    for line in (_read(os.path.join(proc_root, str(pid), "cgroup")) or "").splitlines():
+        match = re.search(r"(?:^|[/-])([0-9a-f]{64})(?:\.scope)?(?:/|$)", line.partition(":")[2].partition(":")[2])
+        if match:
+            return match.group(1)
+    return None
+
+
+class CgroupReader:
+    # Путь cgroup контейнера берётся из /proc/<pid>/cgroup его init-процесса (работает при любом драйвере
+    # и cgroup-parent), иначе — из типовых путей docker. Счётчики держатся по id контейнера: проценты CPU
+    # и скорости I/O — по приращению к прошлому чтению этого контейнера, как docker stats, но без его
+    # двух замеров с паузой. Контейнер, увиденный впервые, до следующего сбора идёт без CPU и скоростей.
+    def __init__(self, root: str = "/sys/fs/cgroup", proc_root: str = "/proc"):
+        self.root = root
+        self.proc_root = proc_root
+        self._paths: Dict[str, str] = {}
+        self._prev: Dict[str, Tuple[float, int, Dict[str, int]]] = {}
+        self._host_memory: Optional[int] = None
+
+    def available(self) -> bool:
+        return unified(self.root)
+
+    def _host_memory_total(self) -> int:
+        # Лимит контейнера без memory.max — вся память хоста (как у docker stats)
+        if self._host_memory is None:
+            self._host_memory = 0
+            for line in (_read(os.path.join(self.proc_root, "meminfo")) or "").splitlines():
+                if line.startswith("MemTotal:"):
+                    self._host_memory = int(line.split()[1]) * 1024
+                    break
+        return self._host_memory
+
+    def path_for(self, cid: str, pid: int = 0) -> Optional[str]:
+        cached = self._paths.get(cid)
+        if cached and os.path.isdir(cached):
+            return cached
+        path = None
+        if pid:
+            for line in (_read(os.path.join(self.proc_root, str(pid), "cgroup")) or "").splitlines():
+                if line.startswith("0::"):
+                    candidate = os.path.join(self.root, line[3:].strip().lstrip("/"))
+                    # Init контейнера с вложенными cgroup (systemd внутри) сидит в init.scope — берём родителя
+                    if os.path.basename(candidate) == "init.scope":
+                        candidate = os.path.dirname(candidate)
+                    if os.path.isdir(candidate) and candidate != self.root.rstrip("/"):
+                        path = candidate
+                    break
+        if path is None:
+            for pattern in CANDIDATES:
+                candidate = os.path.join(self.root, pattern.format(id=cid))
+                if os.path.isdir(candidate):
+                    path = candidate
+                    break
+        if path is None:
+            self._paths.pop(cid, None)
+            return None
+        self._paths[cid] = path
+        return path
+
+    def read(self, cid: str, pid: int = 0) -> Optional[dict]:
+        # {cpu_percent, memory_percent, memory_usage, memory_limit, block_read_bps, block_write_bps, pids};
+        # None — cgroup контейнера не найден (остановлен, v1, чужой namespace)
+        path = self.path_for(cid, pid)
+        if path is None:
+            return None
+        cpu = _keyed(_read(os.path.join(path, "cpu.stat")))
+        if "usage_usec" not in cpu:
+            self._paths.pop(cid, None)
+            return None
+        now = time.monotonic()
+        io = _io_totals(_read(os.path.join(path, "io.stat")))
+        current = int((_read(os.path.join(path, "memory.current")) or "0").strip() or 0)
+        raw_max = (_read(os.path.join(path, "memory.max")) or "max").strip()
+        limit = int(raw_max) if raw_max.isdigit() else 0
+        host_total = self._host_memory_total()
+        if not limit or (host_total and limit > host_total):
+            limit = host_total
+        # Как docker CLI на v2: неактивный файловый кэш в «использовано» не входит
+        usage = max(0, current - _keyed(_read(os.path.join(path, "memory.stat"))).get("inactive_file", 0))
+        pids = (_read(os.path.join(path, "pids.current")) or "").strip()
+        row = {
+            "cpu_percent": 0.0,
+            "memory_percent": round(100.0 * usage / limit, 2) if limit else 0.0,
+            "memory_usage": usage,
+            "memory_limit": limit,
+            "block_read_bps": None,
+            "block_write_bps": None,
+            "pids": int(pids) if pids.isdigit() else None,
+        }
+        prev = self._prev.get(cid)
+        self._prev[cid] = (now, cpu["usage_usec"], io)
+        if prev is not None and now > prev[0]:
+            elapsed = now - prev[0]
+            # 100% — одно ядро целиком, как в docker stats
+            if cpu["usage_usec"] >= prev[1]:
+                row["cpu_percent"] = round((cpu["usage_usec"] - prev[1]) / (elapsed * 1e4), 2)
+            if io["rbytes"] >= prev[2]["rbytes"] and io["wbytes"] >= prev[2]["wbytes"]:
+                row["block_read_bps"] = round((io["rbytes"] - prev[2]["rbytes"]) / elapsed, 1)
+                row["block_write_bps"] = round((io["wbytes"] - prev[2]["wbytes"]) / elapsed, 1)
+        return row
+
+    def forget(self, live: Iterable[str]) -> None:
+        # Удалённые контейнеры не держим в памяти
+        live = set(live)
+        for cid in [c for c in self._prev if c not in live]:
+            del self._prev[cid]
+        for cid in [c for c in self._paths if c not in live]:
+            del self._paths[cid]
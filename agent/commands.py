@@ -0,0 +1,248 @@
+"""Исполнитель команд мастера: очередь, небольшой пул потоков, таймауты по типу команды и отмена."""
+from __future__ import annotations
+
+import itertools
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Сроки выполнения по типу (первое слово команды), секунды; COMMAND_TIMEOUT_<ТИП> переопределяет
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "install-update": 1800,
+    "check-updates": 900,
+    "docker-logs": 120,
+    "get-process-logs": 120,
+    "docker": 120,
+    "firewall": 60,
+    "upnp": 120,
+    "profile": 330,
+}
+DEFAULT_TIMEOUT = 60.0
+
+# Типы, которые нельзя выполнять параллельно друг с другом (общая блокировка dpkg/apt)
+EXCLUSIVE_GROUPS: Dict[str, str] = {
+    "install-update": "apt",
+    "check-updates": "apt",
+}
+
+_current = threading.local()
+
+
+class CommandCancelled(Exception):
+    pass
+
+
+def cancelled() -> bool:
+    # Для долгих команд без подпроцессов (профайлер): пора ли прерваться по отмене или таймауту
+    job: Optional[Job] = getattr(_current, "job", None)
+    return job is not None and (job.cancelled or job.remaining() == 0.0)
+
+
+def command_kind(command: str) -> str:
+    parts = command.split()
+    return parts[0] if parts else ""
+
+
+class Job:
+    # Одна принятая команда. Процессы, запущенные через run() в потоке задачи, привязываются
+    # к ней: отмена и таймаут убивают их, и задача завершается, не дожидаясь apt-get/docker.
+    def __init__(self, job_id: int, command: str, timeout: float):
+        self.id = job_id
+        self.command = command
+        self.kind = command_kind(command)
+        self.timeout = timeout
+        self.state = "queued"
+        self.queued_at = time.time()
+        self.started = 0.0
+        self.deadline: Optional[float] = None
+        self.reason = ""
+        self.reported = False
+        self._cancelled = threading.Event()
+        self._procs: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str) -> None:
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.reason = reason
+            self._cancelled.set()
+            procs = list(self._procs)
+        for proc in procs:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def attach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.append(proc)
+            cancelled = self._cancelled.is_set()
+        if cancelled:
+            proc.kill()
+
+    def detach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            if proc in self._procs:
+                self._procs.remove(proc)
+
+    def info(self) -> dict:
+        return {
+            "id": self.id,
+            "command": self.command,
+            "state": self.state,
+            "timeout": self.timeout,
+            "running_for": round(time.monotonic() - self.started, 1) if self.started else None,
+        }
+
+
+def run(args, timeout: Optional[float] = None, check: bool = False, input=None,
+        capture_output: bool = False, **kwargs) -> subprocess.CompletedProcess:
+    # Замена subprocess.run для кода команд: вне задачи исполнителя ведёт себя как subprocess.run,
+    # внутри — укорачивает timeout до срока задачи и даёт отмене убить процесс
+    job: Optional[Job] = getattr(_current, "job", None)
+    if job is None:
+        return subprocess.run(args, timeout=timeout, check=check, input=input,
+                              capture_output=capture_output, **kwargs)
+    if job.cancelled:
+        raise CommandCancelled(job.reason)
+    remaining = job.remaining()
+    if remaining is not None:
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+    with subprocess.Popen(args, **kwargs) as proc:
+        job.attach(proc)
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise
+        finally:
+            job.detach(proc)
+    if job.cancelled:
+        raise CommandCancelled(job.reason)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+
+class CommandExecutor:
+    # handler(command) -> bool выполняет команду в потоке пула; report(command, status) сообщает мастеру
+    # итог (completed / failed / cancelled) сразу по завершении, таймауте или отмене каждой команды.
+    def __init__(self, handler: Callable[[str], bool], report: Callable[[str, str], None],
+                 workers: int = 2, max_queue: int = 20, log: Callable[[str], None] = print):
+        self.handler = handler
+        self.report = report
+        self.max_queue = max(1, int(max_queue))
+        self.log = log
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="command")
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._groups: Dict[str, threading.Lock] = {}
+        self._watchdog: Optional[threading.Thread] = None
+
+    @staticmethod
+    def timeout_for(kind: str) -> float:
+        raw = os.getenv("COMMAND_TIMEOUT_" + kind.upper().replace("-", "_"), "")
+        try:
+            value = float(raw) if raw.strip() else 0.0
+        except ValueError:
+            value = 0.0
+        return value if value > 0 else DEFAULT_TIMEOUTS.get(kind, DEFAULT_TIMEOUT)
+
+    def jobs(self) -> List[dict]:
+        with self._lock:
+            return [job.info() for job in self._jobs.values()]
+
+    def submit(self, command: str) -> Optional[Job]:
+        with self._lock:
+            if len(self._jobs) >= self.max_queue:
+                return None
+            job = Job(next(self._ids), command, self.timeout_for(command_kind(command)))
+            self._jobs[job.id] = job
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch, name="command-watchdog", daemon=True)
+                self._watchdog.start()
+        self._pool.submit(self._run, job)
+        return job
+
+    def cancel(self, match: str = "") -> int:
+        # Отмена по префиксу команды ("" — все); поставленные в очередь просто не начнутся
+        with self._lock:
+            targets = [job for job in self._jobs.values() if job.command.startswith(match)]
+        for job in targets:
+            job.cancel("cancelled")
+            self._finish(job, "cancelled")
+        return len(targets)
+
+    def _finish(self, job: Job, status: str) -> None:
+        with self._lock:
+            if job.reported:
+                return
+            job.reported = True
+            job.state = status
+            self._jobs.pop(job.id, None)
+        self.log(f"Command {job.command!r} {status}" + (f" ({job.reason})" if job.reason else ""))
+        try:
+            self.report(job.command, status)
+        except Exception as e:
+            self.log(f"Command status report failed: {e}")
+
+    def _run(self, job: Job) -> None:
+        if job.cancelled:
+            return
+        group = EXCLUSIVE_GROUPS.get(job.kind)
+        lock = None
+        if group:
+            with self._lock:
+                lock = self._groups.setdefault(group, threading.Lock())
+            lock.acquire()
+        try:
+            if job.cancelled:
+                return
+            job.state = "running"
+            job.started = time.monotonic()
+            job.deadline = job.started + job.timeout
+            _current.job = job
+            try:
+                ok = bool(self.handler(job.command))
+            except CommandCancelled:
+                ok = False
+            except Exception as e:
+                self.log(f"Command {job.command!r} raised: {e}")
+                ok = False
+            finally:
+                _current.job = None
+            self._finish(job, "completed" if ok else "failed")
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _watch(self) -> None:
+        # Срок задачи: по истечении убиваем её процессы и сразу сообщаем failed, не ожидая потока
+        while True:
+            time.sleep(1.0)
+            now = time.monotonic()
+            with self._lock:
+                expired = [j for j in self._jobs.values() if j.deadline is not None and now >= j.deadline]
+            for job in expired:
+                job.cancel(f"timed out after {job.timeout:g}s")
+                self._finish(job, "failed")
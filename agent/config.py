@@ -5,19 +5,109 @@ MASTER_URL = os.getenv("MASTER_URL", "https://master-server:8000")
 NODE_NAME = os.getenv("NODE_NAME", "node-1")
 NODE_TOKEN = os.getenv("NODE_TOKEN", "")
 COLLECT_INTERVAL = int(os.getenv("COLLECT_INTERVAL", "60"))  # секунды
+HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "15"))  # секунды, отдельный поток вне цикла сбора
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "5"))  # таймаут запроса heartbeat (своё соединение)
+# Канал команд — отдельный поток с long-poll: мастер держит get-command до COMMAND_POLL_WAIT секунд.
+# Без свободного слота (LONGPOLL_MAX_WAITERS на мастере) мастер отвечает сразу с retry_after — новая попытка
+# через несколько секунд с разбросом; мастер без long-poll — опрос раз в COMMAND_INTERVAL (0 — всегда так)
+COMMAND_POLL_WAIT = int(os.getenv("COMMAND_POLL_WAIT", "25"))
+COMMAND_INTERVAL = float(os.getenv("COMMAND_INTERVAL", str(COLLECT_INTERVAL)))
+# Исполнитель команд: пул потоков и очередь; COMMAND_TIMEOUT_<ТИП> — срок команды данного типа
+# (COMMAND_TIMEOUT_INSTALL_UPDATE, COMMAND_TIMEOUT_DOCKER_LOGS, ...). "cancel [префикс]" отменяет команды.
+# "profile [секунды] [интервал_мс]" — сэмплирующий профайлер агента; стеки смотреть на мастере
+# в processes.php?action=profile&node_id=N&format=folded (flamegraph.pl / speedscope). С панели обе ставятся
+# через POST nodes.php?id=N&action=node-action {"action": "profile", "seconds": 30} / {"action": "cancel", "target": ...}
+COMMAND_WORKERS = int(os.getenv("COMMAND_WORKERS", "2"))
+COMMAND_QUEUE_MAX = int(os.getenv("COMMAND_QUEUE_MAX", "20"))
+
+# Периоды отдельных коллекторов (секунды); по умолчанию кратны COLLECT_INTERVAL.
+# Для каждого есть и COLLECTOR_<NAME>_TIMEOUT — жёсткий срок выполнения (COLLECTOR_METRICS_TIMEOUT,
+# COLLECTOR_UPNP_TIMEOUT, ...); без префикса UPNP_TIMEOUT — таймаут SSDP-поиска, а не срок коллектора
+COLLECTOR_WORKERS = int(os.getenv("COLLECTOR_WORKERS", "4"))  # размер пула коллекторов
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", str(COLLECT_INTERVAL)))
+PROCESSES_INTERVAL = float(os.getenv("PROCESSES_INTERVAL", str(COLLECT_INTERVAL)))
+DOCKER_INTERVAL = float(os.getenv("DOCKER_INTERVAL", str(COLLECT_INTERVAL)))
+PORTS_INTERVAL = float(os.getenv("PORTS_INTERVAL", str(COLLECT_INTERVAL)))
+INTERFACES_INTERVAL = float(os.getenv("INTERFACES_INTERVAL", str(COLLECT_INTERVAL * 5)))
+LOGS_INTERVAL = float(os.getenv("LOGS_INTERVAL", str(COLLECT_INTERVAL)))
+
+# Единая выгрузка: секции цикла одним POST /api/ingest.php (false — по отдельным эндпоинтам)
+ENVELOPE_ENABLED = os.getenv("ENVELOPE_ENABLED", "true").lower() == "true"
+OUTBOX_MAX_LOGS = int(os.getenv("OUTBOX_MAX_LOGS", "5000"))  # потолок логов, ждущих отправки
+# Дельты для containers/ports/interfaces/upnp: только изменения к подтверждённой мастером версии
+DELTA_ENABLED = os.getenv("DELTA_ENABLED", "true").lower() == "true"
+DELTA_FULL_INTERVAL = float(os.getenv("DELTA_FULL_INTERVAL", "600"))  # полный снимок не реже, секунды
+DELTA_PCT_TOLERANCE = float(os.getenv("DELTA_PCT_TOLERANCE", "1.0"))  # порог изменения cpu/mem % контейнера
+DELTA_BYTES_TOLERANCE = float(os.getenv("DELTA_BYTES_TOLERANCE", str(16 * 1024 * 1024)))  # порог памяти контейнера, байт
+# Порог скорости I/O контейнера, байт/с; кроме него изменение должно быть не меньше четверти значения
+DELTA_RATE_TOLERANCE = float(os.getenv("DELTA_RATE_TOLERANCE", str(256 * 1024)))
 
 # TLS
 TLS_VERIFY = os.getenv("TLS_VERIFY", "true").lower() == "true"
 TLS_CERT_PATH = os.getenv("TLS_CERT_PATH", "")
 
-# Надёжность
-MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))  # количество повторов
-RETRY_DELAY = int(os.getenv("RETRY_DELAY", "5"))  # пауза между повторами (секунды)
+# Сжатие тел запросов (Content-Encoding: gzip) начиная с COMPRESS_MIN_BYTES байт JSON
+COMPRESS_ENABLED = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))  # 1 — быстрее, 9 — плотнее
+
+# Дисковый spool: недоставленные метрики и логи переживают недоступность мастера и рестарт агента
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "true").lower() == "true"
+SPOOL_DIR = os.getenv("SPOOL_DIR", "")  # по умолчанию — каталог spool рядом с LOG_CURSOR_PATH
+SPOOL_MAX_MB = float(os.getenv("SPOOL_MAX_MB", "64"))  # старые сегменты удаляются сверх лимита
+SPOOL_MAX_AGE_HOURS = float(os.getenv("SPOOL_MAX_AGE_HOURS", "24"))
+SPOOL_REPLAY_RATE = float(os.getenv("SPOOL_REPLAY_RATE", "2"))  # записей в секунду при досылке
+SPOOL_RETRY_INTERVAL = float(os.getenv("SPOOL_RETRY_INTERVAL", "30"))  # потолок паузы после неудачной досылки
+
+# Надёжность: запрос к мастеру — одна попытка без сна в цикле сбора; разовые отчёты
+# (результаты команд, статусы) повторяются фоновой очередью с backoff и full jitter
+# Попыток у разового запроса (результат команды, статус) в фоновой очереди повторов; пока circuit
+# breaker эндпоинта открыт, попытки не тратятся — 12 попыток с паузой до RETRY_MAX_DELAY ≈ 10+ минут
+DEFERRED_MAX_RETRIES = int(os.getenv("DEFERRED_MAX_RETRIES", "12"))
+RETRY_DELAY = float(os.getenv("RETRY_DELAY", "5"))  # база экспоненциальной паузы (секунды)
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "300"))  # потолок паузы между повторами
+RETRY_QUEUE_MAX = int(os.getenv("RETRY_QUEUE_MAX", "500"))  # запросов в очереди повторов
+# Circuit breaker на эндпоинт: после BREAKER_THRESHOLD неудач подряд запросы сразу отклоняются,
+# по истечении паузы (растёт до BREAKER_MAX_OPEN секунд) мастер проверяется одним запросом
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_MAX_OPEN = float(os.getenv("BREAKER_MAX_OPEN", "120"))
+
+# Частые выборки CPU/памяти/сети/диска между сборами (секунды, 0 — выключено); в metrics уходят
+# min/max/avg/p95/last за интервал. SAMPLE_CAPACITY — размер кольца на серию (выборок)
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", "5"))
+SAMPLE_CAPACITY = int(os.getenv("SAMPLE_CAPACITY", "720"))
+# Счётчики хоста (stat, meminfo, net/dev, diskstats) — прямым чтением /proc с постоянными дескрипторами;
+# false — через psutil (на не-Linux psutil используется всегда)
+PROCFS_FAST = os.getenv("PROCFS_FAST", "true").lower() == "true"
+
+# Заполненность всех реальных ФС (байты и inode), по одной точке на устройство. statvfs локальных ФС —
+# не чаще FS_USAGE_INTERVAL секунд; сетевых (NFS/CIFS/fuse) — не чаще FS_NETWORK_INTERVAL и в фоновом
+# потоке, цикл сбора их не ждёт; не ответившая за FS_NETWORK_TIMEOUT секунд ФС уходит с stale=true
+FS_USAGE_INTERVAL = float(os.getenv("FS_USAGE_INTERVAL", "30"))
+FS_NETWORK_INTERVAL = float(os.getenv("FS_NETWORK_INTERVAL", "300"))
+FS_NETWORK_TIMEOUT = float(os.getenv("FS_NETWORK_TIMEOUT", "5"))
+
+# CPU/память/I/O/pids контейнеров — прямо из cgroup v2 (/sys/fs/cgroup), CPU и скорости по приращению
+# между сборами; на cgroup v1 и для контейнеров вне найденных cgroup — docker stats. false — всегда docker stats
+CGROUP_STATS = os.getenv("CGROUP_STATS", "true").lower() == "true"
+
+# Источник метрик NVIDIA GPU: auto — NVML (libnvidia-ml, инициализация один раз), без неё — один
+# долгоживущий nvidia-smi --loop-ms=GPU_LOOP_MS; nvml / smi-loop — только указанный; exec — nvidia-smi
+# на каждый сбор, как раньше. Кроме загрузки, памяти и температуры: мощность, частоты, ECC, вентилятор
+GPU_BACKEND = os.getenv("GPU_BACKEND", "auto")
+GPU_LOOP_MS = int(os.getenv("GPU_LOOP_MS", "5000"))
+# Память GPU по процессам и контейнерам: с NVML — каждый сбор; без неё — разовым nvidia-smi
+# --query-compute-apps не чаще GPU_APPS_INTERVAL секунд (запуск nvidia-smi заново поднимает драйвер)
+GPU_APPS_INTERVAL = float(os.getenv("GPU_APPS_INTERVAL", "300"))
+
+# Health-check HTTP сервер агента (0 = выключен): /health, /metrics (Prometheus text), /debug/vars (JSON)
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", "0"))
 
-# Health-check HTTP сервер агента (0 = выключен)
+# UPnP (модуль и слушатели поднимаются после первой выгрузки метрик, не при старте агента)
 UPNP_ENABLED = os.getenv("UPNP_ENABLED", "true").lower() == "true"
 UPNP_MX = int(os.getenv("UPNP_MX", "3"))
 UPNP_TIMEOUT = float(os.getenv("UPNP_TIMEOUT", "8"))
 UPNP_INTERVAL_CYCLES = int(os.getenv("UPNP_INTERVAL_CYCLES", "2"))
+UPNP_INTERVAL = float(os.getenv("UPNP_INTERVAL", str(COLLECT_INTERVAL * UPNP_INTERVAL_CYCLES)))
 UPNP_GENA_PORT = int(os.getenv("UPNP_GENA_PORT", "0"))
 
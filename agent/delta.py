@@ -0,0 +1,178 @@
+"""Дельта-снимки секций (контейнеры, порты, интерфейсы, UPnP) относительно последнего подтверждённого мастером."""
+from __future__ import annotations
+
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+Tolerance = Optional[Union[float, Tuple[float, float]]]
+
+
+def _num(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Collection:
+    # Набор элементов одной секции со стабильным ключом. volatile: поле -> допуск;
+    # изменение меньше допуска (или любое, если допуск None) не считается изменением элемента.
+    # Допуск (порог, доля) — изменение должно быть не меньше порога и не меньше доли от большего из значений
+    def __init__(self, name: str, key: Callable[[dict], str], volatile: Optional[Dict[str, Tolerance]] = None):
+        self.name = name
+        self.key = key
+        self.volatile = volatile or {}
+
+    def index(self, items) -> Dict[str, dict]:
+        out: Dict[str, dict] = {}
+        for item in items or []:
+            if not isinstance(item, dict):
+                continue
+            key = self.key(item)
+            if key:
+                out[key] = item
+        return out
+
+    def changed(self, old: dict, new: dict) -> bool:
+        if old.keys() != new.keys():
+            return True
+        for field, value in new.items():
+            if field in self.volatile:
+                if self._moved(self.volatile[field], _num(old.get(field)), _num(value)):
+                    return True
+                continue
+            if old.get(field) != value:
+                return True
+        return False
+
+    @staticmethod
+    def _moved(tolerance: Tolerance, old: float, new: float) -> bool:
+        if tolerance is None:
+            return False
+        if isinstance(tolerance, tuple):
+            floor, ratio = tolerance
+            return abs(new - old) >= max(floor, ratio * max(abs(old), abs(new)))
+        return abs(new - old) >= tolerance
+
+
+class DeltaTracker:
+    # Версионированный снимок секции. encode() даёт либо полный снимок, либо дельту к последней
+    # подтверждённой версии; ack() фиксирует версию после ответа мастера, reset() — после рассинхрона.
+    # Раз в full_interval секунд шлётся полный снимок: так обновляются volatile-поля и лечится дрейф.
+    def __init__(self, collections: List[Collection], full_interval: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.collections = collections
+        self.full_interval = full_interval
+        self.clock = clock
+        self.version = 0
+        self.acked_version: Optional[int] = None
+        self.acked: Dict[str, Dict[str, dict]] = {}
+        self.acked_at = 0.0
+        self.pending: Dict[int, Tuple[Dict[str, Dict[str, dict]], bool]] = {}
+        self._lock = Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.acked_version = None
+            self.acked = {}
+            self.pending.clear()
+
+    def encode(self, payload: dict) -> Tuple[dict, int]:
+        with self._lock:
+            return self._encode(payload)
+
+    def _encode(self, payload: dict) -> Tuple[dict, int]:
+        current = {c.name: c.index(payload.get(c.name)) for c in self.collections}
+        self.version += 1
+        version = self.version
+        full = self.acked_version is None or self.clock() - self.acked_at >= self.full_interval
+        if full:
+            body = {"mode": "full", "version": version}
+            for c in self.collections:
+                body[c.name] = list(current[c.name].values())
+        else:
+            body = {"mode": "delta", "base": self.acked_version, "version": version}
+            for c in self.collections:
+                old = self.acked.get(c.name, {})
+                new = current[c.name]
+                upsert = [item for key, item in new.items() if key not in old or c.changed(old[key], item)]
+                remove = [key for key in old if key not in new]
+                body[c.name] = {"upsert": upsert, "remove": remove}
+        # Базой для следующей дельты становится то, что мастер реально получил: для неизменившихся
+        # элементов — прежняя версия (иначе volatile-поля «уплывали» бы без отправки)
+        if full:
+            base = current
+        else:
+            base = {}
+            for c in self.collections:
+                old = self.acked.get(c.name, {})
+                sent = {c.key(item) for item in body[c.name]["upsert"]}
+                base[c.name] = {k: (v if k in sent or k not in old else old[k]) for k, v in current[c.name].items()}
+        self.pending = {v: p for v, p in self.pending.items() if v > version - 8}
+        self.pending[version] = (base, full)
+        return body, version
+
+    def ack(self, version: int) -> None:
+        with self._lock:
+            self._ack(version)
+
+    def _ack(self, version: int) -> None:
+        entry = self.pending.pop(version, None)
+        if entry is None:
+            return
+        snapshot, full = entry
+        self.acked = snapshot
+        self.acked_version = version
+        if full:
+            self.acked_at = self.clock()
+        self.pending = {v: p for v, p in self.pending.items() if v > version}
+
+    @staticmethod
+    def is_empty(body: dict) -> bool:
+        if body.get("mode") != "delta":
+            return False
+        return all(
+            not part.get("upsert") and not part.get("remove")
+            for part in body.values() if isinstance(part, dict)
+        )
+
+
+def _port_key(item: dict) -> str:
+    return f"{item.get('port')}/{item.get('type') or 'tcp'}"
+
+
+def _network_key(item: dict) -> str:
+    return str(item.get("network_id") or item.get("id") or item.get("name") or "")
+
+
+def _neighbor_key(item: dict) -> str:
+    ip = str(item.get("ip") or "").strip()
+    return f"{ip}|{item.get('iface') or ''}" if ip else ""
+
+
+def section_trackers(full_interval: float = 600.0, pct_tolerance: float = 1.0,
+                     bytes_tolerance: float = 16 * 1024 * 1024,
+                     rate_tolerance: float = 256 * 1024) -> Dict[str, DeltaTracker]:
+    # Ключи элементов совпадают с тем, как мастер их различает при применении дельты. Ресурсы контейнера
+    # из cgroup и GPU меняются каждый сбор: память — с порогом в байтах; скорости I/O — от rate_tolerance
+    # байт/с и на четверть; pids — от 1 и на десятую; число процессов на GPU — при любом изменении
+    rate = (rate_tolerance, 0.25)
+    return {
+        "containers": DeltaTracker([
+            Collection("containers", lambda c: str(c.get("container_id") or ""),
+                       {"cpu_percent": pct_tolerance, "memory_percent": pct_tolerance,
+                        "memory_usage": bytes_tolerance, "block_read_bps": rate, "block_write_bps": rate,
+                        "pids": (1, 0.1), "gpu_memory": bytes_tolerance, "gpu_util": pct_tolerance, "gpu_pids": 1}),
+            Collection("networks", _network_key),
+        ], full_interval),
+        "ports": DeltaTracker([Collection("ports", _port_key)], full_interval),
+        "interfaces": DeltaTracker([
+            Collection("interfaces", lambda i: str(i.get("name") or ""), {"rx_bytes": None, "tx_bytes": None}),
+            Collection("neighbors", _neighbor_key),
+        ], full_interval),
+        "upnp": DeltaTracker([
+            Collection("devices", lambda d: str(d.get("udn") or "").strip(),
+                       {"uptime": None, "bytes_sent": None, "bytes_received": None}),
+        ], full_interval),
+    }
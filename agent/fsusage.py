@@ -0,0 +1,159 @@
+"""Заполненность всех реальных файловых систем (байты и inode): statvfs с кэшем, сетевые ФС — в отдельных потоках с таймаутом."""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Псевдо- и служебные ФС: их «заполненность» ничего не говорит о дисках
+PSEUDO_FS = frozenset({
+    "tmpfs", "devtmpfs", "overlay", "squashfs", "aufs", "ramfs", "proc", "sysfs", "cgroup", "cgroup2",
+    "iso9660", "devpts", "mqueue", "debugfs", "tracefs", "securityfs", "pstore", "bpf", "fusectl",
+    "configfs", "hugetlbfs", "autofs", "binfmt_misc", "nsfs", "rpc_pipefs", "efivarfs", "selinuxfs",
+    "fuse.lxcfs", "fuse.portal", "fuse.gvfsd-fuse", "nfsd", "rootfs",
+})
+# Сетевые ФС: statvfs на недоступном сервере висит минутами, поэтому только в отдельном потоке
+NETWORK_FS = frozenset({
+    "nfs", "nfs4", "cifs", "smbfs", "smb3", "9p", "ceph", "glusterfs", "lustre", "afs", "davfs", "gpfs", "beegfs",
+})
+SKIP_MOUNTS = ("/dev", "/run", "/sys", "/proc", "/snap", "/var/lib/docker", "/var/lib/containers", "/var/lib/kubelet")
+
+Mount = Tuple[str, str, str]  # (устройство, точка монтирования, тип ФС)
+
+
+def is_network(fstype: str) -> bool:
+    # fuse.* (sshfs, s3fs, rclone) тоже ходят в сеть; fuseblk — локальный (ntfs-3g)
+    return fstype in NETWORK_FS or fstype.startswith("fuse.")
+
+
+def _unescape(field: str) -> str:
+    # В /proc/self/mounts пробел, таб и \ записаны восьмеричными escape: \040, \011, \134
+    if "\\" not in field:
+        return field
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def statvfs(mount: str) -> Optional[dict]:
+    # Как psutil.disk_usage: percent = used / (used + доступное непривилегированным); inode — как df -i
+    try:
+        st = os.statvfs(mount)
+    except OSError:
+        return None
+    total = st.f_blocks * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    row = {
+        "total": total,
+        "used": used,
+        "free": free,
+        "percent": round(100.0 * used / (used + free), 1) if used + free else 0.0,
+        "inodes_total": None,
+        "inodes_used": None,
+        "inodes_percent": None,
+    }
+    # btrfs, vfat и часть сетевых ФС inode не считают (f_files = 0)
+    if st.f_files:
+        inodes_used = st.f_files - st.f_ffree
+        row.update(inodes_total=st.f_files, inodes_used=inodes_used,
+                   inodes_percent=round(100.0 * inodes_used / st.f_files, 1))
+    return row
+
+
+class FsUsage:
+    # collect() не блокируется: локальные ФС опрашиваются не чаще interval секунд, сетевые — не чаще
+    # network_interval и только в фоновом потоке. Поток, не вернувшийся за timeout, помечает точку
+    # stale; пока он висит, новый для той же точки не запускается — зависшие потоки не копятся.
+    def __init__(self, proc_root: str = "/proc", interval: float = 30.0, network_interval: float = 300.0,
+                 timeout: float = 5.0, log: Callable[[str], None] = print):
+        self.proc_root = proc_root
+        self.interval = max(0.0, float(interval))
+        self.network_interval = max(1.0, float(network_interval))
+        self.timeout = max(0.1, float(timeout))
+        self.log = log
+        self._cache: Dict[str, Tuple[float, Optional[dict]]] = {}
+        self._pending: Dict[str, float] = {}
+        self._lock = Lock()
+
+    def _read_mounts(self) -> List[Mount]:
+        if sys.platform.startswith("linux"):
+            try:
+                with open(os.path.join(self.proc_root, "self", "mounts"), encoding="utf-8", errors="replace") as fh:
+                    rows = []
+                    for line in fh:
+                        fields = line.split()
+                        if len(fields) >= 3:
+                            rows.append((_unescape(fields[0]), _unescape(fields[1]), fields[2].lower()))
+                    return rows
+            except OSError:
+                pass
+        import psutil
+        try:
+            return [(p.device, p.mountpoint, (p.fstype or "").lower()) for p in psutil.disk_partitions(all=True)]
+        except Exception:
+            return []
+
+    def mounts(self) -> List[Mount]:
+        # Реальные ФС, одна точка на устройство: bind-монтирования и подтома btrfs дают ту же заполненность,
+        # остаётся самая короткая точка. Перемонтированная поверх точка — последняя строка в mounts.
+        latest: Dict[str, Mount] = {}
+        for device, mount, fstype in self._read_mounts():
+            if fstype in PSEUDO_FS or not fstype:
+                continue
+            if any(mount == m or mount.startswith(m + "/") for m in SKIP_MOUNTS):
+                continue
+            latest[mount] = (device, mount, fstype)
+        seen: Dict[str, Mount] = {}
+        for device, mount, fstype in sorted(latest.values(), key=lambda row: (len(row[1]), row[1])):
+            seen.setdefault(device, (device, mount, fstype))
+        return sorted(seen.values(), key=lambda row: row[1])
+
+    def _refresh(self, mount: str) -> None:
+        started = time.monotonic()
+        value = statvfs(mount)
+        took = time.monotonic() - started
+        if took > self.timeout:
+            self.log(f"fsusage: statvfs {mount} returned after {took:.0f}s")
+        with self._lock:
+            self._cache[mount] = (time.monotonic(), value)
+            self._pending.pop(mount, None)
+
+    def _refresh_async(self, mount: str, now: float) -> None:
+        with self._lock:
+            if mount in self._pending:
+                return
+            self._pending[mount] = now
+        Thread(target=self._refresh, args=(mount,), name="statvfs", daemon=True).start()
+
+    def collect(self) -> List[dict]:
+        # [{mount, device, fstype, network, stale, total, used, free, percent, inodes_*}]
+        now = time.monotonic()
+        rows = []
+        mounts = self.mounts()
+        for device, mount, fstype in mounts:
+            network = is_network(fstype)
+            with self._lock:
+                cached = self._cache.get(mount)
+                pending = self._pending.get(mount)
+            if network:
+                if cached is None or now - cached[0] >= self.network_interval:
+                    self._refresh_async(mount, now)
+            elif cached is None or now - cached[0] >= self.interval:
+                cached = (now, statvfs(mount))
+                with self._lock:
+                    self._cache[mount] = cached
+            stale = pending is not None and now - pending > self.timeout
+            if cached is None or cached[1] is None:
+                if stale:
+                    # Ни одного ответа, а запрос висит — сама точка и есть проблема, отдаём без цифр
+                    rows.append({"mount": mount, "device": device, "fstype": fstype, "network": True, "stale": True})
+                continue
+            rows.append(dict(cached[1], mount=mount, device=device, fstype=fstype, network=network, stale=stale))
+        # Отмонтированные точки из кэша убираем (висящие потоки — сами, по возвращении)
+        live = {mount for _, mount, _ in mounts}
+        with self._lock:
+            for mount in [m for m in self._cache if m not in live and m not in self._pending]:
+                del self._cache[mount]
+        return rows
@@ -0,0 +1,406 @@
+"""Телеметрия GPU без запуска nvidia-smi на каждый сбор: NVML через ctypes (один init) или один долгоживущий nvidia-smi --loop-ms."""
+from __future__ import annotations
+
+import shutil
+import subprocess
+import time
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+NVML_SUCCESS = 0
+NVML_ERROR_NOT_SUPPORTED = 3
+NVML_ERROR_INSUFFICIENT_SIZE = 7
+NVML_ERROR_GPU_IS_LOST = 15
+NVML_TEMPERATURE_GPU = 0
+NVML_CLOCK_GRAPHICS, NVML_CLOCK_SM, NVML_CLOCK_MEM = 0, 1, 2
+NVML_MEMORY_ERROR_CORRECTED, NVML_MEMORY_ERROR_UNCORRECTED = 0, 1
+NVML_AGGREGATE_ECC = 1
+NVML_VALUE_NOT_AVAILABLE = (1 << 64) - 1
+MIB = 1024 * 1024
+
+# Поля потока nvidia-smi в порядке колонок CSV; ключ строки -> поле --query-gpu
+SMI_FIELDS = (
+    ("index", "index"),
+    ("name", "name"),
+    ("uuid", "uuid"),
+    ("utilization", "utilization.gpu"),
+    ("memory_utilization", "utilization.memory"),
+    ("memory_used", "memory.used"),
+    ("memory_total", "memory.total"),
+    ("temperature", "temperature.gpu"),
+    ("power_watts", "power.draw"),
+    ("power_limit_watts", "power.limit"),
+    ("clock_graphics_mhz", "clocks.gr"),
+    ("clock_sm_mhz", "clocks.sm"),
+    ("clock_memory_mhz", "clocks.mem"),
+    ("ecc_corrected", "ecc.errors.corrected.aggregate.total"),
+    ("ecc_uncorrected", "ecc.errors.uncorrected.aggregate.total"),
+    ("fan_percent", "fan.speed"),
+)
+SMI_TEXT = frozenset({"name", "uuid"})
+SMI_INT = frozenset({"index", "memory_used", "memory_total", "clock_graphics_mhz", "clock_sm_mhz", "clock_memory_mhz",
+                     "ecc_corrected", "ecc_uncorrected"})
+
+
+def _smi_value(key: str, raw: str):
+    # [N/A], [Not Supported], [Unknown Error] — нет значения, а не ноль
+    text = raw.strip()
+    if key in SMI_TEXT:
+        return text
+    if not text or text.startswith("[") or text.upper() in ("N/A", "NA", "-"):
+        return None
+    try:
+        number = float(text.replace("%", "").split()[0])
+    except (ValueError, IndexError):
+        return None
+    return int(number) if key in SMI_INT else number
+
+
+class NvmlBackend:
+    # libnvidia-ml загружается и инициализируется один раз, хэндлы устройств кэшируются; lib можно
+    # подменить объектом с теми же функциями (проверка без драйвера). Метрика, которую карта не
+    # поддерживает (NOT_SUPPORTED: ECC на потребительских, вентилятор на пассивных), — None.
+    name = "nvml"
+
+    def __init__(self, lib=None):
+        self._lib = lib
+        self._handles: List[object] = []
+        self._names: List[str] = []
+        self._uuids: List[str] = []
+        self._util_seen: Dict[int, int] = {}
+        self._ready = False
+
+    def open(self) -> bool:
+        import ctypes
+        if self._lib is None:
+            try:
+                self._lib = ctypes.CDLL("libnvidia-ml.so.1")
+            except OSError:
+                return False
+        if self._lib.nvmlInit_v2() != NVML_SUCCESS:
+            return False
+        count = ctypes.c_uint(0)
+        if self._lib.nvmlDeviceGetCount_v2(ctypes.byref(count)) != NVML_SUCCESS:
+            self._lib.nvmlShutdown()
+            return False
+        self._handles, self._names, self._uuids = [], [], []
+        for index in range(count.value):
+            handle = ctypes.c_void_p()
+            if self._lib.nvmlDeviceGetHandleByIndex_v2(ctypes.c_uint(index), ctypes.byref(handle)) != NVML_SUCCESS:
+                continue
+            self._handles.append(handle)
+            self._names.append(self._string(self._lib.nvmlDeviceGetName, handle) or f"NVIDIA GPU {index}")
+            self._uuids.append(self._string(self._lib.nvmlDeviceGetUUID, handle) or "")
+        self._ready = True
+        return True
+
+    @staticmethod
+    def _string(func, handle) -> Optional[str]:
+        import ctypes
+        buf = ctypes.create_string_buffer(96)
+        if func(handle, buf, ctypes.c_uint(len(buf))) != NVML_SUCCESS:
+            return None
+        return buf.value.decode("utf-8", "replace")
+
+    def _uint(self, func, handle, *args) -> Optional[int]:
+        import ctypes
+        value = ctypes.c_uint(0)
+        ret = func(handle, *args, ctypes.byref(value))
+        if ret == NVML_ERROR_GPU_IS_LOST:
+            self._ready = False
+        return value.value if ret == NVML_SUCCESS else None
+
+    def _ecc(self, handle, error_type: int) -> Optional[int]:
+        import ctypes
+        value = ctypes.c_ulonglong(0)
+        ret = self._lib.nvmlDeviceGetTotalEccErrors(handle, ctypes.c_int(error_type),
+                                                    ctypes.c_int(NVML_AGGREGATE_ECC), ctypes.byref(value))
+        return value.value if ret == NVML_SUCCESS else None
+
+    def read(self) -> Optional[List[dict]]:
+        # None — NVML недоступен (не загрузился, GPU потерян): вызывающий переходит на запасной путь
+        import ctypes
+
+        class Utilization(ctypes.Structure):
+            _fields_ = [("gpu", ctypes.c_uint), ("memory", ctypes.c_uint)]
+
+        class Memory(ctypes.Structure):
+            _fields_ = [("total", ctypes.c_ulonglong), ("free", ctypes.c_ulonglong), ("used", ctypes.c_ulonglong)]
+
+        if not self._ready and not self.open():
+            return None
+        lib = self._lib
+        rows = []
+        for index, handle in enumerate(self._handles):
+            util, mem = Utilization(), Memory()
+            has_util = lib.nvmlDeviceGetUtilizationRates(handle, ctypes.byref(util)) == NVML_SUCCESS
+            has_mem = lib.nvmlDeviceGetMemoryInfo(handle, ctypes.byref(mem)) == NVML_SUCCESS
+            power = self._uint(lib.nvmlDeviceGetPowerUsage, handle)
+            limit = self._uint(lib.nvmlDeviceGetEnforcedPowerLimit, handle)
+            temperature = self._uint(lib.nvmlDeviceGetTemperature, handle, ctypes.c_int(NVML_TEMPERATURE_GPU))
+            rows.append({
+                "index": index,
+                "name": self._names[index],
+                "uuid": self._uuids[index],
+                "vendor": "nvidia",
+                # Не прочиталось — None, а не 0: ноль мастер подставит сам (?? 0), а «нет данных» не выдаётся за простой
+                "utilization": float(util.gpu) if has_util else None,
+                "memory_utilization": float(util.memory) if has_util else None,
+                # МиБ, как у nvidia-smi --format=nounits (так хранит мастер)
+                "memory_used": mem.used // MIB if has_mem else None,
+                "memory_total": mem.total // MIB if has_mem else None,
+                "temperature": float(temperature) if temperature is not None else None,
+                "power_watts": round(power / 1000.0, 1) if power is not None else None,
+                "power_limit_watts": round(limit / 1000.0, 1) if limit is not None else None,
+                "clock_graphics_mhz": self._uint(lib.nvmlDeviceGetClockInfo, handle, ctypes.c_int(NVML_CLOCK_GRAPHICS)),
+                "clock_sm_mhz": self._uint(lib.nvmlDeviceGetClockInfo, handle, ctypes.c_int(NVML_CLOCK_SM)),
+                "clock_memory_mhz": self._uint(lib.nvmlDeviceGetClockInfo, handle, ctypes.c_int(NVML_CLOCK_MEM)),
+                "ecc_corrected": self._ecc(handle, NVML_MEMORY_ERROR_CORRECTED),
+                "ecc_uncorrected": self._ecc(handle, NVML_MEMORY_ERROR_UNCORRECTED),
+                "fan_percent": self._uint(lib.nvmlDeviceGetFanSpeed, handle),
+            })
+        if not self._ready:
+            # GPU отвалился посреди чтения (Xid 79 и т.п.) — переинициализация на следующем сборе
+            self._ready = True
+            self.close()
+            return None
+        return rows
+
+    def _running(self, handle, name: str) -> Dict[int, int]:
+        # {pid: байты видеопамяти} из nvmlDeviceGet{Compute,Graphics}RunningProcesses (_v3, у старых драйверов _v2)
+        import ctypes
+
+        class ProcessInfo(ctypes.Structure):
+            _fields_ = [("pid", ctypes.c_uint), ("usedGpuMemory", ctypes.c_ulonglong),
+                        ("gpuInstanceId", ctypes.c_uint), ("computeInstanceId", ctypes.c_uint)]
+
+        func = getattr(self._lib, f"nvmlDeviceGet{name}RunningProcesses_v3", None) or \
+            getattr(self._lib, f"nvmlDeviceGet{name}RunningProcesses_v2", None)
+        if func is None:
+            return {}
+        count = ctypes.c_uint(0)
+        ret = func(handle, ctypes.byref(count), None)
+        if ret == NVML_SUCCESS or ret != NVML_ERROR_INSUFFICIENT_SIZE:
+            return {}
+        # Запас: между двумя вызовами могли стартовать новые процессы
+        count = ctypes.c_uint(count.value + 8)
+        infos = (ProcessInfo * count.value)()
+        if func(handle, ctypes.byref(count), infos) != NVML_SUCCESS:
+            return {}
+        out = {}
+        for info in infos[:count.value]:
+            # NOT_AVAILABLE — драйвер без прав видеть память чужих процессов (Windows WDDM, MIG)
+            used = info.usedGpuMemory if info.usedGpuMemory != NVML_VALUE_NOT_AVAILABLE else 0
+            out[info.pid] = max(out.get(info.pid, 0), used)
+        return out
+
+    def _utilization(self, index: int, handle) -> Dict[int, float]:
+        # {pid: % SM} — среднее по сэмплам драйвера с прошлого вызова; у карт без поддержки — пусто
+        import ctypes
+
+        class Sample(ctypes.Structure):
+            _fields_ = [("pid", ctypes.c_uint), ("timeStamp", ctypes.c_ulonglong), ("smUtil", ctypes.c_uint),
+                        ("memUtil", ctypes.c_uint), ("encUtil", ctypes.c_uint), ("decUtil", ctypes.c_uint)]
+
+        func = getattr(self._lib, "nvmlDeviceGetProcessUtilization", None)
+        if func is None:
+            return {}
+        since = ctypes.c_ulonglong(self._util_seen.get(index, 0))
+        count = ctypes.c_uint(0)
+        if func(handle, None, ctypes.byref(count), since) != NVML_ERROR_INSUFFICIENT_SIZE or not count.value:
+            return {}
+        samples = (Sample * count.value)()
+        if func(handle, samples, ctypes.byref(count), since) != NVML_SUCCESS:
+            return {}
+        sums: Dict[int, List[int]] = {}
+        for sample in samples[:count.value]:
+            sums.setdefault(sample.pid, []).append(sample.smUtil)
+            self._util_seen[index] = max(self._util_seen.get(index, 0), sample.timeStamp)
+        return {pid: round(sum(values) / len(values), 1) for pid, values in sums.items()}
+
+    def processes(self) -> Optional[Dict[int, dict]]:
+        # {pid: {gpu_memory (байты), gpu_util (% SM или None), gpus: [индексы]}}; память и загрузка
+        # процесса на нескольких картах суммируются
+        if not self._ready and not self.open():
+            return None
+        out: Dict[int, dict] = {}
+        for index, handle in enumerate(self._handles):
+            used = self._running(handle, "Compute")
+            for pid, value in self._running(handle, "Graphics").items():
+                used[pid] = max(used.get(pid, 0), value)
+            util = self._utilization(index, handle)
+            for pid in set(used) | set(util):
+                row = out.setdefault(pid, {"gpu_memory": 0, "gpu_util": None, "gpus": []})
+                row["gpu_memory"] += used.get(pid, 0)
+                if pid in util:
+                    row["gpu_util"] = round((row["gpu_util"] or 0.0) + util[pid], 1)
+                row["gpus"].append(index)
+        return out
+
+    def close(self) -> None:
+        if self._lib is not None and self._ready:
+            try:
+                self._lib.nvmlShutdown()
+            except Exception:
+                pass
+        self._ready = False
+        self._handles = []
+
+
+class SmiStream:
+    # Один процесс nvidia-smi --loop-ms: драйвер инициализируется один раз, строки CSV идут потоком,
+    # фоновый поток держит последнюю по каждому GPU. Упавший процесс перезапускается не чаще раза в минуту;
+    # строки старше трёх периодов не отдаются — зависший nvidia-smi не выдаёт старые цифры за текущие.
+    name = "smi-loop"
+
+    def __init__(self, loop_ms: int = 5000, binary: str = "nvidia-smi", popen: Callable = subprocess.Popen,
+                 log: Callable[[str], None] = print):
+        self.loop_ms = max(100, int(loop_ms))
+        self.binary = binary
+        self.popen = popen
+        self.log = log
+        self._proc = None
+        self._latest: Dict[int, tuple] = {}
+        self._lock = Lock()
+        self._started_at = 0.0
+
+    def open(self) -> bool:
+        if self._proc is not None and self._proc.poll() is None:
+            return True
+        if time.monotonic() - self._started_at < 60 and self._started_at:
+            return False
+        self._started_at = time.monotonic()
+        try:
+            self._proc = self.popen(
+                [self.binary, "--query-gpu=" + ",".join(field for _, field in SMI_FIELDS),
+                 "--format=csv,noheader,nounits", f"--loop-ms={self.loop_ms}"],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, text=True, bufsize=1,
+            )
+        except (FileNotFoundError, PermissionError):
+            return False
+        Thread(target=self._pump, args=(self._proc,), name="nvidia-smi", daemon=True).start()
+        return True
+
+    def _pump(self, proc) -> None:
+        for line in proc.stdout:
+            parts = [p.strip() for p in line.rstrip("\n").split(",")]
+            if len(parts) < len(SMI_FIELDS):
+                continue
+            # В имени GPU запятых не бывает, но поля с конца считаем надёжнее
+            head = len(parts) - len(SMI_FIELDS)
+            if head:
+                parts = [parts[0], ",".join(parts[1:2 + head])] + parts[2 + head:]
+            row = {key: _smi_value(key, raw) for (key, _), raw in zip(SMI_FIELDS, parts)}
+            if row["index"] is None:
+                continue
+            row["vendor"] = "nvidia"
+            with self._lock:
+                self._latest[row["index"]] = (time.monotonic(), row)
+        code = proc.wait()
+        self.log(f"gpu: nvidia-smi stream exited with code {code}")
+
+    def read(self) -> Optional[List[dict]]:
+        if not self.open():
+            return None
+        fresh = time.monotonic() - 3 * self.loop_ms / 1000.0
+        with self._lock:
+            return [dict(row) for _, (at, row) in sorted(self._latest.items()) if at >= fresh]
+
+    def close(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+        self._proc = None
+
+
+def smi_processes(binary: str = "nvidia-smi", uuids: Optional[Dict[str, int]] = None,
+                  run: Callable = subprocess.run) -> Optional[Dict[int, dict]]:
+    # Разовый nvidia-smi --query-compute-apps: только память (загрузку по процессам он не даёт).
+    # uuids — {uuid: индекс GPU} из последнего снимка карт; None — nvidia-smi нет или он упал
+    try:
+        result = run([binary, "--query-compute-apps=pid,used_memory,gpu_uuid", "--format=csv,noheader,nounits"],
+                     capture_output=True, text=True, timeout=5)
+    except (FileNotFoundError, PermissionError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+    out: Dict[int, dict] = {}
+    for line in (result.stdout or "").splitlines():
+        parts = [p.strip() for p in line.split(",")]
+        if len(parts) < 3 or not parts[0].isdigit():
+            continue
+        row = out.setdefault(int(parts[0]), {"gpu_memory": 0, "gpu_util": None, "gpus": []})
+        row["gpu_memory"] += (_smi_value("memory_used", parts[1]) or 0) * MIB
+        index = (uuids or {}).get(parts[2])
+        if index is not None:
+            row["gpus"].append(index)
+    return out
+
+
+class GpuTelemetry:
+    # mode: auto — NVML, без библиотеки — поток nvidia-smi (если он есть); nvml / smi-loop — только он;
+    # exec — ничего постоянного, вызывающий запускает nvidia-smi/rocm-smi на каждый сбор, как раньше.
+    # collect() -> None означает «постоянного источника нет», [] — источник есть, GPU нет.
+    def __init__(self, mode: str = "auto", loop_ms: int = 5000, log: Callable[[str], None] = print,
+                 apps_interval: float = 300.0):
+        self.mode = (mode or "auto").lower()
+        self.loop_ms = loop_ms
+        self.log = log
+        self.apps_interval = max(1.0, float(apps_interval))
+        self.backend = None
+        self._chosen = False
+        self._smi: Optional[str] = None
+        self._processes: Optional[tuple] = None
+
+    def _choose(self) -> None:
+        self._chosen = True
+        self._smi = shutil.which("nvidia-smi")
+        if self.mode in ("auto", "nvml"):
+            nvml = NvmlBackend()
+            try:
+                if nvml.open():
+                    self.backend = nvml
+            except Exception as e:
+                self.log(f"gpu: NVML init failed: {e}")
+        if self.backend is None and self.mode in ("auto", "smi-loop") and self._smi:
+            self.backend = SmiStream(self.loop_ms, log=self.log)
+        if self.backend is not None:
+            self.log(f"gpu: using {self.backend.name} backend")
+
+    def collect(self) -> Optional[List[dict]]:
+        if not self._chosen:
+            self._choose()
+        if self.backend is None:
+            return None
+        try:
+            return self.backend.read()
+        except Exception as e:
+            self.log(f"gpu: {self.backend.name} read failed: {e}")
+            return None
+
+    def processes(self, max_age: float = 2.0) -> Dict[int, dict]:
+        # Процессы на GPU: {pid: {gpu_memory, gpu_util, gpus}}. С NVML — кэш на max_age секунд: сборщики
+        # процессов и контейнеров одного цикла делят одно чтение. Без NVML — разовый nvidia-smi (только память),
+        # и не чаще apps_interval: иначе вернулся бы запуск драйвера на каждый сбор, от которого уходит NVML/поток
+        if not self._chosen:
+            self._choose()
+        nvml = isinstance(self.backend, NvmlBackend)
+        now = time.monotonic()
+        if self._processes is not None and now - self._processes[0] < (max_age if nvml else self.apps_interval):
+            return self._processes[1]
+        result = None
+        try:
+            if nvml:
+                result = self.backend.processes()
+            elif self._smi:
+                rows = self.backend.read() if self.backend is not None else None
+                # Поток nvidia-smi работает и карт не видит — спрашивать про процессы незачем
+                if rows is None or rows:
+                    result = smi_processes(self._smi, {row.get("uuid"): row["index"] for row in rows or []})
+        except Exception as e:
+            self.log(f"gpu: per-process read failed: {e}")
+        self._processes = (now, result or {})
+        return self._processes[1]
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
@@ -2,23 +2,49 @@
 import time  # таймеры
 import psutil  # системные метрики
 import requests  # HTTP-запросы
+import requests.adapters  # пул соединений
 import json  # JSON
+import gzip  # сжатие тел запросов
 import subprocess  # внешние команды
 import os  # окружение
 import pathlib  # пути
 import shutil  # утилиты для проверки бинарей
 import re  # разбор SSH-логов
+import random  # разброс повторного long-poll
 import socket  # IP шлюза из /proc/net/route
 import struct  # разбор little-endian gateway
 from datetime import datetime  # время
-from http.server import BaseHTTPRequestHandler, HTTPServer  # health-check сервер
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as futures_wait  # пул коллекторов
 from threading import Thread, Lock  # фоновый поток
+from functools import lru_cache  # кэш классификации интерфейсов
 from typing import Optional  # типы
 
 try:
-    from . import upnp as upnp_mod
+    from .scheduler import Scheduler, interval_from_env
+    from .delta import DeltaTracker, section_trackers
+    from .spool import Spool
+    from .retry import Backoff, Breakers, CircuitBreaker, RetryQueue
+    from .commands import CommandExecutor, cancelled as command_cancelled, command_kind, run as job_run
+    from .telemetry import SIZE_BUCKETS, TELEMETRY
+    from .sampler import Sampler
+    from .procfs import ProcFS, available as procfs_available
+    from .fsusage import FsUsage
+    from .netrates import InterfaceRates
+    from .cgroups import CgroupReader, container_of
+    from .gpu import GpuTelemetry
 except ImportError:
-    import upnp as upnp_mod
+    from scheduler import Scheduler, interval_from_env
+    from delta import DeltaTracker, section_trackers
+    from spool import Spool
+    from retry import Backoff, Breakers, CircuitBreaker, RetryQueue
+    from commands import CommandExecutor, cancelled as command_cancelled, command_kind, run as job_run
+    from telemetry import SIZE_BUCKETS, TELEMETRY
+    from sampler import Sampler
+    from procfs import ProcFS, available as procfs_available
+    from fsusage import FsUsage
+    from netrates import InterfaceRates
+    from cgroups import CgroupReader, container_of
+    from gpu import GpuTelemetry
 
 
 def load_node_conf(path: str = "node.conf") -> None:
@@ -97,38 +123,219 @@ def _log(msg: str) -> None:
     print(f"[agent] {datetime.now().isoformat()} {msg}")
 
 
-def _request_with_retry(method: str, url: str, **kwargs) -> Optional[requests.Response]:
-    # HTTP-запрос с повторами и задержкой
+_session = None
+_session_lock = Lock()
+
+
+def _http_session() -> requests.Session:
+    # Одна keep-alive сессия на все запросы к мастеру: TCP+TLS рукопожатие делается один раз
+    # на соединение пула, verify вычисляется один раз. Пул рассчитан на все потоки агента.
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = max(1, int(os.getenv("COLLECTOR_WORKERS", "4"))) + 4
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=pool_size,
+                max_retries=0,
+            )
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.verify = _get_verify()
+            session.headers["Connection"] = "keep-alive"
+            _session = session
+        return _session
+
+
+_compress_enabled = os.getenv("COMPRESS_ENABLED", "true").lower() == "true"
+
+
+def _encode_body(kwargs: dict) -> bool:
+    # json=... сериализуем сами и при размере выше COMPRESS_MIN_BYTES сжимаем gzip
+    # (Content-Encoding: gzip). Списки процессов, снимки Docker и пачки логов жмутся в 5-10 раз.
+    if "json" not in kwargs:
+        return False
+    raw = json.dumps(kwargs.pop("json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = dict(kwargs.get("headers") or {})
+    headers["Content-Type"] = "application/json"
+    compressed = False
+    if _compress_enabled and len(raw) >= int(os.getenv("COMPRESS_MIN_BYTES", "1024")):
+        raw = gzip.compress(raw, compresslevel=int(os.getenv("COMPRESS_LEVEL", "6")))
+        headers["Content-Encoding"] = "gzip"
+        compressed = True
+    kwargs["data"] = raw
+    kwargs["headers"] = headers
+    return compressed
+
+
+TELEMETRY.histogram("collector_duration_seconds", "Collector run time")
+TELEMETRY.counter("collector_runs_total", "Collector runs")
+TELEMETRY.counter("collector_failures_total", "Collector runs that raised")
+TELEMETRY.counter("collector_timeouts_total", "Collector runs that exceeded their timeout")
+TELEMETRY.counter("collector_skipped_total", "Collector slots skipped because the previous run was still going")
+TELEMETRY.histogram("serialize_seconds", "Request body JSON encoding and compression time")
+TELEMETRY.histogram("request_body_bytes", "Request body size on the wire", SIZE_BUCKETS)
+TELEMETRY.counter("request_bytes_sent_total", "Request body bytes sent")
+TELEMETRY.histogram("request_duration_seconds", "Master request latency")
+TELEMETRY.counter("requests_total", "Master requests by response code")
+TELEMETRY.counter("request_failures_total", "Master requests without a usable response (network error, 502/503/504)")
+TELEMETRY.counter("request_retries_total", "Deferred requests re-sent by the retry queue")
+TELEMETRY.counter("breaker_rejections_total", "Requests rejected while the endpoint circuit was open")
+
+
+def _endpoint(url: str, params=None) -> str:
+    # Метка эндпоинта: путь + action (nodes.php?action=heartbeat и get-command — разные эндпоинты)
+    parts = requests.utils.urlparse(url)
+    action = (params or {}).get("action") if isinstance(params, dict) else None
+    if not action and parts.query:
+        action = dict(p.split("=", 1) for p in parts.query.split("&") if "=" in p).get("action")
+    return parts.path + (f"?action={action}" if action else "")
+
+
+_breakers = Breakers(lambda: CircuitBreaker(
+    threshold=int(os.getenv("BREAKER_THRESHOLD", "3")),
+    backoff=Backoff(float(os.getenv("RETRY_DELAY", "5")), float(os.getenv("BREAKER_MAX_OPEN", "120"))),
+))
+_retry_queue = None
+_retry_queue_lock = Lock()
+
+
+def _deferred_retries() -> RetryQueue:
+    # Очередь фоновых повторов создаётся при первой неудаче; поток стартует вместе с ней
+    global _retry_queue
+    with _retry_queue_lock:
+        if _retry_queue is None:
+            _retry_queue = RetryQueue(
+                _resend,
+                Backoff(float(os.getenv("RETRY_DELAY", "5")), float(os.getenv("RETRY_MAX_DELAY", "300"))),
+                max_attempts=int(os.getenv("DEFERRED_MAX_RETRIES", "12")),
+                max_items=int(os.getenv("RETRY_QUEUE_MAX", "500")),
+                log=_log,
+                hold=_resend_hold,
+            )
+        return _retry_queue
+
+
+def _resend_hold(item) -> float:
+    # Пока цепь эндпоинта открыта (или идёт пробный запрос half-open), повтор ждёт без расхода попытки
+    breaker = _breakers.get(item[1])
+    if breaker.state == CircuitBreaker.HALF_OPEN:
+        return 1.0
+    return breaker.retry_in()
+
+
+def _resend(item) -> bool:
+    method, url, kwargs = item
+    TELEMETRY.inc("request_retries_total", endpoint=_endpoint(url, kwargs.get("params")))
+    resp = _request_with_retry(method, url, **dict(kwargs))
+    return resp is not None and resp.status_code < 500
+
+
+def _retryable(resp: Optional[requests.Response]) -> bool:
+    # Стоит ли повторять запрос позже: нет ответа, ошибка мастера (5xx), авторизация (401/403 — токен
+    # могут поправить), таймаут или лимит (408/429). Прочие 4xx — мастер отверг само содержимое
+    return resp is None or resp.status_code >= 500 or resp.status_code in (401, 403, 408, 429)
+
+
+def _request_with_retry(method: str, url: str, defer: bool = False, **kwargs) -> Optional[requests.Response]:
+    # HTTP-запрос через общую сессию: одна попытка, без сна в вызывающем потоке.
+    # Пока circuit breaker эндпоинта открыт, запрос сразу возвращает None. defer=True — разовый
+    # запрос (результат команды, отчёт), который при неудаче уходит в фоновую очередь повторов
+    # с экспоненциальной паузой; периодические отправки просто повторятся в следующем цикле.
+    global _compress_enabled
     timeout = kwargs.pop("timeout", 10)
-    max_retries = int(os.getenv("MAX_RETRIES", "3"))
-    retry_delay = int(os.getenv("RETRY_DELAY", "5"))
-    for attempt in range(1, max_retries + 1):
+    plain = dict(kwargs)
+    endpoint = _endpoint(url, kwargs.get("params"))
+    breaker = _breakers.get(url)
+    if not breaker.allow():
+        TELEMETRY.inc("breaker_rejections_total", endpoint=endpoint)
+        if defer:
+            _deferred_retries().put((method, url, dict(plain, timeout=timeout)))
+        return None
+    started = time.monotonic()
+    compressed = _encode_body(kwargs)
+    if "data" in kwargs:
+        TELEMETRY.observe("serialize_seconds", time.monotonic() - started, endpoint=endpoint)
+        TELEMETRY.observe("request_body_bytes", len(kwargs["data"]), endpoint=endpoint)
+        TELEMETRY.inc("request_bytes_sent_total", len(kwargs["data"]), endpoint=endpoint)
+    started = time.monotonic()
+    try:
+        resp = _http_session().request(method, url, timeout=timeout, **kwargs)
+        if compressed and resp.status_code in (400, 415):
+            # Мастер, не понимающий Content-Encoding, видит мусор вместо JSON: шлём без сжатия,
+            # и если так проходит — больше не сжимаем
+            retry = _http_session().request(method, url, timeout=timeout, **plain)
+            if retry.status_code < 400:
+                _log(f"Master rejected gzip body ({resp.status_code}), request compression disabled")
+                _compress_enabled = False
+            resp = retry
+    except Exception as e:
+        _log(f"request error {method} {url}: {e}")
+        resp = None
+    TELEMETRY.observe("request_duration_seconds", time.monotonic() - started, endpoint=endpoint)
+    TELEMETRY.inc("requests_total", endpoint=endpoint, code=resp.status_code if resp is not None else "error")
+    if resp is not None and resp.status_code not in (502, 503, 504):
+        breaker.success()
+        return resp
+    TELEMETRY.inc("request_failures_total", endpoint=endpoint)
+    # Сеть или прокси перед мастером (502/503/504) — считаем мастер недоступным
+    was_open = breaker.state != CircuitBreaker.CLOSED
+    breaker.failure()
+    if breaker.state == CircuitBreaker.OPEN and not was_open:
+        _log(f"circuit open for {_breakers.key(url)}, next probe in {breaker.retry_in():.0f}s")
+    if defer:
+        _deferred_retries().put((method, url, dict(plain, timeout=timeout)))
+    return resp
+
+
+_upnp_mod = None
+
+
+def _upnp():
+    # UPnP тянет xml.etree, urllib.request, snmp_if и net_ident — грузим при первом обращении,
+    # а не при старте агента: на нодах без UPnP модуль не импортируется вовсе
+    global _upnp_mod
+    if _upnp_mod is None:
         try:
-            resp = requests.request(method, url, timeout=timeout, **kwargs)
-            return resp
-        except Exception as e:
-            _log(f"request error ({attempt}/{max_retries}) {method} {url}: {e}")
-            if attempt == max_retries:
-                return None
-            time.sleep(retry_delay)
-    return None
-
+            from . import upnp as module
+        except ImportError:
+            import upnp as module
+        _upnp_mod = module
+    return _upnp_mod
+
+
+def _health_handler():
+    # http.server нужен только при HEALTH_PORT > 0 — импорт и класс обработчика создаются по требованию
+    from http.server import BaseHTTPRequestHandler
+
+    class _HealthHandler(BaseHTTPRequestHandler):
+        # HTTP handler для health-check; /metrics — самонаблюдение в формате Prometheus, /debug/vars — то же в JSON
+        def do_GET(self):  # обработка GET
+            path = self.path.split("?", 1)[0]
+            if path == "/health":
+                self._reply(b'{"status":"ok"}', "application/json")
+            elif path == "/metrics":
+                self._reply(TELEMETRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            elif path == "/debug/vars":
+                body = json.dumps(TELEMETRY.snapshot(), ensure_ascii=False, indent=1, default=str)
+                self._reply(body.encode("utf-8"), "application/json")
+            else:
+                self.send_response(404)
+                self.end_headers()
 
-class _HealthHandler(BaseHTTPRequestHandler):
-    # HTTP handler для health-check
-    def do_GET(self):  # обработка GET
-        if self.path != "/health":
-            self.send_response(404)
+        def _reply(self, body: bytes, content_type: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
             self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Отключаем стандартный лог http.server
             return
-        self.send_response(200)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(b'{"status":"ok"}')
 
-    def log_message(self, format, *args):
-        # Отключаем стандартный лог http.server
-        return
+    return _HealthHandler
 
 
 def start_health_server(port: Optional[int] = None) -> None:
@@ -137,7 +344,8 @@ def start_health_server(port: Optional[int] = None) -> None:
         port = int(os.getenv("HEALTH_PORT", "0"))
     if port <= 0:
         return
-    server = HTTPServer(("0.0.0.0", port), _HealthHandler)
+    from http.server import HTTPServer
+    server = HTTPServer(("0.0.0.0", port), _health_handler())
 
     def _run():
         _log(f"health-check server started on 0.0.0.0:{port}")
@@ -155,14 +363,89 @@ class MonitoringAgent:
         self.node_name = node_name
         self.node_token = node_token
         self.headers = {"Authorization": f"Bearer {node_token}", "Content-Type": "application/json"}
-        # Храним предыдущие значения для расчета расхода трафика
-        self.last_network_in = 0
-        self.last_network_out = 0
-        self.first_network_read = True
+        # Трафик по интерфейсам — по приращениям счётчиков каждого интерфейса. У сбора и у сэмплера
+        # свои предыдущие значения: они читают /proc/net/dev в разные моменты
+        self._net_rates = InterfaceRates()
+        self._sample_net_rates = InterfaceRates()
+        # Счётчики хоста читаются прямо из /proc (PROCFS_FAST=false или не Linux — через psutil)
+        self._proc = ProcFS() if os.getenv("PROCFS_FAST", "true").lower() == "true" and procfs_available() else None
+        # Снимок накопленных времён CPU: загрузка считается по приращению к следующему сбору
+        self._cpu_times = self._read_cpu_times()
+        self._cpu_times_at = time.monotonic()
+        # Снимок /proc/diskstats по дискам: скорость, IOPS, await и util считаются по приращению к следующему сбору
+        self._disk_io = self._read_disk_io()
+        self._disk_io_at = time.monotonic()
+        # Счётчики планировщика и PSI: скорости ctxt/intr и доля stall — по приращению к следующему сбору
+        self._sched = self._read_sched()
+        self._sched_at = time.monotonic()
+        # Частые выборки между сборами (SAMPLE_INTERVAL секунд, 0 — выключено): в metrics уходят
+        # агрегаты за интервал, и пики короче COLLECT_INTERVAL не теряются
+        self._sampler = None
+        sample_interval = float(os.getenv("SAMPLE_INTERVAL", "5") or 0)
+        if sample_interval > 0:
+            self._sampler = Sampler(
+                self._sample_counters,
+                period=sample_interval,
+                capacity=int(os.getenv("SAMPLE_CAPACITY", "720")),
+                log=_log,
+            )
+        # Заполненность всех реальных ФС: statvfs локальных не чаще FS_USAGE_INTERVAL, сетевых (NFS/CIFS/fuse) —
+        # не чаще FS_NETWORK_INTERVAL и только в фоновом потоке; не ответившая за FS_NETWORK_TIMEOUT помечается stale
+        self._fs = FsUsage(
+            interval=float(os.getenv("FS_USAGE_INTERVAL", "30")),
+            network_interval=float(os.getenv("FS_NETWORK_INTERVAL", "300")),
+            timeout=float(os.getenv("FS_NETWORK_TIMEOUT", "5")),
+            log=_log,
+        )
+        # Ресурсы контейнеров — из cgroup v2 напрямую; на cgroup v1 (или CGROUP_STATS=false) — docker stats
+        self._cgroups = CgroupReader()
+        if os.getenv("CGROUP_STATS", "true").lower() != "true" or not self._cgroups.available():
+            self._cgroups = None
+        # GPU: NVML (или один поток nvidia-smi --loop-ms) вместо запуска nvidia-smi на каждый сбор;
+        # источник выбирается при первом сборе, GPU_BACKEND=exec — старый путь
+        self._gpu = GpuTelemetry(os.getenv("GPU_BACKEND", "auto"), int(os.getenv("GPU_LOOP_MS", "5000")), log=_log,
+                                 apps_interval=interval_from_env("GPU_APPS_INTERVAL", 300))
         self.upnp_devices = []
         self._upnp_lock = Lock()
         self._upnp_alive_at = 0.0
+        # Курсоры логов: в памяти двигаются при сборе, на диск пишутся только после подтверждения мастера.
+        # _cursor_seq — номер снимка курсоров, _cursor_committed — последний сохранённый
+        self._cursor_lock = Lock()
         self._log_cursors = self._load_log_cursors()
+        self._cursor_committed = int(self._log_cursors.pop("_seq", 0) or 0)
+        self._cursor_seq = self._cursor_committed
+        self._spool = self._open_spool()
+        # Исходящий конверт: секции, собранные коллекторами с последней выгрузки.
+        # Снимки (metrics, processes, ...) заменяются свежими, логи накапливаются.
+        self._outbox = {}
+        self._outbox_cursors = None  # (seq, курсоры) для логов, лежащих в конверте
+        self._outbox_lock = Lock()
+        self._outbox_fresh = False  # в конверт добавлено новое с последней выгрузки
+        self._envelope_enabled = os.getenv("ENVELOPE_ENABLED", "true").lower() == "true"
+        # Снимки containers/ports/interfaces/upnp в конверте идут дельтой к подтверждённой версии
+        self._delta = {}
+        if os.getenv("DELTA_ENABLED", "true").lower() == "true":
+            self._delta = section_trackers(
+                full_interval=interval_from_env("DELTA_FULL_INTERVAL", 600),
+                pct_tolerance=float(os.getenv("DELTA_PCT_TOLERANCE", "1.0")),
+                bytes_tolerance=float(os.getenv("DELTA_BYTES_TOLERANCE", str(16 * 1024 * 1024))),
+                rate_tolerance=float(os.getenv("DELTA_RATE_TOLERANCE", str(256 * 1024))),
+            )
+        # Фаза цикла для heartbeat: какие коллекторы работают, с какого момента, сколько длился прошлый цикл
+        self._phase_lock = Lock()
+        self._phase = "starting"
+        self._phase_since = time.monotonic()
+        self._cycle_started = None
+        self._last_cycle_seconds = None
+        self._last_command = None  # (команда, command_timestamp) последней принятой команды
+        self._command_retry_after = None  # секунды до нового long-poll, когда у мастера не было слота
+        self._commands = CommandExecutor(
+            self.handle_command,
+            self.report_command_status,
+            workers=int(os.getenv("COMMAND_WORKERS", "2")),
+            max_queue=int(os.getenv("COMMAND_QUEUE_MAX", "20")),
+            log=_log,
+        )
     
     @staticmethod
     def _gpu_num(value, as_int=False):
@@ -176,8 +459,16 @@ class MonitoringAgent:
         return int(number) if as_int else number
 
     def collect_gpu_info(self):
-        # NVIDIA nvidia-smi, иначе AMD rocm-smi. [N/A] не роняет весь снимок.
+        # Постоянный источник NVIDIA (NVML / поток nvidia-smi), иначе разовый nvidia-smi, иначе AMD rocm-smi.
+        # [N/A] не роняет весь снимок.
+        rows = self._gpu.collect()
+        if rows:
+            return rows
         gpu_info = []
+        if rows is not None and self._gpu.backend.name == 'nvml':
+            # NVML работает, но карт нет — разовый nvidia-smi ничего не добавит. Поток nvidia-smi, ещё не
+            # выдавший строк (или зависший), подменяется разовым запуском
+            return self._collect_amd_gpu(gpu_info)
         try:
             result = subprocess.run(
                 ['nvidia-smi', '--query-gpu=index,name,utilization.gpu,memory.used,memory.total,temperature.gpu',
@@ -205,6 +496,9 @@ class MonitoringAgent:
             pass
         except Exception as e:
             _log(f"Error collecting NVIDIA GPU info: {e}")
+        return self._collect_amd_gpu(gpu_info)
+
+    def _collect_amd_gpu(self, gpu_info):
         try:
             result = subprocess.run(
                 ['rocm-smi', '--showid', '--showtemp', '--showuse', '--showmemuse', '--csv'],
@@ -231,58 +525,50 @@ class MonitoringAgent:
             _log(f"Error collecting AMD GPU info: {e}")
         return gpu_info
 
-    def _physical_net_bytes(self):
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _net_iface_kind(name):
+        # 'phys' — физический NIC (и bond/vlan поверх), 'bridge' — мост, None — lo/veth/tun/tap
+        low = (name or '').lower()
+        if low == 'lo' or low.startswith('lo:') or low.startswith('veth') or low.startswith('tun') or low.startswith('tap'):
+            return None
+        if re.match(r'^(docker|br-|virbr|cni|flannel|calico|kube)', low):
+            return 'bridge'
+        return 'phys'
+
+    def _host_net_ifaces(self, pernic):
         # Хостовой трафик: физические NIC. Если их счётчики нулевые (только bridge) — берём bridge без veth/lo.
-        try:
-            pernic = psutil.net_io_counters(pernic=True) or {}
-        except Exception:
-            pernic = {}
-        phys_recv = phys_sent = 0
-        bridge_recv = bridge_sent = 0
-        for name, io in pernic.items():
-            recv = getattr(io, 'bytes_recv', 0) or 0
-            sent = getattr(io, 'bytes_sent', 0) or 0
-            low = (name or '').lower()
-            if low == 'lo' or low.startswith('lo:') or low.startswith('veth') or low.startswith('tun') or low.startswith('tap'):
-                continue
-            if re.match(r'^(docker|br-|virbr|cni|flannel|calico|kube)', low):
-                bridge_recv += recv
-                bridge_sent += sent
-                continue
-            phys_recv += recv
-            phys_sent += sent
-        if phys_recv or phys_sent:
-            return phys_recv, phys_sent
-        return bridge_recv, bridge_sent
-
-    def _disk_usage_main(self):
-        skip_fs = {'tmpfs', 'devtmpfs', 'overlay', 'squashfs', 'aufs', 'ramfs', 'proc', 'sysfs', 'cgroup', 'cgroup2', 'iso9660'}
-        skip_mp = ('/boot', '/dev', '/run', '/sys', '/proc', '/snap', '/var/lib/docker', '/var/lib/containers')
-        best = None
-        try:
-            parts = psutil.disk_partitions(all=False) or []
-        except Exception:
-            parts = []
-        for part in parts:
-            fstype = (part.fstype or '').lower()
-            mount = part.mountpoint or ''
-            if fstype in skip_fs:
-                continue
-            if any(mount == m or mount.startswith(m + '/') for m in skip_mp):
-                continue
+        phys = [name for name in pernic if self._net_iface_kind(name) == 'phys']
+        if any(getattr(pernic[name], 'bytes_recv', 0) or getattr(pernic[name], 'bytes_sent', 0) for name in phys):
+            return phys
+        return [name for name in pernic if self._net_iface_kind(name) == 'bridge']
+
+    def _physical_net_bytes(self, pernic=None):
+        pernic = self._net_counters() if pernic is None else pernic
+        names = self._host_net_ifaces(pernic)
+        return (
+            sum(getattr(pernic[name], 'bytes_recv', 0) or 0 for name in names),
+            sum(getattr(pernic[name], 'bytes_sent', 0) or 0 for name in names),
+        )
+
+    def _net_snapshot(self):
+        # (момент чтения по monotonic, счётчики по интерфейсам); из кэша ProcFS — одной парой со временем чтения
+        if self._proc is not None:
             try:
-                usage = psutil.disk_usage(mount)
-            except (OSError, PermissionError):
-                continue
-            if usage.total <= 0:
+                return self._proc.net_dev_at()
+            except (OSError, ValueError):
+                pass
+        return time.monotonic(), self._net_counters()
+
+    def _disk_usage_main(self, filesystems):
+        # «Главный» диск для disk_percent — самая большая локальная ФС вне /boot (все ФС уходят в filesystems)
+        best = None
+        for fs in filesystems:
+            mount = fs['mount']
+            if fs['network'] or not fs.get('total') or mount == '/boot' or mount.startswith('/boot/'):
                 continue
-            if best is None or usage.total > best['total']:
-                best = {
-                    'percent': usage.percent,
-                    'total': usage.total,
-                    'used': usage.used,
-                    'mount': mount,
-                }
+            if best is None or fs['total'] > best['total']:
+                best = {'percent': fs['percent'], 'total': fs['total'], 'used': fs['used'], 'mount': mount}
         if best:
             return best
         try:
@@ -291,37 +577,285 @@ class MonitoringAgent:
         except Exception:
             return {'percent': 0, 'total': 0, 'used': 0, 'mount': '/'}
 
-    def collect_metrics(self):
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        swap = psutil.swap_memory()
-        disk = self._disk_usage_main()
-        bytes_recv, bytes_sent = self._physical_net_bytes()
-        gpu_info = self.collect_gpu_info()
-        load1 = 0.0
+    def _read_cpu_times(self):
+        # (всего, по ядрам) — накопленные с загрузки времена CPU; None, если прочитать не удалось
+        if self._proc is not None:
+            try:
+                return self._proc.cpu_times()
+            except (OSError, ValueError):
+                pass
         try:
-            load1 = float(psutil.getloadavg()[0])
+            return psutil.cpu_times(), psutil.cpu_times(percpu=True)
+        except Exception:
+            return None
+
+    def _virtual_memory(self):
+        if self._proc is not None:
+            try:
+                return self._proc.virtual_memory()
+            except (OSError, ValueError):
+                pass
+        return psutil.virtual_memory()
+
+    def _swap_memory(self):
+        if self._proc is not None:
+            try:
+                return self._proc.swap_memory()
+            except (OSError, ValueError):
+                pass
+        return psutil.swap_memory()
+
+    def _loadavg(self):
+        # (1, 5, 15 минут) или None
+        if self._proc is not None:
+            try:
+                return self._proc.loadavg()
+            except (OSError, ValueError, IndexError):
+                pass
+        try:
+            return tuple(float(v) for v in os.getloadavg())
         except (AttributeError, OSError, ValueError):
-            pass
+            return None
 
-        network_in_diff = 0
-        network_out_diff = 0
-        if self.first_network_read:
-            self.last_network_in = bytes_recv
-            self.last_network_out = bytes_sent
-            self.first_network_read = False
-        else:
-            network_in_diff = max(0, bytes_recv - self.last_network_in)
-            network_out_diff = max(0, bytes_sent - self.last_network_out)
-            self.last_network_in = bytes_recv
-            self.last_network_out = bytes_sent
+    def _read_sched(self):
+        # Счётчики /proc/stat (ctxt, intr — накопленные, procs_running/blocked — текущие) и PSI;
+        # без /proc — только ctxt/intr из psutil, без PSI
+        stat = None
+        pressure = {}
+        if self._proc is not None:
+            try:
+                stat = self._proc.stat_counters()
+            except (OSError, ValueError):
+                stat = None
+            try:
+                pressure = self._proc.pressure()
+            except (OSError, ValueError):
+                pressure = {}
+        if stat is None:
+            try:
+                stats = psutil.cpu_stats()
+                stat = {'ctxt': stats.ctx_switches, 'intr': stats.interrupts}
+            except Exception:
+                stat = {}
+        return stat, pressure
+
+    def _sched_sample(self):
+        # Насыщение хоста за интервал с прошлого сбора: переключения контекста и прерывания в секунду,
+        # по PSI — avg10/60/300 от ядра и stall — доля интервала (%), когда задачи ждали CPU/память/диск
+        # (по приращению total, поэтому короткий всплеск между сборами не теряется)
+        stat, pressure = self._read_sched()
+        now = time.monotonic()
+        (prev_stat, prev_pressure), self._sched = self._sched, (stat, pressure)
+        elapsed, self._sched_at = now - self._sched_at, now
+        out = {key: stat[key] for key in ('procs_running', 'procs_blocked') if key in stat}
+        if elapsed >= 1.0:
+            for key in ('ctxt', 'intr'):
+                if key in stat and key in prev_stat and stat[key] >= prev_stat[key]:
+                    out[f'{key}_rate'] = round((stat[key] - prev_stat[key]) / elapsed, 1)
+        psi = {}
+        for resource, kinds in pressure.items():
+            for kind, values in kinds.items():
+                row = {'avg10': values['avg10'], 'avg60': values['avg60'], 'avg300': values['avg300']}
+                before = prev_pressure.get(resource, {}).get(kind)
+                if before is not None and elapsed >= 1.0 and values['total'] >= before['total']:
+                    # total — микросекунды
+                    row['stall'] = round(min(100.0, (values['total'] - before['total']) / (elapsed * 1e4)), 2)
+                psi.setdefault(resource, {})[kind] = row
+        if psi:
+            out['pressure'] = psi
+        return out
+
+    def _net_counters(self):
+        # {интерфейс: счётчики} — bytes_recv/bytes_sent и прочее, как psutil.net_io_counters(pernic=True)
+        if self._proc is not None:
+            try:
+                return self._proc.net_dev()
+            except (OSError, ValueError):
+                pass
+        try:
+            return psutil.net_io_counters(pernic=True) or {}
+        except Exception:
+            return {}
+
+    def _disk_counters(self):
+        # Суммарный ввод-вывод целых дисков (read_bytes/write_bytes) или None
+        if self._proc is not None:
+            try:
+                return self._proc.disk_totals()
+            except (OSError, ValueError):
+                pass
+        try:
+            return psutil.disk_io_counters()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _cpu_busy(prev, cur):
+        # Загрузка между двумя снимками cpu_times, % и разбивка по состояниям. iowait — простой
+        # (как в psutil.cpu_percent); guest/guest_nice уже входят в user/nice и в сумму не идут.
+        # Счётчик, ушедший назад (iowait на части ядер так умеет), даёт 0, а не отрицательную долю.
+        deltas = {}
+        for field in cur._fields:
+            if field in ('guest', 'guest_nice'):
+                continue
+            deltas[field] = max(0.0, getattr(cur, field) - (getattr(prev, field) if prev is not None else 0.0))
+        total = sum(deltas.values())
+        if total <= 0:
+            return None, {}
+        idle = deltas.get('idle', 0.0) + deltas.get('iowait', 0.0)
+        breakdown = {
+            field: round(100.0 * deltas[field] / total, 2)
+            for field in ('user', 'nice', 'system', 'iowait', 'irq', 'softirq', 'steal')
+            if field in deltas
+        }
+        return round(100.0 * (total - idle) / total, 1), breakdown
+
+    def _cpu_sample(self):
+        # Загрузка CPU за весь интервал с прошлого сбора, без sleep. Первый сбор сразу после старта
+        # (меньше секунды, считаные тики) даёт среднее с загрузки системы, а не шум одного тика.
+        cur = self._read_cpu_times()
+        now = time.monotonic()
+        prev, self._cpu_times = self._cpu_times, cur
+        covered, self._cpu_times_at = now - self._cpu_times_at, now
+        if cur is None:
+            return {"cpu_percent": 0.0}
+        total, cores = cur
+        if covered < 1.0:
+            prev = None
+        busy, breakdown = self._cpu_busy(prev[0] if prev else None, total)
+        if busy is None:
+            busy, breakdown = self._cpu_busy(None, total)
+            prev = None
+        prev_cores = prev[1] if prev and len(prev[1]) == len(cores) else [None] * len(cores)
+        per_core = []
+        for before, after in zip(prev_cores, cores):
+            value, _ = self._cpu_busy(before, after)
+            if value is None:
+                value, _ = self._cpu_busy(None, after)
+            per_core.append(value or 0.0)
+        return {
+            "cpu_percent": busy or 0.0,
+            "cpu_per_core": per_core,
+            "cpu_times": breakdown,
+            "cpu_interval": round(covered, 1) if prev else None,
+        }
+
+    def _read_disk_io(self):
+        # {диск: накопленные счётчики} — только целые устройства из /sys/block, без разделов, loop и ram
+        stats = disks = None
+        if self._proc is not None:
+            try:
+                stats, disks = self._proc.diskstats(), self._proc.block_devices()
+            except (OSError, ValueError):
+                stats = None
+        if stats is None:
+            try:
+                stats = psutil.disk_io_counters(perdisk=True) or {}
+            except Exception:
+                return {}
+            try:
+                disks = frozenset(os.listdir('/sys/block'))
+            except OSError:
+                disks = frozenset()
+        return {
+            name: io for name, io in stats.items()
+            if (not disks or name in disks) and not re.match(r'^(loop|ram|zram)\d', name)
+        }
+
+    def _disk_io_sample(self):
+        # По каждому диску за интервал с прошлого сбора: байт/с и операций/с на чтение и запись,
+        # await — среднее время операции (мс, чтение и запись вместе), util — доля времени с запросами в работе.
+        # Диск, появившийся только сейчас, и счётчики, ушедшие назад, пропускаются до следующего сбора.
+        cur = self._read_disk_io()
+        now = time.monotonic()
+        prev, self._disk_io = self._disk_io, cur
+        elapsed, self._disk_io_at = now - self._disk_io_at, now
+        if elapsed < 1.0:
+            return []
+        rows = []
+        for name in sorted(cur):
+            before, after = prev.get(name), cur[name]
+            if before is None:
+                continue
+            d = {
+                field: getattr(after, field, 0) - getattr(before, field, 0)
+                for field in ('read_bytes', 'write_bytes', 'read_count', 'write_count', 'read_time', 'write_time', 'busy_time')
+            }
+            if any(v < 0 for v in d.values()):
+                continue
+            ops = d['read_count'] + d['write_count']
+            rows.append({
+                'device': name,
+                'read_bps': round(d['read_bytes'] / elapsed, 1),
+                'write_bps': round(d['write_bytes'] / elapsed, 1),
+                'read_iops': round(d['read_count'] / elapsed, 2),
+                'write_iops': round(d['write_count'] / elapsed, 2),
+                'await_ms': round((d['read_time'] + d['write_time']) / ops, 2) if ops else 0.0,
+                # busy_time в мс; psutil вне Linux его не даёт
+                'util': round(min(100.0, d['busy_time'] / (elapsed * 10.0)), 1) if hasattr(after, 'busy_time') else None,
+            })
+        return rows
+
+    def _sample_counters(self):
+        # Одна выборка сэмплера: только дешёвые чтения /proc (stat, meminfo, net/dev, diskstats).
+        # cpu — занятые CPU-секунды * 100 / число ядер: скорость этого счётчика и есть загрузка в %
+        gauges, counters = {}, {}
+        cpu = self._read_cpu_times()
+        if cpu is not None:
+            times, cores = cpu
+            busy = sum(getattr(times, f) for f in times._fields if f not in ('idle', 'iowait', 'guest', 'guest_nice'))
+            counters["cpu"] = busy * 100.0 / (len(cores) or psutil.cpu_count() or 1)
+        gauges["memory"] = self._virtual_memory().percent
+        load = self._loadavg()
+        if load is not None:
+            gauges["load"] = load[0]
+        # Трафик — сразу скоростью (байт/с) по приращениям каждого интерфейса: сброс или появление
+        # интерфейса между выборками не даёт ни провала, ни всплеска
+        at, pernic = self._net_snapshot()
+        _, rates = self._sample_net_rates.update(pernic, at)
+        if rates:
+            host = [name for name in self._host_net_ifaces(pernic) if name in rates]
+            gauges["net_in"] = sum(rates[name]['rx_bps'] for name in host)
+            gauges["net_out"] = sum(rates[name]['tx_bps'] for name in host)
+        disk = self._disk_counters()
+        if disk is not None:
+            counters["disk_read"] = disk.read_bytes
+            counters["disk_write"] = disk.write_bytes
+        return gauges, counters
+
+    def collect_metrics(self):
+        cpu = self._cpu_sample()
+        memory = self._virtual_memory()
+        swap = self._swap_memory()
+        filesystems = self._fs.collect()
+        disk = self._disk_usage_main(filesystems)
+        net_at, pernic = self._net_snapshot()
+        bytes_recv, bytes_sent = self._physical_net_bytes(pernic)
+        net_elapsed, net_rates = self._net_rates.update(pernic, net_at)
+        disk_io = self._disk_io_sample()
+        gpu_info = self.collect_gpu_info()
+        load = self._loadavg() or (0.0, 0.0, 0.0)
+        sched = self._sched_sample()
+
+        # network_in/out — байты за интервал по хостовым интерфейсам, *_rate — байт/с по реальному времени между чтениями
+        host = [name for name in self._host_net_ifaces(pernic) if name in net_rates]
+        network_in_diff = sum(net_rates[name]['rx_bytes'] for name in host)
+        network_out_diff = sum(net_rates[name]['tx_bytes'] for name in host)
+        # По интерфейсам — всё, кроме lo/veth/tun/tap; счётчики за интервал и скорости в секунду
+        net_interfaces = {
+            name: row for name, row in sorted(net_rates.items())
+            if self._net_iface_kind(name) is not None
+        }
 
         metrics = {
             "node_name": self.node_name,
             "timestamp": datetime.now().isoformat(),
-            "cpu_percent": cpu_percent,
+            **cpu,
             "cpu_count": psutil.cpu_count() or 0,
-            "load_avg": round(load1, 2),
+            "load_avg": round(load[0], 2),
+            "load_avg5": round(load[1], 2),
+            "load_avg15": round(load[2], 2),
+            **sched,
             "memory_percent": memory.percent,
             "memory_total": memory.total,
             "memory_used": memory.used,
@@ -334,10 +868,27 @@ class MonitoringAgent:
             "network_out": network_out_diff,
             "network_in_total": bytes_recv,
             "network_out_total": bytes_sent,
+            "network_in_rate": round(network_in_diff / net_elapsed, 1) if net_elapsed > 0 else 0.0,
+            "network_out_rate": round(network_out_diff / net_elapsed, 1) if net_elapsed > 0 else 0.0,
+            "network_interval": round(net_elapsed, 1) if net_rates else None,
         }
+        if net_interfaces:
+            metrics['net_interfaces'] = dict(list(net_interfaces.items())[:64])
 
+        if filesystems:
+            metrics['filesystems'] = filesystems
+        if disk_io:
+            metrics['disk_io'] = disk_io
         if gpu_info:
             metrics['gpu'] = gpu_info
+        if self._sampler is not None:
+            samples = self._sampler.drain()
+            if 'cpu' in samples:
+                # Скорость по monotonic-часам и тикам ядра расходится на доли процента — не выше 100
+                samples['cpu'] = {k: min(100.0, v) for k, v in samples['cpu'].items()}
+            if samples:
+                # {серия: {min, max, avg, p95, last}}; net_*/disk_* — байт/с, cpu/memory — %
+                metrics['samples'] = dict(samples, period=self._sampler.period)
 
         return metrics
 
@@ -367,11 +918,31 @@ class MonitoringAgent:
             except Exception as e:
                 _log(f"Error collecting process: {e}")
         rows.sort(key=lambda r: (r['cpu_percent'], r['memory_percent']), reverse=True)
-        return rows[: max(1, int(limit))]
+        top = rows[: max(1, int(limit))]
+        # Процессы, держащие GPU, — в снимке всегда, даже вне топа по CPU, с памятью/загрузкой GPU и контейнером
+        gpu = self._gpu.processes()
+        if gpu:
+            by_pid = {row['pid']: row for row in rows}
+            shown = {row['pid'] for row in top}
+            for pid, usage in gpu.items():
+                row = by_pid.get(pid)
+                if row is None:
+                    continue
+                row.update(gpu_memory=usage['gpu_memory'], gpu_util=usage['gpu_util'], gpus=usage['gpus'],
+                           container_id=container_of(pid))
+                if pid not in shown:
+                    top.append(row)
+        return top
     
     def send_data(self, metrics, processes):
-        # Отправка данных на главный сервер
-        data = {"metrics": metrics, "processes": processes}
+        # Отправка метрик и процессов на главный сервер (обе секции подряд)
+        if not self.send_metrics(metrics):
+            return False
+        return self.send_processes(processes)
+
+    def send_metrics(self, metrics):
+        # True — принято, False — мастер отверг содержимое, None — мастер недоступен (повторить позже)
+        data = {"metrics": metrics}
         _log(f"Sending metrics to {self.master_url}/api/metrics.php")
         # Логируем наличие токена для отладки (без самого токена)
         token_info = f"Token present: {bool(self.node_token)}, length: {len(self.node_token) if self.node_token else 0}"
@@ -390,11 +961,10 @@ class MonitoringAgent:
             f"{self.master_url}/api/metrics.php",
             json=data,
             headers=self.headers,
-            verify=_get_verify(),
         )
-        if not resp or resp.status_code not in (200, 201):
-            _log(f"Failed to send metrics: status={resp.status_code if resp else 'no response'}")
-            return False
+        if resp is None or resp.status_code not in (200, 201):
+            _log(f"Failed to send metrics: status={resp.status_code if resp is not None else 'no response'}")
+            return None if _retryable(resp) else False
         # Проверяем содержимое ответа на наличие ошибки
         try:
             resp_data = resp.json()
@@ -407,12 +977,14 @@ class MonitoringAgent:
         except Exception as e:
             _log(f"Error parsing response: {e}")
         _log(f"Metrics sent successfully: status={resp.status_code}")
+        return True
+
+    def send_processes(self, processes):
         proc_resp = _request_with_retry(
             "POST",
             f"{self.master_url}/api/processes.php",
             json={"processes": processes},
             headers=self.headers,
-            verify=_get_verify(),
         )
         if not proc_resp or proc_resp.status_code not in (200, 201):
             _log(f"Failed to send processes: status={proc_resp.status_code if proc_resp else 'no response'}")
@@ -428,47 +1000,53 @@ class MonitoringAgent:
         _log(f"Processes sent successfully: status={proc_resp.status_code}")
         return True
     
-    def check_commands(self):
-        # Проверка команд от мастера (GET /api/nodes.php?action=get-command)
+    def check_commands(self, wait=0):
+        # Проверка команд от мастера (GET /api/nodes.php?action=get-command). wait > 0 — long-poll:
+        # мастер держит запрос до wait секунд, пока на ноду не поставят команду. Если свободного слота
+        # long-poll не было ("longpoll": false), retry_after мастера запоминается в _command_retry_after
+        self._command_retry_after = None
         url = f"{self.master_url}/api/nodes.php"
         params = {"id": self.node_name, "action": "get-command"}
-        _log(f"Checking for commands: GET {url}?id={self.node_name}&action=get-command")
+        if wait > 0:
+            params["wait"] = int(wait)
         
         resp = _request_with_retry(
             "GET",
             url,
             params=params,
             headers=self.headers,
-            verify=_get_verify(),
+            timeout=(5, wait + 10),
         )
         
         if not resp:
-            _log("No response from server when checking commands")
             return None
-            
-        _log(f"Command check response: status={resp.status_code}")
         
         if resp.status_code == 200:
             try:
                 data = resp.json()
-                _log(f"Command check response data: {data}")
             except Exception as e:
                 _log(f"bad JSON in get-command: {e}, response text: {resp.text[:200]}")
                 return None
             status = data.get('status')  # новый формат: status = ok / no-command
+            if data.get('longpoll') is False:
+                try:
+                    self._command_retry_after = max(1.0, float(data.get('retry_after') or 5))
+                except (TypeError, ValueError):
+                    self._command_retry_after = 5.0
             command = data.get('command')
             command_status = data.get('command_status')
             
-            _log(f"Command check parsed: status={status}, command={command}, command_status={command_status}")
-            
             if status not in (None, 'ok', 'no-command'):
                 _log(f"Unexpected status in command check: {status}")
                 return None
             if command and command_status == 'pending':
+                key = (command, data.get('command_timestamp'))
+                if key == self._last_command:
+                    # Отчёт running ещё не дошёл до мастера — ту же команду второй раз не выполняем
+                    return None
+                self._last_command = key
                 _log(f"Found pending command: {command}")
                 return command
-            else:
-                _log(f"No pending command found (command={command}, command_status={command_status})")
         else:
             _log(f"Command check failed: HTTP {resp.status_code}, response: {resp.text[:200]}")
         return None
@@ -531,7 +1109,7 @@ class MonitoringAgent:
         try:
             # Обновляем список пакетов (с таймаутом)
             _log("Updating package list...")
-            update_result = subprocess.run(
+            update_result = job_run(
                 ['apt-get', 'update'],
                 capture_output=True,
                 text=True,
@@ -544,7 +1122,7 @@ class MonitoringAgent:
             
             # Получаем список обновляемых пакетов через apt list --upgradable
             _log("Checking for upgradable packages...")
-            result = subprocess.run(
+            result = job_run(
                 ['apt', 'list', '--upgradable'],
                 capture_output=True,
                 text=True,
@@ -579,7 +1157,7 @@ class MonitoringAgent:
                                 # Получаем текущую версию из apt-cache
                                 current_version = 'Unknown'
                                 try:
-                                    cache_result = subprocess.run(
+                                    cache_result = job_run(
                                         ['apt-cache', 'show', pkg_name],
                                         capture_output=True,
                                         text=True,
@@ -597,7 +1175,7 @@ class MonitoringAgent:
                                 priority = 'normal'
                                 try:
                                     # Проверяем через apt-cache policy, есть ли security updates
-                                    policy_result = subprocess.run(
+                                    policy_result = job_run(
                                         ['apt-cache', 'policy', pkg_name],
                                         capture_output=True,
                                         text=True,
@@ -641,7 +1219,7 @@ class MonitoringAgent:
         
         try:
             _log(f"Running: apt-get install -y {package}")
-            result = subprocess.run(
+            result = job_run(
                 ['apt-get', 'install', '-y', package],
                 capture_output=True,
                 text=True,
@@ -663,7 +1241,7 @@ class MonitoringAgent:
                 # Получаем установленную версию пакета
                 try:
                     _log(f"Checking installed version with: dpkg-query -W -f=${{Version}} {package}")
-                    version_result = subprocess.run(
+                    version_result = job_run(
                         ['dpkg-query', '-W', '-f=${Version}', package],
                         capture_output=True,
                         text=True,
@@ -720,7 +1298,6 @@ class MonitoringAgent:
             f"{self.master_url}/api/updates.php?action=report",
             json=data,
             headers=self.headers,
-            verify=_get_verify(),
             timeout=30
         )
         
@@ -754,9 +1331,9 @@ class MonitoringAgent:
             resp = _request_with_retry(
                 "POST",
                 f"{self.master_url}/api/updates.php?action=result",
+                defer=True,
                 json=data,
                 headers=self.headers,
-                verify=_get_verify(),
                 timeout=30
             )
             
@@ -786,7 +1363,7 @@ class MonitoringAgent:
                     _log("BLOCKED: reboot command is disabled for safety. Set ALLOW_DANGEROUS_COMMANDS=true to enable.")
                     return False
                 _log("WARNING: Executing reboot command (dangerous operation)")
-                subprocess.run(['sudo', 'reboot'], check=False)
+                job_run(['sudo', 'reboot'], check=False)
                 return True
             elif command.startswith('shutdown'):
                 # Выключение системы - ОПАСНАЯ КОМАНДА
@@ -794,7 +1371,7 @@ class MonitoringAgent:
                     _log("BLOCKED: shutdown command is disabled for safety. Set ALLOW_DANGEROUS_COMMANDS=true to enable.")
                     return False
                 _log("WARNING: Executing shutdown command (dangerous operation)")
-                subprocess.run(['sudo', 'shutdown', '-h', 'now'], check=False)
+                job_run(['sudo', 'shutdown', '-h', 'now'], check=False)
                 return True
             elif command.startswith('kill'):
                 # Убить процесс
@@ -850,7 +1427,7 @@ class MonitoringAgent:
                     if not re.match(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$', container_id):
                         _log(f"ERROR: invalid container id: {container_id}")
                         return False
-                    subprocess.run(['docker', action, container_id], check=False)
+                    job_run(['docker', action, container_id], check=False)
                     return True
             elif command.startswith('check-updates'):
                 # Проверка обновлений
@@ -979,7 +1556,6 @@ class MonitoringAgent:
                                 'logs': process_logs
                             },
                             headers=self.headers,
-                            verify=_get_verify(),
                             timeout=30
                         )
                         if resp and resp.status_code in (200, 201):
@@ -1011,12 +1587,12 @@ class MonitoringAgent:
                         resp = _request_with_retry(
                             "POST",
                             f"{self.master_url}/api/processes.php?action=command-result",
+                            defer=True,
                             json={
                                 'command': command,
                                 'logs': []
                             },
                             headers=self.headers,
-                            verify=_get_verify(),
                             timeout=30
                         )
                         if resp:
@@ -1025,6 +1601,9 @@ class MonitoringAgent:
                     except Exception as e:
                         _log(f"Error sending empty result: {e}")
                     return True
+            elif command.startswith('profile'):
+                # profile [секунды] [интервал_мс] — сэмплирующий профайлер потоков агента
+                return self.run_profile(command)
             elif command.startswith('upnp'):
                 return self.handle_upnp_command(command)
             elif command.startswith('firewall'):
@@ -1059,7 +1638,7 @@ class MonitoringAgent:
                             elif action == "deny":
                                 ufw_cmd = ["sudo", "ufw", "deny", f"{port}/{proto}"]
                         if ufw_cmd:
-                            result = subprocess.run(ufw_cmd, capture_output=True, text=True, check=False)
+                            result = job_run(ufw_cmd, capture_output=True, text=True, check=False)
                             if result.returncode == 0:
                                 _log(f"ufw command succeeded: {action} {port}/{proto}")
                                 return True
@@ -1073,13 +1652,13 @@ class MonitoringAgent:
                         
                         if action == "allow":
                             # Добавляем правило ACCEPT (idempotent - проверяем существование)
-                            result1 = subprocess.run(
+                            result1 = job_run(
                                 sudo_prefix + ["iptables", "-C", "INPUT", "-p", proto, "--dport", str(port), "-j", "ACCEPT"],
                                 check=False,
                             )
                             if result1.returncode != 0:
                                 # Правило не существует, добавляем
-                                result2 = subprocess.run(
+                                result2 = job_run(
                                     sudo_prefix + ["iptables", "-A", "INPUT", "-p", proto, "--dport", str(port), "-j", "ACCEPT"],
                                     capture_output=True, text=True, check=False,
                                 )
@@ -1093,11 +1672,11 @@ class MonitoringAgent:
                                 return True
                         elif action == "deny":
                             # Удаляем правило ACCEPT, если есть, и добавляем DROP
-                            subprocess.run(
+                            job_run(
                                 sudo_prefix + ["iptables", "-D", "INPUT", "-p", proto, "--dport", str(port), "-j", "ACCEPT"],
                                 check=False,
                             )
-                            result = subprocess.run(
+                            result = job_run(
                                 sudo_prefix + ["iptables", "-A", "INPUT", "-p", proto, "--dport", str(port), "-j", "DROP"],
                                 capture_output=True, text=True, check=False,
                             )
@@ -1115,6 +1694,32 @@ class MonitoringAgent:
             _log(f"Traceback: {traceback.format_exc()}")
         return False
     
+    def run_profile(self, command):
+        # Профайлер импортируется только здесь: пока команды нет, его код не загружен и потоков нет
+        try:
+            from . import profiler
+        except ImportError:
+            import profiler
+        parts = command.split()
+        try:
+            seconds = float(parts[1]) if len(parts) > 1 else 30.0
+            interval = float(parts[2]) / 1000.0 if len(parts) > 2 else 0.01
+        except ValueError:
+            _log(f"ERROR: invalid profile command: {command}, expected: profile [seconds] [interval_ms]")
+            return False
+        _log(f"Profiling agent threads for {seconds:g}s, interval {interval * 1000:g}ms")
+        report = profiler.sample(seconds, interval, should_stop=command_cancelled)
+        _log(f"Profile done: {report['samples']} samples, overhead {report['overhead_seconds']}s, top: {report['top'][:3]}")
+        resp = _request_with_retry(
+            "POST",
+            f"{self.master_url}/api/processes.php?action=command-result",
+            defer=True,
+            json={'command': command, 'logs': [], 'profile': report},
+            headers=self.headers,
+            timeout=30,
+        )
+        return bool(resp is not None and resp.status_code in (200, 201))
+
     def report_command_status(self, command, status):
         # Отчет о статусе выполнения команды
         url = f"{self.master_url}/api/nodes.php"
@@ -1128,10 +1733,10 @@ class MonitoringAgent:
         resp = _request_with_retry(
             "POST",
             url,
+            defer=True,
             params=params,
             json=data,
             headers=self.headers,
-            verify=_get_verify(),
         )
         
         if resp:
@@ -1210,29 +1815,55 @@ class MonitoringAgent:
 
         ids = [line.strip() for line in listed.stdout.splitlines() if line.strip()]
         inspected = self._docker_inspect(ids) if ids else []
+        # Ресурсы по короткому id (12 символов, как печатает docker stats)
         stats_map = {}
-        running_ids = [
-            (item.get('Id') or '')[:12]
-            for item in inspected
+        running = [
+            item for item in inspected
             if ((item.get('State') or {}).get('Status') or '').lower() == 'running'
         ]
-        if running_ids:
+        fallback_ids = []
+        if self._cgroups is not None:
+            for item in running:
+                cid = item.get('Id') or ''
+                usage = self._cgroups.read(cid, (item.get('State') or {}).get('Pid') or 0)
+                if usage is None:
+                    fallback_ids.append(cid[:12])
+                else:
+                    stats_map[cid[:12]] = usage
+            self._cgroups.forget(item.get('Id') or '' for item in running)
+        else:
+            fallback_ids = [(item.get('Id') or '')[:12] for item in running]
+        if fallback_ids:
+            # docker stats сам делает два замера с паузой — секунды на вызов, поэтому только для тех, кого нет в cgroup
             try:
                 stats = subprocess.run(
-                    ['docker', 'stats', '--no-stream', '--format', '{{.ID}}|{{.CPUPerc}}|{{.MemPerc}}', *running_ids],
+                    ['docker', 'stats', '--no-stream', '--format', '{{.ID}}|{{.CPUPerc}}|{{.MemPerc}}', *fallback_ids],
                     capture_output=True, text=True, timeout=20,
                 )
                 if stats.returncode == 0:
                     for line in stats.stdout.splitlines():
                         parts = line.split('|')
                         if len(parts) >= 3:
-                            stats_map[parts[0].strip()] = (
-                                self._docker_pct(parts[1]),
-                                self._docker_pct(parts[2]),
-                            )
+                            stats_map[parts[0].strip()[:12]] = {
+                                'cpu_percent': self._docker_pct(parts[1]),
+                                'memory_percent': self._docker_pct(parts[2]),
+                            }
             except Exception as e:
                 _log(f"docker stats failed: {e}")
 
+        # GPU по контейнерам: процессы на картах, сгруппированные по cgroup
+        gpu_map = {}
+        if running:
+            for pid, usage in self._gpu.processes().items():
+                owner = container_of(pid)
+                if owner is None:
+                    continue
+                agg = gpu_map.setdefault(owner, {'gpu_memory': 0, 'gpu_util': None, 'gpu_pids': 0})
+                agg['gpu_memory'] += usage['gpu_memory']
+                agg['gpu_pids'] += 1
+                if usage['gpu_util'] is not None:
+                    agg['gpu_util'] = round((agg['gpu_util'] or 0.0) + usage['gpu_util'], 1)
+
         containers = []
         for item in inspected:
             cid = item.get('Id') or ''
@@ -1284,19 +1915,24 @@ class MonitoringAgent:
                         'container': cport_n,
                         'protocol': proto,
                     })
-            cpu, mem = 0.0, 0.0
-            for key, val in stats_map.items():
-                if cid.startswith(key) or key.startswith(cid[:12]):
-                    cpu, mem = val
-                    break
+            usage = stats_map.get(cid[:12]) or {}
+            gpu = gpu_map.get(cid) or {}
             containers.append({
                 'container_id': cid,
                 'name': name,
                 'image': cfg.get('Image') or '',
                 'status': self._norm_container_status(state.get('Status'), raw_status),
                 'raw_status': raw_status,
-                'cpu_percent': cpu,
-                'memory_percent': mem,
+                'cpu_percent': usage.get('cpu_percent', 0.0),
+                'memory_percent': usage.get('memory_percent', 0.0),
+                'memory_usage': usage.get('memory_usage'),
+                'memory_limit': usage.get('memory_limit'),
+                'block_read_bps': usage.get('block_read_bps'),
+                'block_write_bps': usage.get('block_write_bps'),
+                'pids': usage.get('pids'),
+                'gpu_memory': gpu.get('gpu_memory'),
+                'gpu_util': gpu.get('gpu_util'),
+                'gpu_pids': gpu.get('gpu_pids'),
                 'ipv4': ipv4,
                 'network_mode': host.get('NetworkMode') or '',
                 'networks': networks,
@@ -1535,15 +2171,18 @@ class MonitoringAgent:
         interfaces = []
         try:
             net_if_addrs = psutil.net_if_addrs()
-            net_if_stats = psutil.net_if_stats()
-            net_io_counters = psutil.net_io_counters(pernic=True)
+            net_if_stats = None if self._proc is not None else psutil.net_if_stats()
+            net_io_counters = self._net_counters()
             gateways4, gateways6 = self.collect_default_gateways()
 
             for interface_name, addrs in net_if_addrs.items():
                 if self._skip_virtual_iface(interface_name):
                     continue
 
-                stats = net_if_stats.get(interface_name)
+                if net_if_stats is None:
+                    stats = self._proc.iface_state(interface_name)
+                else:
+                    stats = net_if_stats.get(interface_name)
                 io_counters = net_io_counters.get(interface_name)
 
                 ipv4 = None
@@ -1587,7 +2226,6 @@ class MonitoringAgent:
             f"{self.master_url}/api/ports.php?action=interfaces",
             json={"interfaces": interfaces, "neighbors": neighbors or []},
             headers=self.headers,
-            verify=_get_verify(),
         )
         if resp and resp.status_code in (200, 201):
             return True
@@ -1609,7 +2247,7 @@ class MonitoringAgent:
             timeout = float(os.getenv("UPNP_TIMEOUT", "8"))
             if timeout <= mx:
                 timeout = float(mx) + 5.0
-            devices = upnp_mod.discover(mx=mx, timeout=timeout)
+            devices = _upnp().discover(mx=mx, timeout=timeout)
             self.upnp_devices = devices
             _log(f"UPnP discovery found {len(devices)} device(s)")
             return devices
@@ -1624,7 +2262,6 @@ class MonitoringAgent:
                 f"{self.master_url}/api/upnp.php",
                 json={"devices": devices, "node_name": self.node_name},
                 headers=self.headers,
-                verify=_get_verify(),
                 timeout=20,
             )
             if resp and resp.status_code in (200, 201):
@@ -1641,9 +2278,9 @@ class MonitoringAgent:
             resp = _request_with_retry(
                 "POST",
                 f"{self.master_url}/api/upnp.php",
+                defer=True,
                 json={"gone": [udn], "node_name": self.node_name},
                 headers=self.headers,
-                verify=_get_verify(),
                 timeout=10,
             )
             return bool(resp and resp.status_code in (200, 201))
@@ -1683,11 +2320,19 @@ class MonitoringAgent:
                     break
             if props:
                 self.send_upnp(list(self.upnp_devices))
+                self._delta_reset("upnp")
 
     def _upnp_refresh_quiet(self):
         devices = self.collect_upnp()
         if devices is not None:
             self.send_upnp(devices)
+            self._delta_reset("upnp")
+
+    def _delta_reset(self, section):
+        # Снимок ушёл на мастер в обход версий (upnp.php) — база дельты больше не совпадает
+        tracker = self._delta.get(section)
+        if tracker is not None:
+            tracker.reset()
 
     def handle_upnp_command(self, command: str) -> bool:
         parts = command.split()
@@ -1704,7 +2349,7 @@ class MonitoringAgent:
             idx = parts.index("--udn")
             if idx + 1 < len(parts):
                 udn = parts[idx + 1]
-        device = upnp_mod.find_device(devices, udn)
+        device = _upnp().find_device(devices, udn)
         if not device:
             _log("No UPnP IGD device available for mapping")
             return False
@@ -1720,7 +2365,7 @@ class MonitoringAgent:
                         break
                     desc = token
                     break
-                upnp_mod.add_port_mapping(device, ext_port, int_ip, int_port, proto, desc)
+                _upnp().add_port_mapping(device, ext_port, int_ip, int_port, proto, desc)
                 snap = self.collect_upnp()
                 if snap is not None:
                     self.send_upnp(snap)
@@ -1728,7 +2373,7 @@ class MonitoringAgent:
             if action in ("delmap", "delete-mapping") and len(parts) >= 4:
                 ext_port = int(parts[2])
                 proto = parts[3]
-                upnp_mod.delete_port_mapping(device, ext_port, proto)
+                _upnp().delete_port_mapping(device, ext_port, proto)
                 snap = self.collect_upnp()
                 if snap is not None:
                     self.send_upnp(snap)
@@ -1746,7 +2391,6 @@ class MonitoringAgent:
             f"{self.master_url}/api/containers.php",
             json=containers,
             headers=self.headers,
-            verify=_get_verify(),
         )
         return bool(resp and resp.status_code in (200, 201))
     
@@ -1757,7 +2401,6 @@ class MonitoringAgent:
             f"{self.master_url}/api/ports.php",
             json=ports,
             headers=self.headers,
-            verify=_get_verify(),
         )
         return bool(resp and resp.status_code in (200, 201))
     
@@ -1768,7 +2411,7 @@ class MonitoringAgent:
             if pid:
                 # Логи конкретного процесса через journalctl
                 try:
-                    result = subprocess.run(
+                    result = job_run(
                         ['journalctl', '-p', 'info', '--no-pager', '-n', str(limit), f'_PID={pid}', '--output=short'], 
                         capture_output=True, text=True, timeout=5
                     )
@@ -1837,7 +2480,7 @@ class MonitoringAgent:
                     try:
                         if os.path.exists(log_file):
                             # Читаем последние строки
-                            result = subprocess.run(
+                            result = job_run(
                                 ['tail', '-n', str(limit), log_file],
                                 capture_output=True, text=True, timeout=5
                             )
@@ -1939,12 +2582,57 @@ class MonitoringAgent:
             pass
         return {}
 
-    def _save_log_cursors(self):
+    def _snapshot_log_cursors(self):
+        with self._cursor_lock:
+            self._cursor_seq += 1
+            return self._cursor_seq, dict(self._log_cursors)
+
+    def _commit_log_cursors(self, seq, cursors):
+        # Сохраняем курсоры, когда мастер подтвердил логи (или логи легли в spool).
+        # Более старое подтверждение (досылка из spool после свежей выгрузки) курсор назад не двигает.
+        with self._cursor_lock:
+            if seq <= self._cursor_committed:
+                return
+            self._cursor_committed = seq
+            data = dict(cursors)
+            data["_seq"] = seq
+            try:
+                path = self._log_cursor_path()
+                tmp = path.with_name(path.name + ".tmp")
+                tmp.write_text(json.dumps(data), encoding="utf-8")
+                os.replace(tmp, path)
+            except Exception as e:
+                _log(f"Failed to save log cursors: {e}")
+
+    def _open_spool(self):
+        # Дисковый spool для метрик и логов, не дошедших до мастера. Курсоры логов из непереданных
+        # записей spool поднимаются в память, чтобы те же строки не собрать повторно.
+        if os.getenv("SPOOL_ENABLED", "true").lower() != "true":
+            return None
+        directory = os.getenv("SPOOL_DIR", "") or str(self._log_cursor_path().parent / "spool")
         try:
-            path = self._log_cursor_path()
-            path.write_text(json.dumps(self._log_cursors), encoding="utf-8")
-        except Exception as e:
-            _log(f"Failed to save log cursors: {e}")
+            spool = Spool(
+                directory,
+                max_bytes=int(float(os.getenv("SPOOL_MAX_MB", "64")) * 1024 * 1024),
+                max_age=float(os.getenv("SPOOL_MAX_AGE_HOURS", "24")) * 3600,
+            )
+        except OSError as e:
+            _log(f"Spool disabled, cannot open {directory}: {e}")
+            return None
+        pending = spool.records()
+        # Как в _commit_log_cursors: только снимки новее сохранённого, из них — самый свежий
+        # (запись старше уже подтверждённой выгрузки откатила бы курсоры, и строки собрались бы повторно)
+        latest = None
+        for record in pending:
+            seq = int(record.get("cursor_seq") or 0)
+            if record.get("cursors") and seq > self._cursor_committed and (latest is None or seq > latest[0]):
+                latest = (seq, record["cursors"])
+        if latest is not None:
+            self._log_cursors.update(latest[1])
+            self._cursor_seq = max(self._cursor_seq, latest[0])
+        if pending:
+            _log(f"Spool {directory}: {len(pending)} record(s) waiting for replay")
+        return spool
 
     @staticmethod
     def _parse_journal_iso(line: str):
@@ -1985,7 +2673,6 @@ class MonitoringAgent:
                 newest = fp
         if newest and newest != last:
             self._log_cursors[key] = newest
-            self._save_log_cursors()
         for item in out:
             item.pop("_fp", None)
         return out
@@ -2268,7 +2955,6 @@ class MonitoringAgent:
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                     })
                     self._log_cursors["boot_sent"] = boot_ts
-                    self._save_log_cursors()
             system_logs = self.collect_system_logs(limit=150)
             logs.extend(system_logs)
             ssh_logs = self.collect_ssh_auth_logs(limit=200)
@@ -2279,7 +2965,8 @@ class MonitoringAgent:
         return logs
     
     def send_logs(self, logs):
-        # Отправка логов на сервер (с детальным логированием по SSH-логам)
+        # Отправка логов на сервер (с детальным логированием по SSH-логам).
+        # Как send_metrics: True — принято, False — отвергнуто, None — мастер недоступен
         if not logs:
             _log("send_logs: nothing to send (0 logs)")
             return True
@@ -2304,7 +2991,6 @@ class MonitoringAgent:
             f"{self.master_url}/api/logs.php",
             json=logs,
             headers=self.headers,
-            verify=_get_verify(),
         )
         ok = bool(resp and resp.status_code in (200, 201))
         _log(f"send_logs: result status={resp.status_code if resp else 'no response'}, ok={ok}")
@@ -2314,6 +3000,8 @@ class MonitoringAgent:
                 _log(f"send_logs: response json={data}")
             except Exception as e:
                 _log(f"send_logs: failed to parse response json: {e}, text={resp.text[:200] if hasattr(resp, 'text') else ''}")
+        if not ok:
+            return None if _retryable(resp) else False
         return ok
 
     def collect_container_logs(self, containers, tail=50):
@@ -2325,7 +3013,7 @@ class MonitoringAgent:
                 continue
             name = c.get("name") or cid[:12]
             try:
-                result = subprocess.run(
+                result = job_run(
                     ["docker", "logs", "--tail", str(tail), cid],
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
@@ -2361,124 +3049,592 @@ class MonitoringAgent:
                 _log(f"Error collecting logs for container {cid}: {e}")
         return logs
     
-    def send_heartbeat(self):
-        # Отправка heartbeat для обновления статуса ноды
+    def _set_phase(self, phase):
+        # Вызывается из основного цикла. Цикл — от первого запущенного коллектора до выгрузки конверта
+        with self._phase_lock:
+            if phase == self._phase:
+                return
+            now = time.monotonic()
+            if phase != "idle" and self._cycle_started is None:
+                self._cycle_started = now
+            elif phase == "idle" and self._cycle_started is not None:
+                self._last_cycle_seconds = now - self._cycle_started
+                self._cycle_started = None
+            self._phase = phase
+            self._phase_since = now
+
+    def heartbeat_payload(self):
+        with self._phase_lock:
+            now = time.monotonic()
+            return {
+                "timestamp": datetime.now().isoformat(),
+                "phase": self._phase,
+                "phase_seconds": round(now - self._phase_since, 1),
+                "cycle_seconds": round(now - self._cycle_started, 1) if self._cycle_started is not None else None,
+                "last_cycle_seconds": round(self._last_cycle_seconds, 1) if self._last_cycle_seconds is not None else None,
+                "cycle_interval": interval_from_env("COLLECT_INTERVAL", 60),
+            }
+
+    def send_heartbeat(self, session=None, timeout=5):
+        # Отправка heartbeat для обновления статуса ноды. Из потока heartbeat идёт через свою сессию
+        # мимо общего пула и circuit breaker'ов: занятые выгрузкой соединения его не задерживают
+        url = f"{self.master_url}/api/nodes.php?action=heartbeat"
         try:
-            _log(f"Sending heartbeat to {self.master_url}/api/nodes.php?action=heartbeat")
-            resp = _request_with_retry(
-                "POST",
-                f"{self.master_url}/api/nodes.php?action=heartbeat",
-                json={"timestamp": datetime.now().isoformat()},
-                headers=self.headers,
-                verify=_get_verify(),
-                timeout=5  # Короткий таймаут для heartbeat
-            )
-            if resp and resp.status_code in (200, 201):
-                _log(f"Heartbeat sent successfully: status={resp.status_code}")
-                return True
+            if session is None:
+                resp = _request_with_retry("POST", url, json=self.heartbeat_payload(), headers=self.headers, timeout=timeout)
             else:
-                _log(f"Heartbeat failed: status={resp.status_code if resp else 'no response'}")
+                started = time.monotonic()
+                resp = None
+                try:
+                    resp = session.post(url, json=self.heartbeat_payload(), headers=self.headers, timeout=timeout)
+                finally:
+                    endpoint = _endpoint(url)
+                    TELEMETRY.observe("request_duration_seconds", time.monotonic() - started, endpoint=endpoint)
+                    TELEMETRY.inc("requests_total", endpoint=endpoint, code=resp.status_code if resp is not None else "error")
+            if resp is not None and resp.status_code in (200, 201):
+                return True
+            _log(f"Heartbeat failed: status={resp.status_code if resp is not None else 'no response'}")
         except Exception as e:
             _log(f"Heartbeat failed: {e}")
         return False
-    
-    def run(self):
-        # Основной цикл агента
-        collect_interval = int(os.getenv("COLLECT_INTERVAL", "60"))
-        heartbeat_interval = int(os.getenv("HEARTBEAT_INTERVAL", "15"))  # Heartbeat каждые 15 секунд по умолчанию
-        _log(f"Agent started, collection interval: {collect_interval}s, heartbeat interval: {heartbeat_interval}s")
-        if os.getenv("UPNP_ENABLED", "true").lower() == "true":
+
+    def heartbeat_loop(self):
+        # Отдельный поток: heartbeat уходит по своей сетке HEARTBEAT_INTERVAL, даже когда цикл сбора
+        # занят долгим UPnP discovery, apt-get update или docker stats
+        interval = interval_from_env("HEARTBEAT_INTERVAL", 15)
+        read_timeout = float(os.getenv("HEARTBEAT_TIMEOUT", "5"))
+        timeout = (min(read_timeout, 3.0), read_timeout)
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = _get_verify()
+        failures = 0
+        next_due = time.monotonic()
+        while True:
+            if self.send_heartbeat(session, timeout):
+                if failures:
+                    _log(f"Heartbeat restored after {failures} failed attempts")
+                failures = 0
+            else:
+                failures += 1
+            next_due += interval
+            now = time.monotonic()
+            if next_due <= now:
+                next_due = now + interval
+            time.sleep(next_due - now)
+
+    def stage(self, section, payload, cursors=None):
+        # Кладём секцию в конверт; отправка — одним запросом после завершения пачки коллекторов.
+        # cursors — (seq, курсоры) для логов: фиксируются, когда логи приняты мастером
+        if not self._envelope_enabled:
+            ok = self._send_section(section, payload)
+            dropped = ok is False and section in ("metrics", "logs")
+            if dropped:
+                _log(f"Master rejected {section}, dropping it")
+            if ok or dropped:
+                if cursors:
+                    self._commit_log_cursors(*cursors)
+            else:
+                self._park({section: payload}, cursors)
+            return
+        with self._outbox_lock:
+            self._outbox_fresh = True
+            if cursors:
+                self._outbox_cursors = cursors
+            if section == "logs":
+                logs = self._outbox.setdefault("logs", [])
+                logs.extend(payload)
+                limit = int(os.getenv("OUTBOX_MAX_LOGS", "5000"))
+                if len(logs) > limit:
+                    del logs[: len(logs) - limit]
+            else:
+                self._outbox[section] = payload
+
+    def outbox_has(self, section):
+        with self._outbox_lock:
+            return section in self._outbox
+
+    def outbox_pending(self):
+        # Есть ли в конверте новое с прошлой выгрузки. Возвращённые после неудачи секции сами по себе
+        # выгрузку не запускают (иначе при открытом breaker'е цикл крутился бы вхолостую) — уедут
+        # вместе со следующими собранными данными
+        with self._outbox_lock:
+            return self._outbox_fresh and bool(self._outbox)
+
+    def _requeue(self, sections, cursors=None):
+        # Вернуть неотправленные секции в конверт, не затирая более свежие снимки
+        with self._outbox_lock:
+            if cursors and self._outbox_cursors is None:
+                self._outbox_cursors = cursors
+            for name, payload in sections.items():
+                if name == "logs":
+                    self._outbox["logs"] = list(payload) + self._outbox.get("logs", [])
+                else:
+                    self._outbox.setdefault(name, payload)
+
+    def _park(self, sections, cursors=None):
+        # Мастер не принял секции. Ряды метрик и логи уходят в дисковый spool (досылаются по порядку
+        # фоновым потоком), снимки ждут следующего конверта — там их заменит более свежий.
+        rest = {}
+        for name, payload in sections.items():
+            if self._spool is None or name not in ("metrics", "logs"):
+                rest[name] = payload
+                continue
+            record = {"section": name, "payload": payload}
+            if name == "logs" and cursors:
+                record["cursor_seq"], record["cursors"] = cursors
             try:
-                upnp_mod.start_background(self._on_upnp_event)
-                _log("UPnP SSDP NOTIFY + GENA listeners started")
-            except Exception as e:
-                _log(f"UPnP listeners failed: {e}")
-        
-        cycle = 0
-        last_heartbeat = 0
-        
+                self._spool.append(record)
+            except OSError as e:
+                _log(f"Spool write failed: {e}")
+                rest[name] = payload
+        if rest:
+            self._requeue(rest, cursors if "logs" in rest else None)
+
+    def replay_spool(self):
+        # Фоновая досылка spool по порядку с ограничением скорости. Запись, которую мастер
+        # отверг по содержимому (4xx, кроме 401/403/408/429, или отказ секции в конверте), выбрасывается
+        # (иначе очередь встанет); при недоступности — экспоненциальная пауза с jitter до SPOOL_RETRY_INTERVAL.
+        rate = max(0.1, float(os.getenv("SPOOL_REPLAY_RATE", "2")))
+        backoff = Backoff(float(os.getenv("RETRY_DELAY", "5")), interval_from_env("SPOOL_RETRY_INTERVAL", 30))
+        failures = 0
         while True:
-            cycle += 1
-            current_time = time.time()
-            
-            # Отправляем heartbeat чаще, чем метрики (для быстрого обнаружения падения)
-            if current_time - last_heartbeat >= heartbeat_interval:
-                if self.send_heartbeat():
-                    last_heartbeat = current_time
+            item = self._spool.peek()
+            if item is None:
+                time.sleep(5)
+                continue
+            pos, record = item
+            section, payload = record.get("section"), record.get("payload")
+            ok = None
+            if self._envelope_enabled:
+                accepted = self.send_envelope({section: payload})
+                if accepted is not None and self._envelope_enabled:
+                    ok = bool((accepted.get(section) or {}).get("ok"))
+            if not self._envelope_enabled:
+                # Мастер без ingest.php (в том числе только что ответивший 404) — та же запись через свой эндпоинт
+                ok = self._send_section(section, payload)
+            if ok is None:
+                time.sleep(max(1.0, backoff.delay(failures)))
+                failures += 1
+                continue
+            failures = 0
+            if not ok:
+                _log(f"Spool: master rejected {section} record, dropping it")
+            self._spool.commit(pos)
+            if record.get("cursors"):
+                self._commit_log_cursors(int(record.get("cursor_seq") or 0), record["cursors"])
+            time.sleep(1.0 / rate)
+
+    def _send_section(self, section, payload):
+        # Отправка одной секции через её отдельный эндпоинт (старый мастер или повтор отвергнутой секции).
+        # Для metrics и logs None — мастер недоступен, False — отверг запись
+        if section == "metrics":
+            return self.send_metrics(payload)
+        if section == "processes":
+            return self.send_processes(payload)
+        if section == "containers":
+            return self.send_containers(payload)
+        if section == "ports":
+            return self.send_ports(payload)
+        if section == "interfaces":
+            return self.send_network_interfaces(payload.get("interfaces") or [], payload.get("neighbors") or [])
+        if section == "upnp":
+            return self.send_upnp(payload.get("devices") or [])
+        if section == "logs":
+            return self.send_logs(payload)
+        _log(f"Unknown outbox section: {section}")
+        return False
+
+    def send_envelope(self, sections):
+        # POST /api/ingest.php: все секции цикла одним запросом. Возвращает {section: ok} или None,
+        # если мастер недоступен (см. _retryable); прочий 4xx — все секции отвергнуты.
+        # 404 — мастер без ingest.php: дальше шлём по отдельным эндпоинтам.
+        resp = _request_with_retry(
+            "POST",
+            f"{self.master_url}/api/ingest.php",
+            json={"v": 1, "node_name": self.node_name, "sections": sections},
+            headers=self.headers,
+            timeout=30,
+        )
+        if resp is None:
+            return None
+        if resp.status_code == 404:
+            _log("Master has no /api/ingest.php, falling back to per-endpoint uploads")
+            self._envelope_enabled = False
+            return {name: {"ok": False} for name in sections}
+        if resp.status_code not in (200, 201):
+            _log(f"Envelope upload failed: status={resp.status_code} {(resp.text or '')[:200]}".strip())
+            if _retryable(resp):
+                return None
+            return {name: {"ok": False, "error": f"status {resp.status_code}"} for name in sections}
+        try:
+            result = resp.json().get("sections") or {}
+        except Exception as e:
+            _log(f"Envelope upload: bad response json: {e}")
+            return None
+        accepted = {}
+        for name in sections:
+            entry = result.get(name) or {}
+            accepted[name] = entry
+            if not entry.get("ok") and not entry.get("resync"):
+                _log(f"Envelope section {name} rejected: {entry.get('error', 'no result')}")
+        return accepted
+
+    def _encode_sections(self, sections):
+        # Версионированные секции кодируем трекером (полный снимок или дельта), остальные — как есть
+        body, versions = {}, {}
+        for name, payload in sections.items():
+            tracker = self._delta.get(name)
+            if tracker is None:
+                body[name] = payload
+                continue
+            wrapped = {"ports": payload} if name == "ports" else payload
+            body[name], versions[name] = tracker.encode(wrapped)
+        return body, versions
+
+    def _send_versioned(self, sections):
+        # Отправляет конверт и подтверждает версии принятых секций.
+        # Возвращает (непринятые секции, секции с рассинхроном версий) или None, если мастер не ответил.
+        body, versions = self._encode_sections(sections)
+        changed = [n for n, p in body.items() if n in versions and not DeltaTracker.is_empty(p)]
+        _log(f"Sending envelope: {', '.join(body)}" + (f" (changed: {', '.join(changed)})" if versions else ""))
+        accepted = self.send_envelope(body)
+        if accepted is None:
+            return None
+        rejected, resync = {}, {}
+        for name, payload in sections.items():
+            entry = accepted.get(name) or {}
+            if entry.get("ok"):
+                if name in versions:
+                    self._delta[name].ack(versions[name])
+            elif entry.get("resync") and name in self._delta:
+                self._delta[name].reset()
+                resync[name] = payload
+            else:
+                rejected[name] = payload
+        return rejected, resync
+
+    def flush_outbox(self):
+        with self._outbox_lock:
+            sections, self._outbox = self._outbox, {}
+            cursors, self._outbox_cursors = self._outbox_cursors, None
+            self._outbox_fresh = False
+        if not sections:
+            return
+        if self._envelope_enabled:
+            result = self._send_versioned(sections)
+            if result is None:
+                # Мастер недоступен: метрики и логи — в spool, снимки — в следующий конверт
+                self._park(sections, cursors)
+                return
+            if "logs" in sections and "logs" not in result[0] and cursors:
+                self._commit_log_cursors(*cursors)
+            sections, resync = result
+            if resync:
+                # Мастер потерял базу дельты — сразу досылаем полные снимки этих секций
+                _log(f"Delta version mismatch for {', '.join(resync)}, sending full snapshots")
+                result = self._send_versioned(resync)
+                if result is None:
+                    self._park(resync)
                 else:
-                    _log("Warning: heartbeat failed, will retry")
-            
-            _log(f"Cycle {cycle}: collecting metrics...")
-            
-            # Проверяем команды от мастера
-            command = self.check_commands()
-            if command:
-                _log(f"=== EXECUTING COMMAND ===")
-                _log(f"Command received: {command}")
-                _log(f"Node: {self.node_name}")
-                try:
-                    success = self.execute_command(command)
-                    _log(f"Command execution result: success={success}")
-                    self.report_command_status(command, 'completed' if success else 'failed')
-                    _log(f"=== COMMAND EXECUTION COMPLETE ===")
-                except Exception as e:
-                    _log(f"ERROR executing command: {e}")
-                    import traceback
-                    _log(f"Traceback: {traceback.format_exc()}")
-                    self.report_command_status(command, 'failed')
+                    sections.update(result[0])
+                    sections.update(result[1])
+        # Отвергнутые секции (или старый мастер) — поштучно через отдельные эндпоинты
+        for name, payload in sections.items():
+            if name in self._delta:
+                # Полный снимок мимо версий: следующая выгрузка начнёт с полного снимка
+                self._delta[name].reset()
+            ok = self._send_section(name, payload)
+            # Ряды, отвергнутые по содержимому, в spool не кладём: повтор дал бы тот же отказ
+            dropped = ok is False and name in ("metrics", "logs")
+            if dropped:
+                _log(f"Master rejected {name}, dropping it")
+            if ok or dropped:
+                if name == "logs" and cursors:
+                    self._commit_log_cursors(*cursors)
             else:
-                # Логируем только раз в 10 циклов, чтобы не засорять логи
-                if cycle % 10 == 0:
-                    _log(f"No pending commands found (cycle {cycle})")
-            
-            # Собираем и отправляем метрики
-            metrics = self.collect_metrics()
-            processes = self.collect_processes()
-            _log(f"Collected {len(processes)} processes, CPU: {metrics.get('cpu_percent', 0):.1f}%, Memory: {metrics.get('memory_percent', 0):.1f}%")
-            if not self.send_data(metrics, processes):
-                _log("Error: failed to send metrics/processes")
-            
-            # Снимок Docker: контейнеры + сети. Пустой список тоже отправляем, чтобы панель не держала призрак.
-            docker_snap = self.collect_docker_snapshot()
-            if docker_snap is not None:
-                _log(
-                    f"Sending {len(docker_snap.get('containers') or [])} containers, "
-                    f"{len(docker_snap.get('networks') or [])} docker networks"
-                )
-                self.send_containers(docker_snap)
-            
-            # Собираем и отправляем порты (реже)
-            ports = self.collect_ports()
-            if ports:
-                _log(f"Sending {len(ports)} ports")
-                self.send_ports(ports)
-            
-            # Собираем и отправляем сетевые интерфейсы (реже, раз в несколько циклов)
-            if cycle % 5 == 0:
-                interfaces = self.collect_network_interfaces()
-                neighbors = self.collect_neighbors()
-                _log(f"Sending {len(interfaces)} network interfaces, {len(neighbors)} neighbors")
-                if not self.send_network_interfaces(interfaces, neighbors):
-                    _log("Error: failed to send network interfaces")
-
-            if os.getenv("UPNP_ENABLED", "true").lower() == "true":
-                upnp_every = max(1, int(os.getenv("UPNP_INTERVAL_CYCLES", "2")))
-                if cycle == 1 or cycle % upnp_every == 0:
-                    devices = self.collect_upnp()
-                    if devices is None:
-                        _log("UPnP discovery failed, keeping last snapshot")
-                    else:
-                        _log(f"Sending {len(devices)} UPnP devices")
-                        if not self.send_upnp(devices):
-                            _log("Error: failed to send UPnP snapshot")
-            
-            # Собираем и отправляем логи (реже, раз в несколько циклов)
-            logs = self.collect_logs()
-            if logs and not self.send_logs(logs):
-                _log("Error: failed to send logs")
-            
-            _log(f"Cycle {cycle} completed, sleeping {collect_interval}s...")
-            time.sleep(collect_interval)
+                _log(f"Error: failed to send {name}")
+                self._park({name: payload}, cursors if name == "logs" else None)
+
+    def command_loop(self):
+        # Отдельный поток канала команд: long-poll к мастеру, держится одно соединение вместо опроса
+        # раз в цикл. Все слоты long-poll мастера заняты — новая попытка через его retry_after с разбросом
+        # (ноды не возвращаются разом); мастер без long-poll отвечает сразу — опрос раз в COMMAND_INTERVAL.
+        wait = max(0, int(os.getenv("COMMAND_POLL_WAIT", "25")))
+        interval = interval_from_env("COMMAND_INTERVAL", interval_from_env("COLLECT_INTERVAL", 60))
+        while True:
+            started = time.monotonic()
+            try:
+                command = self.check_commands(wait)
+                if command:
+                    self.accept_command(command)
+                    continue
+            except Exception as e:
+                _log(f"Command channel error: {e}")
+            elapsed = time.monotonic() - started
+            retry_after = self._command_retry_after
+            if retry_after is not None and wait > 0:
+                time.sleep(retry_after * (0.5 + random.random()))
+            elif elapsed < wait / 2 or wait == 0:
+                time.sleep(max(1.0, interval - elapsed))
+
+    def accept_command(self, command):
+        # Команда уходит в очередь исполнителя, канал сразу возвращается к long-poll.
+        # running отправляем сразу: следующий long-poll её уже не вернёт
+        if command_kind(command) == 'cancel':
+            # cancel [префикс команды] — отмена выполняемых и ждущих в очереди команд
+            target = command.split(None, 1)[1] if len(command.split(None, 1)) > 1 else ''
+            count = self._commands.cancel(target)
+            _log(f"Cancelled {count} command(s) matching {target!r}")
+            self.report_command_status(command, 'completed')
+            return
+        self.report_command_status(command, 'running')
+        if self._commands.submit(command) is None:
+            _log(f"Command queue is full, rejecting: {command}")
+            self.report_command_status(command, 'failed')
+
+    def handle_command(self, command):
+        # Выполняется в пуле исполнителя команд; итог мастеру сообщает исполнитель
+        _log(f"=== EXECUTING COMMAND ===")
+        _log(f"Command received: {command}")
+        _log(f"Node: {self.node_name}")
+        success = self.execute_command(command)
+        _log(f"Command execution result: success={success}")
+        return success
+
+    def _task_metrics(self):
+        metrics = self.collect_metrics()
+        metrics["collected_at"] = int(time.time())  # при досылке из spool точка встанет на своё время
+        _log(f"CPU: {metrics.get('cpu_percent', 0):.1f}%, Memory: {metrics.get('memory_percent', 0):.1f}%")
+        self.stage("metrics", metrics)
+
+    def _task_processes(self):
+        processes = self.collect_processes()
+        _log(f"Collected {len(processes)} processes")
+        self.stage("processes", processes)
+
+    def _task_docker(self):
+        # Снимок Docker: контейнеры + сети. Пустой список тоже отправляем, чтобы панель не держала призрак.
+        docker_snap = self.collect_docker_snapshot()
+        if docker_snap is not None:
+            _log(
+                f"Staging {len(docker_snap.get('containers') or [])} containers, "
+                f"{len(docker_snap.get('networks') or [])} docker networks"
+            )
+            self.stage("containers", docker_snap)
+
+    def _task_ports(self):
+        ports = self.collect_ports()
+        if ports:
+            _log(f"Staging {len(ports)} ports")
+            self.stage("ports", ports)
+
+    def _task_interfaces(self):
+        interfaces = self.collect_network_interfaces()
+        neighbors = self.collect_neighbors()
+        _log(f"Staging {len(interfaces)} network interfaces, {len(neighbors)} neighbors")
+        self.stage("interfaces", {"interfaces": interfaces, "neighbors": neighbors})
+
+    def _task_upnp(self):
+        devices = self.collect_upnp()
+        if devices is None:
+            _log("UPnP discovery failed, keeping last snapshot")
+        else:
+            _log(f"Staging {len(devices)} UPnP devices")
+            self.stage("upnp", {"devices": devices})
+
+    def _task_logs(self):
+        logs = self.collect_logs()
+        cursors = self._snapshot_log_cursors()
+        if logs:
+            self.stage("logs", logs, cursors)
+            return
+        # Новых строк нет: курсор можно фиксировать, если в конверте не ждут более ранние логи
+        with self._outbox_lock:
+            waiting = "logs" in self._outbox
+            if waiting:
+                self._outbox_cursors = cursors
+        if not waiting:
+            self._commit_log_cursors(*cursors)
+
+    def build_scheduler(self):
+        # У каждого коллектора свой период (секунды). По умолчанию всё кратно COLLECT_INTERVAL,
+        # как раньше: интерфейсы — раз в 5 интервалов, UPnP — раз в UPNP_INTERVAL_CYCLES.
+        # COLLECTOR_<NAME>_TIMEOUT — жёсткий срок выполнения, после которого коллектор считается зависшим
+        # (с префиксом: UPNP_TIMEOUT — уже таймаут SSDP-поиска, и мастер пишет его в node.conf).
+        collect_interval = interval_from_env("COLLECT_INTERVAL", 60)
+        upnp_cycles = max(1, int(os.getenv("UPNP_INTERVAL_CYCLES", "2")))
+        upnp_timeout = float(os.getenv("UPNP_TIMEOUT", "8")) + 30
+        scheduler = Scheduler()
+
+        def add(name, period, fn, timeout, deferred=False):
+            scheduler.add(
+                name,
+                interval_from_env(f"{name.upper()}_INTERVAL", period),
+                fn,
+                timeout=interval_from_env(f"COLLECTOR_{name.upper()}_TIMEOUT", timeout),
+                deferred=deferred,
+            )
+
+        add("metrics", collect_interval, self._task_metrics, 30)
+        add("processes", collect_interval, self._task_processes, 30)
+        add("docker", collect_interval, self._task_docker, 60)
+        add("ports", collect_interval, self._task_ports, 15)
+        add("interfaces", collect_interval * 5, self._task_interfaces, 20)
+        if os.getenv("UPNP_ENABLED", "true").lower() == "true":
+            # UPnP не входит в первую пачку: его запускает start_optional после первой выгрузки метрик
+            add("upnp", collect_interval * upnp_cycles, self._task_upnp, upnp_timeout, deferred=True)
+        add("logs", collect_interval, self._task_logs, 30)
+        return scheduler
+
+    def _run_task(self, task):
+        # Выполняется в пуле коллекторов
+        started = time.monotonic()
+        task.last_started = started
+        try:
+            task.fn()
+        except Exception as e:
+            TELEMETRY.inc("collector_failures_total", collector=task.name)
+            _log(f"Task {task.name} failed: {e}")
+            import traceback
+            _log(f"Traceback: {traceback.format_exc()}")
+        finally:
+            task.last_duration = time.monotonic() - started
+            task.runs += 1
+            TELEMETRY.observe("collector_duration_seconds", task.last_duration, collector=task.name)
+            TELEMETRY.inc("collector_runs_total", collector=task.name)
+
+    def register_telemetry(self, scheduler):
+        # Гейджи и разделы /debug/vars, которые читаются из состояния агента в момент запроса
+        def outbox_sections():
+            with self._outbox_lock:
+                return len(self._outbox)
+
+        def breakers_open():
+            return [({"endpoint": k}, 1 if v["state"] != CircuitBreaker.CLOSED else 0)
+                    for k, v in _breakers.snapshot().items()]
+
+        TELEMETRY.gauge("outbox_sections", "Sections waiting in the upload envelope", outbox_sections)
+        TELEMETRY.gauge("spool_bytes", "Bytes in the on-disk upload spool",
+                        lambda: self._spool.size_bytes() if self._spool is not None else 0)
+        TELEMETRY.gauge("retry_queue_length", "Requests waiting in the retry queue",
+                        lambda: len(_retry_queue) if _retry_queue is not None else 0)
+        TELEMETRY.gauge("commands_in_flight", "Master commands queued or running", lambda: len(self._commands.jobs()))
+        TELEMETRY.gauge("breaker_open", "1 while the endpoint circuit breaker is open or half-open", breakers_open)
+        TELEMETRY.gauge("last_cycle_seconds", "Duration of the last collection cycle",
+                        lambda: self._last_cycle_seconds or 0.0)
+        TELEMETRY.debug_var("tasks", lambda: {
+            t.name: {
+                "period": t.period, "timeout": t.timeout, "runs": t.runs, "skipped": t.skipped,
+                "timeouts": t.timeouts, "last_duration": round(t.last_duration, 3),
+            }
+            for t in scheduler.tasks
+        })
+        TELEMETRY.debug_var("breakers", _breakers.snapshot)
+        TELEMETRY.debug_var("commands", self._commands.jobs)
+        TELEMETRY.debug_var("heartbeat", self.heartbeat_payload)
+        if self._sampler is not None:
+            TELEMETRY.gauge("sampler_cpu_seconds", "CPU time spent by the sampling thread",
+                            lambda: self._sampler.busy_seconds)
+            TELEMETRY.debug_var("sampler", lambda: {
+                "period": self._sampler.period, "capacity": self._sampler.capacity,
+                "samples": self._sampler.samples, "cpu_seconds": round(self._sampler.busy_seconds, 4),
+            })
+
+    def start_optional(self, scheduler):
+        # Необязательные подсистемы поднимаются после первого heartbeat и первой выгрузки метрик:
+        # после рестарта systemd и на слабых ARM-нодах нода появляется на панели без ожидания UPnP
+        if self._spool is not None:
+            Thread(target=self.replay_spool, name="spool-replay", daemon=True).start()
+        if os.getenv("UPNP_ENABLED", "true").lower() == "true":
+            scheduler.release("upnp")
+            Thread(target=self._start_upnp_listeners, name="upnp-start", daemon=True).start()
+
+    def _start_upnp_listeners(self):
+        try:
+            _upnp().start_background(self._on_upnp_event)
+            _log("UPnP SSDP NOTIFY + GENA listeners started")
+        except Exception as e:
+            _log(f"UPnP listeners failed: {e}")
+
+    def run(self):
+        # Основной цикл агента: дедлайны коллекторов на monotonic-часах, выполнение — в ограниченном пуле.
+        # Зависший коллектор (например, docker inspect при заклинившем dockerd) помечается как timed out
+        # и не задерживает остальные; новый слот того же коллектора пропускается, пока старый не вернётся.
+        scheduler = self.build_scheduler()
+        self.register_telemetry(scheduler)
+        workers = max(1, int(os.getenv("COLLECTOR_WORKERS", "4")))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="collector")
+        periods = ", ".join(f"{t.name}={t.period:g}s/{t.timeout:g}s" for t in scheduler.tasks)
+        _log(f"Agent started, {workers} collector workers, period/timeout: {periods}")
+        Thread(target=self.heartbeat_loop, name="heartbeat", daemon=True).start()
+        Thread(target=self.command_loop, name="commands", daemon=True).start()
+        if self._sampler is not None:
+            self._sampler.start()
+        # Выгрузка — в своём потоке: на старте пачка коллекторов больше пула, и конверт не ждёт очереди
+        uploader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload")
+        metrics_task = scheduler.get("metrics")
+        started = time.monotonic()
+        optional_started = False
+
+        running = {}  # future -> [task, deadline, timed_out]
+        flushing = None
+        while True:
+            now = time.monotonic()
+            for future in [f for f in running if f.done()]:
+                task, _deadline, timed_out = running.pop(future)
+                if timed_out:
+                    _log(f"Task {task.name} finished after timeout: {task.last_duration:.1f}s")
+            for entry in running.values():
+                task, deadline, timed_out = entry
+                if not timed_out and now >= deadline:
+                    entry[2] = True
+                    task.timeouts += 1
+                    TELEMETRY.inc("collector_timeouts_total", collector=task.name)
+                    _log(f"Task {task.name} timed out after {task.timeout:g}s, still running in background")
+
+            busy = {entry[0].name for entry in running.values()}
+            for task in scheduler.due(now):
+                task.reschedule(now)
+                if task.name in busy:
+                    task.skipped += 1
+                    TELEMETRY.inc("collector_skipped_total", collector=task.name)
+                    _log(f"Task {task.name} is still running, skipping slot")
+                    continue
+                running[pool.submit(self._run_task, task)] = [task, now + task.timeout, False]
+
+            # Конверт уходит, когда пачка коллекторов отработала (или вышла по таймауту):
+            # секции, созревшие в одном слоте, едут одним запросом
+            collectors = sorted(task.name for task, _deadline, timed_out in running.values() if not timed_out)
+            if flushing is not None and flushing.done():
+                if flushing.exception() is not None:
+                    _log(f"Envelope flush failed: {flushing.exception()}")
+                flushing = None
+            # До первой выгрузки метрики не ждут всю стартовую пачку (docker, логи): уходят, как только собраны
+            first_upload = not optional_started and "metrics" not in collectors and self.outbox_has("metrics")
+            if (not collectors or first_upload) and flushing is None and self.outbox_pending():
+                flushing = uploader.submit(self.flush_outbox)
+            if not optional_started and flushing is None and not self.outbox_has("metrics") and (
+                    metrics_task is None or metrics_task.runs > 0 or now - started >= metrics_task.timeout):
+                optional_started = True
+                _log(f"First upload done in {now - started:.1f}s, starting optional subsystems")
+                self.start_optional(scheduler)
+            if collectors:
+                self._set_phase("collect:" + ",".join(collectors))
+            else:
+                self._set_phase("upload" if flushing is not None else "idle")
+
+            wake = scheduler.next_wakeup()
+            pending = [e[1] for e in running.values() if not e[2]]
+            if pending:
+                wake = min(wake, min(pending))
+            delay = max(0.0, wake - time.monotonic())
+            waiting = list(running) + ([flushing] if flushing is not None else [])
+            if waiting:
+                futures_wait(waiting, timeout=delay, return_when=FIRST_COMPLETED)
+            elif delay > 0:
+                time.sleep(delay)
 
 if __name__ == "__main__":
     import sys
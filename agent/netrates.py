@@ -0,0 +1,67 @@
+"""Скорости по сетевым интерфейсам из накопленных счётчиков /proc/net/dev: переполнение 32/64 бит, сброс, появление и исчезновение интерфейсов."""
+from __future__ import annotations
+
+import time
+from operator import attrgetter
+from typing import Dict, Optional, Tuple
+
+# Поле счётчика -> (имя приращения за интервал, имя скорости в секунду)
+FIELDS = (
+    ("bytes_recv", "rx_bytes", "rx_bps"),
+    ("bytes_sent", "tx_bytes", "tx_bps"),
+    ("packets_recv", "rx_packets", "rx_pps"),
+    ("packets_sent", "tx_packets", "tx_pps"),
+    ("errin", "rx_errors", "rx_errors_ps"),
+    ("errout", "tx_errors", "tx_errors_ps"),
+    ("dropin", "rx_drops", "rx_drops_ps"),
+    ("dropout", "tx_drops", "tx_drops_ps"),
+)
+_COUNTERS = attrgetter(*(field for field, _, _ in FIELDS))
+WRAP32 = 1 << 32
+WRAP64 = 1 << 64
+
+
+def counter_delta(prev: int, cur: int) -> Tuple[int, bool]:
+    # (приращение, был ли сброс). Значение меньше прошлого — либо переполнение (32-битные счётчики
+    # старых драйверов; 64-битные — теоретически), если до границы оставалось меньше половины диапазона,
+    # либо сброс (интерфейс пересоздан, драйвер перезагружен): тогда счёт с нуля, как rate() в Prometheus.
+    if cur >= prev:
+        return cur - prev, False
+    if prev < WRAP32 and WRAP32 - prev + cur <= WRAP32 // 2:
+        return WRAP32 - prev + cur, False
+    if prev >= WRAP32 and WRAP64 - prev + cur <= WRAP64 // 2:
+        return WRAP64 - prev + cur, False
+    return cur, True
+
+
+class InterfaceRates:
+    # Предыдущие значения хранятся по каждому интерфейсу отдельно: появившийся интерфейс (bridge docker,
+    # пересобранный bond) до следующего вызова не учитывается, исчезнувший просто выпадает —
+    # сумма по хосту не прыгает и не уходит в минус.
+    def __init__(self):
+        self._prev: Dict[str, Tuple[int, ...]] = {}
+        self._at: Optional[float] = None
+
+    def update(self, counters: Dict[str, object], now: Optional[float] = None) -> Tuple[float, Dict[str, dict]]:
+        # counters — {интерфейс: счётчики с полями как у psutil}; now — момент чтения счётчиков (monotonic).
+        # Возвращает (секунд с прошлого вызова, {интерфейс: {rx_bytes..., rx_bps..., reset}})
+        now = time.monotonic() if now is None else now
+        cur = {name: _COUNTERS(io) for name, io in counters.items()}
+        prev, self._prev = self._prev, cur
+        elapsed = now - self._at if self._at is not None else 0.0
+        self._at = now
+        rates: Dict[str, dict] = {}
+        if elapsed <= 0:
+            return 0.0, rates
+        for name, values in cur.items():
+            before = prev.get(name)
+            if before is None:
+                continue
+            row = {"reset": False}
+            for (_, delta_name, rate_name), a, b in zip(FIELDS, before, values):
+                delta, reset = counter_delta(a, b)
+                row[delta_name] = delta
+                row[rate_name] = round(delta / elapsed, 2)
+                row["reset"] = row["reset"] or reset
+            rates[name] = row
+        return elapsed, rates
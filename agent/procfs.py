@@ -0,0 +1,271 @@
+"""Быстрое чтение /proc без psutil: дескрипторы открыты постоянно, один pread в переиспользуемый буфер, кэш на цикл сбора."""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from collections import namedtuple
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+CLK_TCK = float(os.sysconf("SC_CLK_TCK")) if hasattr(os, "sysconf") else 100.0
+SECTOR_SIZE = 512  # /proc/diskstats считает в 512-байтных секторах независимо от устройства
+
+CpuTimes = namedtuple("CpuTimes", "user nice system idle iowait irq softirq steal guest guest_nice")
+NetIO = namedtuple("NetIO", "bytes_recv packets_recv errin dropin bytes_sent packets_sent errout dropout")
+DiskIO = namedtuple("DiskIO", "read_count read_merged read_bytes read_time "
+                              "write_count write_merged write_bytes write_time in_flight busy_time weighted_time")
+IfState = namedtuple("IfState", "isup speed mtu")
+VirtualMemory = namedtuple("VirtualMemory", "total available used free percent")
+SwapMemory = namedtuple("SwapMemory", "total used free percent")
+# Строки /proc/stat после cpu*: intr — первое число (всего прерываний), остальные — одно значение
+STAT_COUNTERS = frozenset({"intr", "ctxt", "processes", "procs_running", "procs_blocked"})
+PSI_RESOURCES = ("cpu", "memory", "io")
+
+
+def available(root: str = "/proc") -> bool:
+    return sys.platform.startswith("linux") and os.path.exists(os.path.join(root, "stat"))
+
+
+class ProcFile:
+    # Файл открывается один раз; каждое чтение — pread(2) с нулевого смещения в тот же bytearray:
+    # seq_file ядра на смещении 0 формирует содержимое заново. Буфер растёт, пока файл не влезет целиком.
+    # Исчезнувший файл (интерфейс удалён) переоткрывается при следующем чтении.
+    def __init__(self, path: str, size: int = 4096):
+        self.path = path
+        self._buf = bytearray(size)
+        self._fd: Optional[int] = None
+        self._lock = Lock()
+
+    def read(self) -> bytes:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._fd is None:
+                        self._fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_CLOEXEC", 0))
+                    while True:
+                        size = os.preadv(self._fd, [self._buf], 0)
+                        if size < len(self._buf):
+                            return bytes(memoryview(self._buf)[:size])
+                        self._buf = bytearray(len(self._buf) * 2)
+                except OSError:
+                    self._close()
+                    if attempt:
+                        raise
+            raise OSError(f"cannot read {self.path}")
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class ProcFS:
+    # Разобранные значения кэшируются на max_age секунд: коллекторы одного цикла (метрики, сэмплер,
+    # интерфейсы) читают /proc/net/dev и /proc/stat один раз, а не каждый своим вызовом psutil
+    def __init__(self, root: str = "/proc", sys_root: str = "/sys", max_age: float = 1.0):
+        self.root = root
+        self.sys_root = sys_root
+        self.max_age = max_age
+        self._files: Dict[str, ProcFile] = {}
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._lock = Lock()
+        self._block_devices: Tuple[float, frozenset] = (0.0, frozenset())
+
+    def _read(self, path: str) -> str:
+        with self._lock:
+            handle = self._files.get(path)
+            if handle is None:
+                handle = self._files[path] = ProcFile(path)
+        return handle.read().decode("ascii", "replace")
+
+    def _cached_at(self, key: str, parse: Callable[[], object]) -> Tuple[float, object]:
+        # (момент чтения по time.monotonic, значение) одной парой из кэша: скорости нормируются по моменту
+        # чтения, а не вызова — значение могло полежать в кэше до max_age, а сэмплер — обновить его между
+        # двумя отдельными обращениями за значением и за временем
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit is not None and now - hit[0] < self.max_age:
+            return hit
+        hit = (now, parse())
+        with self._lock:
+            self._cache[key] = hit
+        return hit
+
+    def _cached(self, key: str, parse: Callable[[], object]):
+        return self._cached_at(key, parse)[1]
+
+    def _stat(self) -> Tuple[CpuTimes, List[CpuTimes], Dict[str, int]]:
+        # /proc/stat целиком за одно чтение: времена CPU (секунды с загрузки) и счётчики планировщика
+        def parse():
+            total, cores, counters = None, [], {}
+            for line in self._read(os.path.join(self.root, "stat")).splitlines():
+                if line.startswith("cpu"):
+                    parts = line.split()
+                    values = [int(v) / CLK_TCK for v in parts[1:11]]
+                    values += [0.0] * (10 - len(values))
+                    if parts[0] == "cpu":
+                        total = CpuTimes(*values)
+                    else:
+                        cores.append(CpuTimes(*values))
+                    continue
+                name, _, rest = line.partition(" ")
+                if name in STAT_COUNTERS and rest:
+                    # У intr за суммой идут сотни чисел по линиям — их не разбираем
+                    counters[name] = int(rest.split(None, 1)[0])
+            if total is None:
+                raise OSError("no cpu line in /proc/stat")
+            return total, cores, counters
+        return self._cached("stat", parse)
+
+    def cpu_times(self) -> Tuple[CpuTimes, List[CpuTimes]]:
+        # (всего, по ядрам)
+        total, cores, _ = self._stat()
+        return total, cores
+
+    def stat_counters(self) -> Dict[str, int]:
+        # ctxt, intr, processes (fork с загрузки) — накопленные; procs_running, procs_blocked — текущие
+        return self._stat()[2]
+
+    def pressure(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        # PSI: {cpu|memory|io: {some|full: {avg10, avg60, avg300 (%), total (мкс простоя с загрузки)}}}.
+        # Ядро без PSI (нет /proc/pressure или psi=0) — пустой словарь
+        def parse():
+            out = {}
+            for resource in PSI_RESOURCES:
+                try:
+                    text = self._read(os.path.join(self.root, "pressure", resource))
+                except OSError:
+                    continue
+                kinds = {}
+                for line in text.splitlines():
+                    kind, _, rest = line.partition(" ")
+                    values = dict(field.split("=", 1) for field in rest.split() if "=" in field)
+                    if "total" in values:
+                        kinds[kind] = {
+                            "avg10": float(values.get("avg10", 0)),
+                            "avg60": float(values.get("avg60", 0)),
+                            "avg300": float(values.get("avg300", 0)),
+                            "total": int(values["total"]),
+                        }
+                if kinds:
+                    out[resource] = kinds
+            return out
+        return self._cached("pressure", parse)
+
+    def meminfo(self) -> Dict[str, int]:
+        # Поля /proc/meminfo в байтах
+        def parse():
+            out = {}
+            for line in self._read(os.path.join(self.root, "meminfo")).splitlines():
+                name, _, rest = line.partition(":")
+                fields = rest.split()
+                if fields:
+                    out[name] = int(fields[0]) * (1024 if len(fields) > 1 else 1)
+            return out
+        return self._cached("meminfo", parse)
+
+    def virtual_memory(self) -> VirtualMemory:
+        # Как psutil: used = total - available, percent — от total
+        mem = self.meminfo()
+        total = mem.get("MemTotal", 0)
+        free = mem.get("MemFree", 0)
+        avail = mem.get("MemAvailable")
+        if avail is None:
+            avail = free + mem.get("Buffers", 0) + mem.get("Cached", 0) + mem.get("SReclaimable", 0)
+        avail = min(avail, total)
+        used = total - avail
+        return VirtualMemory(total, avail, used, free, round(100.0 * used / total, 1) if total else 0.0)
+
+    def swap_memory(self) -> SwapMemory:
+        mem = self.meminfo()
+        total = mem.get("SwapTotal", 0)
+        free = mem.get("SwapFree", 0)
+        used = max(0, total - free)
+        return SwapMemory(total, used, free, round(100.0 * used / total, 1) if total else 0.0)
+
+    def loadavg(self) -> Tuple[float, float, float]:
+        def parse():
+            parts = self._read(os.path.join(self.root, "loadavg")).split()
+            return float(parts[0]), float(parts[1]), float(parts[2])
+        return self._cached("loadavg", parse)
+
+    def net_dev(self) -> Dict[str, NetIO]:
+        return self.net_dev_at()[1]
+
+    def net_dev_at(self) -> Tuple[float, Dict[str, NetIO]]:
+        # (момент чтения, счётчики по интерфейсам) — для скоростей
+        def parse():
+            out = {}
+            for line in self._read(os.path.join(self.root, "net", "dev")).splitlines()[2:]:
+                name, sep, rest = line.partition(":")
+                if not sep:
+                    continue
+                f = rest.split()
+                if len(f) < 12:
+                    continue
+                out[name.strip()] = NetIO(int(f[0]), int(f[1]), int(f[2]), int(f[3]),
+                                          int(f[8]), int(f[9]), int(f[10]), int(f[11]))
+            return out
+        return self._cached_at("net_dev", parse)
+
+    def diskstats(self) -> Dict[str, DiskIO]:
+        # Все строки /proc/diskstats (диски и разделы); байты вместо секторов
+        def parse():
+            out = {}
+            for line in self._read(os.path.join(self.root, "diskstats")).splitlines():
+                f = line.split()
+                if len(f) < 14:
+                    continue
+                v = [int(x) for x in f[3:14]]
+                out[f[2]] = DiskIO(v[0], v[1], v[2] * SECTOR_SIZE, v[3], v[4], v[5], v[6] * SECTOR_SIZE,
+                                   v[7], v[8], v[9], v[10])
+            return out
+        return self._cached("diskstats", parse)
+
+    def block_devices(self) -> frozenset:
+        # Целые диски (/sys/block), без разделов — чтобы не считать байты дважды; список живёт минуту
+        checked, names = self._block_devices
+        if time.monotonic() - checked > 60:
+            try:
+                names = frozenset(os.listdir(os.path.join(self.sys_root, "block")))
+            except OSError:
+                names = frozenset()
+            self._block_devices = (time.monotonic(), names)
+        return names
+
+    def disk_totals(self) -> Optional[DiskIO]:
+        stats = self.diskstats()
+        disks = self.block_devices()
+        rows = [io for name, io in stats.items() if name in disks] if disks else list(stats.values())
+        if not rows:
+            return None
+        return DiskIO(*(sum(col) for col in zip(*rows)))
+
+    @staticmethod
+    def _read_once(path: str) -> str:
+        # Файлы интерфейсов не держим открытыми: veth появляются и исчезают, дескрипторы бы копились
+        with open(path, "rb", buffering=0) as fh:
+            return fh.read(256).decode("ascii", "replace")
+
+    def iface_state(self, name: str) -> Optional[IfState]:
+        # /sys/class/net/<if>: flags & IFF_UP (как SIOCGIFFLAGS у psutil), speed (Мбит/с, -1 у виртуальных), mtu
+        base = os.path.join(self.sys_root, "class", "net", name)
+        try:
+            flags = int(self._read_once(os.path.join(base, "flags")).strip(), 16)
+            mtu = int(self._read_once(os.path.join(base, "mtu")).strip() or 0)
+        except (OSError, ValueError):
+            return None
+        try:
+            speed = max(0, int(self._read_once(os.path.join(base, "speed")).strip() or 0))
+        except (OSError, ValueError):
+            speed = 0  # speed у выключенного или виртуального интерфейса читается с EINVAL
+        return IfState(bool(flags & 0x1), speed, mtu)
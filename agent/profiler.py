@@ -0,0 +1,101 @@
+"""Сэмплирующий профайлер потоков агента по запросу: свёрнутые стеки (collapsed) для flame graph."""
+from __future__ import annotations
+
+import collections
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+MAX_SECONDS = 300.0
+
+
+def _thread_cpu(ident: int) -> Optional[float]:
+    # CPU-время потока по его pthread id; None — платформа не умеет (тогда только wall-профиль)
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _stack(frame, max_depth: int) -> str:
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        parts.append(_frame_label(frame))
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+def sample(seconds: float, interval: float = 0.01, max_depth: int = 64,
+           should_stop: Optional[Callable[[], bool]] = None, max_stacks: int = 2000) -> dict:
+    # Раз в interval снимает стеки всех потоков, кроме своего, через sys._current_frames().
+    # Ничего не запускается заранее: поток профайлера живёт только на время запроса.
+    # wall — все выборки (включая ожидание в sleep/select), cpu — только те, где поток
+    # успел потратить CPU с прошлой выборки: по ним и видно, что жжёт процессор.
+    seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+    interval = max(0.001, float(interval))
+    me = threading.get_ident()
+    wall: Dict[str, int] = collections.Counter()
+    cpu: Dict[str, int] = collections.Counter()
+    per_thread: Dict[str, int] = collections.Counter()
+    last_cpu: Dict[int, Optional[float]] = {}
+    cpu_supported = _thread_cpu(me) is not None
+    samples = 0
+    overhead = 0.0
+    started = time.monotonic()
+    deadline = started + seconds
+    next_at = started
+    while True:
+        now = time.monotonic()
+        if now >= deadline or (should_stop is not None and should_stop()):
+            break
+        if now < next_at:
+            time.sleep(next_at - now)
+            continue
+        next_at += interval
+        tick = time.perf_counter()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            name = names.get(ident, f"thread-{ident}").replace(";", "_").replace(" ", "_")
+            key = name + ";" + _stack(frame, max_depth)
+            wall[key] += 1
+            per_thread[name] += 1
+            if cpu_supported:
+                used = _thread_cpu(ident)
+                prev = last_cpu.get(ident)
+                last_cpu[ident] = used
+                if used is not None and prev is not None and used > prev:
+                    cpu[key] += 1
+        samples += 1
+        overhead += time.perf_counter() - tick
+    elapsed = time.monotonic() - started
+
+    def folded(counter) -> str:
+        # Формат flamegraph.pl / speedscope: "поток;кадр;...;кадр N", самые частые сверху
+        return "\n".join(f"{stack} {n}" for stack, n in counter.most_common(max_stacks))
+
+    self_time: Dict[str, int] = collections.Counter()
+    for stack, n in (cpu if cpu_supported else wall).items():
+        self_time[stack.rsplit(";", 1)[-1]] += n
+    return {
+        "seconds": round(elapsed, 3),
+        "interval": interval,
+        "samples": samples,
+        "overhead_seconds": round(overhead, 4),
+        "pid": os.getpid(),
+        "cpu_supported": cpu_supported,
+        "threads": dict(per_thread),
+        "top": self_time.most_common(25),
+        "folded": folded(wall),
+        "folded_cpu": folded(cpu) if cpu_supported else "",
+        "truncated": len(wall) > max_stacks,
+    }
@@ -0,0 +1,162 @@
+"""Политика повторов агента: экспоненциальный backoff с full jitter, circuit breaker на эндпоинт, фоновая очередь повторов."""
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import time
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class Backoff:
+    # Full jitter: задержка равномерно в [0, min(cap, base * 2^attempt)] — агенты многих нод,
+    # потерявшие мастера одновременно, не возвращаются к нему синхронной волной
+    def __init__(self, base: float = 1.0, cap: float = 60.0, rand: Callable[[], float] = random.random):
+        self.base = max(0.01, float(base))
+        self.cap = max(self.base, float(cap))
+        self.rand = rand
+
+    def ceiling(self, attempt: int) -> float:
+        return min(self.cap, self.base * (2 ** min(max(0, attempt), 30)))
+
+    def delay(self, attempt: int) -> float:
+        return self.rand() * self.ceiling(attempt)
+
+
+class CircuitBreaker:
+    # closed -> (threshold подряд неудач) -> open -> (по истечении паузы) half-open: пропускаем
+    # ровно один пробный запрос; успех закрывает цепь, неудача открывает её снова на паузу дольше.
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, threshold: int = 3, backoff: Optional[Backoff] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = max(1, int(threshold))
+        self.backoff = backoff or Backoff(5.0, 120.0)
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.rejected = 0
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() >= self.open_until:
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trips = 0
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                # Пауза не меньше половины потолка: иначе jitter может дать почти нулевое окно
+                ceiling = self.backoff.ceiling(self.trips)
+                self.open_until = self.clock() + ceiling / 2 + self.backoff.rand() * ceiling / 2
+                self.trips += 1
+                self.state = self.OPEN
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(0.0, self.open_until - self.clock()) if self.state == self.OPEN else 0.0
+
+
+class Breakers:
+    # Реестр выключателей по эндпоинту (схема + хост + путь, без query): мёртвый ingest.php
+    # не мешает heartbeat'у, а недоступный мастер целиком быстро открывает все цепи
+    def __init__(self, factory: Callable[[], CircuitBreaker]):
+        self.factory = factory
+        self._items: Dict[str, CircuitBreaker] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def key(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+    def get(self, url: str) -> CircuitBreaker:
+        key = self.key(url)
+        with self._lock:
+            breaker = self._items.get(key)
+            if breaker is None:
+                breaker = self._items[key] = self.factory()
+            return breaker
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            items = list(self._items.items())
+        return {k: {"state": b.state, "failures": b.failures, "rejected": b.rejected} for k, b in items}
+
+
+class RetryQueue:
+    # Фоновые повторы разовых запросов (результаты команд, статусы, отчёты): цикл сбора
+    # не спит на повторах. send(item) -> True, если доставлено. hold(item) -> секунды, которые запись
+    # должна подождать, не тратя попытку (открытый circuit breaker: запрос всё равно не ушёл бы).
+    # Очередь ограничена: при переполнении вытесняется запись с самым поздним сроком.
+    def __init__(self, send: Callable[[Any], bool], backoff: Backoff, max_attempts: int = 5,
+                 max_items: int = 500, log: Callable[[str], None] = print,
+                 hold: Optional[Callable[[Any], float]] = None):
+        self.send = send
+        self.hold = hold
+        self.backoff = backoff
+        self.max_attempts = max(1, int(max_attempts))
+        self.max_items = max(1, int(max_items))
+        self.log = log
+        self.dropped = 0
+        self._heap: List[Tuple[float, int, int, Any]] = []
+        self._seq = itertools.count()
+        self._cond = Condition()
+        self._thread: Optional[Thread] = None
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def put(self, item: Any, attempt: int = 1, delay: Optional[float] = None) -> None:
+        due = time.monotonic() + (self.backoff.delay(attempt) if delay is None else delay)
+        with self._cond:
+            if len(self._heap) >= self.max_items:
+                self._heap.remove(max(self._heap))
+                heapq.heapify(self._heap)
+                self.dropped += 1
+            heapq.heappush(self._heap, (due, next(self._seq), attempt, item))
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="retry-queue", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _due, _seq, attempt, item = heapq.heappop(self._heap)
+            held = self.hold(item) if self.hold is not None else 0.0
+            if held > 0:
+                # Разброс, чтобы накопленные записи не ушли разом в первый же пробный запрос
+                self.put(item, attempt, held + self.backoff.rand() * self.backoff.base)
+                continue
+            try:
+                ok = self.send(item)
+            except Exception as e:
+                self.log(f"retry queue: send failed: {e}")
+                ok = False
+            if ok:
+                continue
+            if attempt >= self.max_attempts:
+                self.dropped += 1
+                self.log(f"retry queue: giving up after {attempt} attempts")
+                continue
+            self.put(item, attempt + 1)
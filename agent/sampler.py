@@ -0,0 +1,120 @@
+"""Частые выборки дешёвых счётчиков хоста в кольцевые буферы и агрегаты (min/max/avg/p95/last) за интервал сбора."""
+from __future__ import annotations
+
+import time
+from array import array
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+# read() -> (gauges, counters): гейджи пишутся как есть, накопительные счётчики — скоростью в секунду
+Reading = Tuple[Dict[str, float], Dict[str, float]]
+
+
+class Ring:
+    # Кольцо фиксированного размера на array('d'): память не растёт, сколько бы выборок ни пришло.
+    # written — сквозной номер записи; читатель помнит, до какого номера уже забрал значения.
+    __slots__ = ("values", "capacity", "written")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self.values = array("d", bytes(8 * self.capacity))
+        self.written = 0
+
+    def append(self, value: float) -> None:
+        self.values[self.written % self.capacity] = value
+        self.written += 1
+
+    def since(self, mark: int) -> List[float]:
+        # Значения с номера mark; то, что успели перезаписать, потеряно (окно ограничено capacity)
+        start = max(mark, self.written - self.capacity)
+        return [self.values[i % self.capacity] for i in range(start, self.written)]
+
+
+def aggregate(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "min": round(ordered[0], 2),
+        "max": round(ordered[-1], 2),
+        "avg": round(sum(ordered) / len(ordered), 2),
+        "p95": round(p95, 2),
+        "last": round(values[-1], 2),
+    }
+
+
+class Sampler:
+    # Поток выборок раз в period секунд. drain() отдаёт агрегаты по каждой серии с прошлого drain().
+    # Счётчик, ушедший назад (переполнение, сброс интерфейса), пропускает одну точку.
+    def __init__(self, read: Callable[[], Reading], period: float = 5.0, capacity: int = 720,
+                 log: Callable[[str], None] = print):
+        self.read = read
+        self.period = max(0.5, float(period))
+        self.capacity = max(2, int(capacity))
+        self.log = log
+        self.samples = 0
+        self.busy_seconds = 0.0
+        self._rings: Dict[str, Ring] = {}
+        self._marks: Dict[str, int] = {}
+        self._prev: Optional[Tuple[float, Dict[str, float]]] = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="sampler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _ring(self, name: str) -> Ring:
+        ring = self._rings.get(name)
+        if ring is None:
+            ring = self._rings[name] = Ring(self.capacity)
+            self._marks[name] = 0
+        return ring
+
+    def sample(self) -> None:
+        started = time.thread_time()
+        now = time.monotonic()
+        gauges, counters = self.read()
+        prev, self._prev = self._prev, (now, counters)
+        with self._lock:
+            for name, value in gauges.items():
+                self._ring(name).append(float(value))
+            if prev is not None and now > prev[0]:
+                elapsed = now - prev[0]
+                for name, value in counters.items():
+                    before = prev[1].get(name)
+                    if before is not None and value >= before:
+                        self._ring(name).append((value - before) / elapsed)
+            self.samples += 1
+        self.busy_seconds += time.thread_time() - started
+
+    def drain(self) -> dict:
+        # {серия: {min, max, avg, p95, last}} за время с прошлого вызова; пустые серии не попадают
+        with self._lock:
+            out = {}
+            for name, ring in self._rings.items():
+                stats = aggregate(ring.since(self._marks[name]))
+                self._marks[name] = ring.written
+                if stats is not None:
+                    out[name] = stats
+        return out
+
+    def _run(self) -> None:
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                self.log(f"sampler: read failed: {e}")
+            next_at += self.period
+            delay = next_at - time.monotonic()
+            if delay <= 0:
+                next_at = time.monotonic()
+                delay = 0
+            self._stop.wait(delay)
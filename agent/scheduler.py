@@ -0,0 +1,86 @@
+"""Планировщик коллекторов агента: у каждой задачи свой период и срок на monotonic-часах."""
+from __future__ import annotations
+
+import os
+import time
+from typing import Callable, List, Optional
+
+
+def interval_from_env(name: str, default: float) -> float:
+    # Период задачи из окружения (секунды); мусор и <= 0 — берём default
+    raw = os.getenv(name, "")
+    try:
+        value = float(raw) if raw.strip() else float(default)
+    except ValueError:
+        value = float(default)
+    return value if value > 0 else float(default)
+
+
+class Task:
+    # Периодическая задача. next_due живёт на time.monotonic(), поэтому перевод часов
+    # и длительность самого запуска не сдвигают сетку.
+    def __init__(self, name: str, period: float, fn: Callable[[], None], first_due: float, timeout: Optional[float] = None):
+        self.name = name
+        self.period = max(1.0, float(period))
+        self.fn = fn
+        self.timeout = float(timeout) if timeout else self.period
+        self.next_due = first_due
+        self.last_started = 0.0
+        self.last_duration = 0.0
+        self.runs = 0
+        self.skipped = 0
+        self.timeouts = 0
+
+    def reschedule(self, now: float) -> None:
+        # Шаг строго по сетке: next_due += period. Пропущенные слоты не догоняем пачкой,
+        # а перескакиваем на ближайший будущий — интервал между выборками остаётся ровным.
+        self.next_due += self.period
+        if self.next_due <= now:
+            missed = int((now - self.next_due) // self.period) + 1
+            self.skipped += missed
+            self.next_due += missed * self.period
+
+
+class Scheduler:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.tasks: List[Task] = []
+
+    def add(self, name: str, period: float, fn: Callable[[], None], delay: float = 0.0, timeout: Optional[float] = None,
+            deferred: bool = False) -> Task:
+        # deferred — задача не созревает, пока её не запустят через release() (необязательные подсистемы)
+        first_due = float("inf") if deferred else self.clock() + max(0.0, delay)
+        task = Task(name, period, fn, first_due, timeout)
+        self.tasks.append(task)
+        return task
+
+    def release(self, name: str) -> Optional[Task]:
+        task = self.get(name)
+        if task is not None and task.next_due == float("inf"):
+            task.next_due = self.clock()
+        return task
+
+    def get(self, name: str) -> Optional[Task]:
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        return None
+
+    def due(self, now: Optional[float] = None) -> List[Task]:
+        # Созревшие задачи по сроку; при равенстве — в порядке регистрации (sorted стабилен)
+        if now is None:
+            now = self.clock()
+        return sorted((t for t in self.tasks if t.next_due <= now), key=lambda t: t.next_due)
+
+    def next_wakeup(self) -> float:
+        if not self.tasks:
+            return self.clock() + 1.0
+        wakeup = min(t.next_due for t in self.tasks)
+        return wakeup if wakeup != float("inf") else self.clock() + 1.0
+
+    def sleep_until_due(self, max_sleep: Optional[float] = None) -> None:
+        delay = self.next_wakeup() - self.clock()
+        if max_sleep is not None:
+            delay = min(delay, max_sleep)
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,167 @@
+"""Дисковый журнал (spool) выгрузок, которые не дошли до мастера: сегменты, CRC на запись, fsync."""
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import time
+import zlib
+from threading import Lock
+from typing import Iterator, List, Optional, Tuple
+
+Position = Tuple[int, int]  # (номер сегмента, смещение в байтах)
+
+
+class Spool:
+    # Append-only очередь в каталоге: seg-000000000001.log, seg-...2.log, ...
+    # Строка записи: "<crc32 hex> <json>\n". Позиция чтения — в pos.json (атомарная замена файла).
+    # Оборванный хвост после падения отрезается при открытии, битые строки пропускаются при чтении.
+    # Границы: суммарный размер (старые сегменты удаляются) и возраст записей.
+    def __init__(self, directory, max_bytes: int = 64 << 20, max_age: float = 86400.0,
+                 segment_bytes: int = 1 << 20):
+        self.dir = pathlib.Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(segment_bytes, int(max_bytes))
+        self.max_age = float(max_age)
+        self.segment_bytes = int(segment_bytes)
+        self.dropped = 0
+        self._lock = Lock()
+        self._pos: Position = self._load_pos()
+        self._repair_tail()
+
+    def _segments(self) -> List[Tuple[int, pathlib.Path]]:
+        out = []
+        for path in self.dir.glob("seg-*.log"):
+            try:
+                out.append((int(path.stem[4:]), path))
+            except ValueError:
+                continue
+        out.sort()
+        return out
+
+    def _load_pos(self) -> Position:
+        try:
+            data = json.loads((self.dir / "pos.json").read_text(encoding="utf-8"))
+            return int(data["segment"]), int(data["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _save_pos(self) -> None:
+        tmp = self.dir / "pos.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": self._pos[0], "offset": self._pos[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.dir / "pos.json")
+
+    def _repair_tail(self) -> None:
+        # Падение посреди записи оставляет строку без \n: отрезаем её, иначе следующая запись склеится с мусором
+        segments = self._segments()
+        if not segments:
+            return
+        path = segments[-1][1]
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return
+        cut = data.rfind(b"\n") + 1
+        if cut < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(cut)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _encode(record: dict) -> bytes:
+        body = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return b"%08x " % zlib.crc32(body) + body + b"\n"
+
+    @staticmethod
+    def _decode(line: bytes) -> Optional[dict]:
+        if len(line) < 10 or not line.endswith(b"\n"):
+            return None
+        crc, body = line[:8], line[9:-1]
+        try:
+            if int(crc, 16) != zlib.crc32(body):
+                return None
+            record = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
+
+    def append(self, record: dict) -> None:
+        record.setdefault("t", time.time())
+        data = self._encode(record)
+        with self._lock:
+            segments = self._segments()
+            if segments and segments[-1][1].stat().st_size + len(data) <= self.segment_bytes:
+                path = segments[-1][1]
+            else:
+                seq = max(segments[-1][0] if segments else 0, self._pos[0]) + 1
+                path = self.dir / f"seg-{seq:012d}.log"
+            with open(path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._enforce_bounds()
+
+    def _enforce_bounds(self) -> None:
+        segments = self._segments()
+        sizes = {seq: path.stat().st_size for seq, path in segments}
+        total = sum(sizes.values())
+        cutoff = time.time() - self.max_age
+        # Последний (активный) сегмент не трогаем
+        for seq, path in segments[:-1]:
+            too_big = total > self.max_bytes
+            too_old = path.stat().st_mtime < cutoff
+            if not too_big and not too_old:
+                break
+            total -= sizes[seq]
+            self.dropped += 1
+            path.unlink(missing_ok=True)
+            if self._pos[0] <= seq:
+                self._pos = (seq + 1, 0)
+                self._save_pos()
+
+    def _scan(self, pos: Position) -> Iterator[Tuple[Position, dict]]:
+        # Записи после pos по порядку; для каждой — позиция сразу за ней
+        cutoff = time.time() - self.max_age
+        for seq, path in self._segments():
+            if seq < pos[0]:
+                continue
+            offset = pos[1] if seq == pos[0] else 0
+            try:
+                with open(path, "rb") as f:
+                    f.seek(offset)
+                    for line in f:
+                        offset += len(line)
+                        record = self._decode(line)
+                        if record is None or float(record.get("t", 0)) < cutoff:
+                            continue
+                        yield (seq, offset), record
+            except OSError:
+                continue
+
+    def peek(self) -> Optional[Tuple[Position, dict]]:
+        with self._lock:
+            for item in self._scan(self._pos):
+                return item
+        return None
+
+    def records(self) -> List[dict]:
+        with self._lock:
+            return [record for _pos, record in self._scan(self._pos)]
+
+    def commit(self, pos: Position) -> None:
+        # Запись до pos обработана: двигаем позицию, полностью прочитанные сегменты удаляем
+        with self._lock:
+            self._pos = pos
+            self._save_pos()
+            segments = self._segments()
+            for seq, path in segments[:-1]:
+                if seq < pos[0] or (seq == pos[0] and pos[1] >= path.stat().st_size):
+                    path.unlink(missing_ok=True)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(path.stat().st_size for _seq, path in self._segments())
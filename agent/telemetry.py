@@ -0,0 +1,211 @@
+"""Самонаблюдение агента: счётчики и гистограммы с фиксированными корзинами, вывод в Prometheus text и JSON."""
+from __future__ import annotations
+
+import bisect
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Корзины времени (секунды): от миллисекунд сериализации до минутного docker stats
+TIME_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Корзины размера тела запроса (байты)
+SIZE_BUCKETS: Tuple[float, ...] = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(values: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = ((k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    # Метрики объявляются один раз (имя, тип, описание); значения — по набору меток.
+    # Гейджи не хранятся: их значение считывает функция в момент выдачи /metrics.
+    def __init__(self, prefix: str = "agent_"):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = Lock()
+        self._meta: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], Dict[Labels, float]]] = {}
+        self._vars: Dict[str, Callable[[], object]] = {}
+
+    def counter(self, name: str, help_text: str) -> None:
+        with self._lock:
+            self._meta[name] = ("counter", help_text, ())
+            self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = TIME_BUCKETS) -> None:
+        with self._lock:
+            self._meta[name] = ("histogram", help_text, tuple(sorted(buckets)))
+            self._histograms.setdefault(name, {})
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], object]) -> None:
+        # fn() -> число либо список (метки dict, значение)
+        def read() -> Dict[Labels, float]:
+            value = fn()
+            if isinstance(value, (int, float)):
+                return {(): float(value)}
+            return {_labels(labels): float(v) for labels, v in value}
+        with self._lock:
+            self._meta[name] = ("gauge", help_text, ())
+            self._gauges[name] = read
+
+    def debug_var(self, name: str, fn: Callable[[], object]) -> None:
+        # Дополнительный раздел /debug/vars (очереди, breaker'ы, состояние spool)
+        with self._lock:
+            self._vars[name] = fn
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            family = self._counters.get(name)
+            if family is None:
+                return
+            family[key] = family.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            family = self._histograms.get(name)
+            if family is None:
+                return
+            buckets = self._meta[name][2]
+            hist = family.get(key)
+            if hist is None:
+                hist = family[key] = _Histogram(len(buckets))
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                hist.counts[index] += 1
+            hist.sum += value
+            hist.count += 1
+
+    def time(self, name: str, **labels) -> "_Timer":
+        return _Timer(self, name, labels)
+
+    def render(self) -> str:
+        # Prometheus text exposition format 0.0.4
+        with self._lock:
+            meta = dict(self._meta)
+            counters = {n: dict(f) for n, f in self._counters.items()}
+            histograms = {n: {k: (list(h.counts), h.sum, h.count) for k, h in f.items()} for n, f in self._histograms.items()}
+            gauges = dict(self._gauges)
+        lines: List[str] = []
+        for name in sorted(meta):
+            kind, help_text, buckets = meta[name]
+            full = self.prefix + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == "counter":
+                for labels, value in sorted(counters.get(name, {}).items()):
+                    lines.append(f"{full}{_fmt_labels(labels)} {_fmt_value(value)}")
+            elif kind == "gauge":
+                try:
+                    values = gauges[name]()
+                except Exception:
+                    values = {}
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{full}{_fmt_labels(labels)} {_fmt_value(value)}")
+            else:
+                for labels, (counts, total, count) in sorted(histograms.get(name, {}).items()):
+                    running = 0
+                    for bound, n in zip(buckets, counts):
+                        running += n
+                        lines.append(f"{full}_bucket{_fmt_labels(labels, ('le', _fmt_value(bound)))} {running}")
+                    lines.append(f"{full}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {count}")
+                    lines.append(f"{full}_sum{_fmt_labels(labels)} {_fmt_value(round(total, 6))}")
+                    lines.append(f"{full}_count{_fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        # JSON-вид для /debug/vars: счётчики, гистограммы с перцентилями по корзинам, гейджи и доп. разделы
+        def key(labels: Labels) -> str:
+            return ",".join(f"{k}={v}" for k, v in labels) or "_"
+
+        with self._lock:
+            meta = dict(self._meta)
+            counters = {n: {key(k): v for k, v in f.items()} for n, f in self._counters.items()}
+            histograms = {}
+            for name, family in self._histograms.items():
+                buckets = meta[name][2]
+                histograms[name] = {
+                    key(k): {
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "avg": round(h.sum / h.count, 6) if h.count else None,
+                        "p50": _quantile(buckets, h, 0.5),
+                        "p95": _quantile(buckets, h, 0.95),
+                        "p99": _quantile(buckets, h, 0.99),
+                    }
+                    for k, h in family.items()
+                }
+            gauges = dict(self._gauges)
+            extra = dict(self._vars)
+        out = {"uptime_seconds": round(time.time() - self.started, 1), "counters": counters, "histograms": histograms}
+        out["gauges"] = {}
+        for name, read in gauges.items():
+            try:
+                out["gauges"][name] = {key(k): v for k, v in read().items()}
+            except Exception as e:
+                out["gauges"][name] = {"error": str(e)}
+        for name, fn in extra.items():
+            try:
+                out[name] = fn()
+            except Exception as e:
+                out[name] = {"error": str(e)}
+        return out
+
+
+def _quantile(buckets: Tuple[float, ...], hist: _Histogram, q: float) -> Optional[float]:
+    # Верхняя граница корзины, в которую попадает квантиль (None — за последней корзиной)
+    if not hist.count:
+        return None
+    target = q * hist.count
+    running = 0
+    for bound, n in zip(buckets, hist.counts):
+        running += n
+        if running >= target:
+            return bound
+    return None
+
+
+class _Timer:
+    def __init__(self, registry: Registry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.registry.observe(self.name, time.monotonic() - self.started, **self.labels)
+
+
+TELEMETRY = Registry()
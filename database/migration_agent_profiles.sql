@@ -0,0 +1,13 @@
+-- Sampling-profiler results from the agent's profile command (folded stacks); the master keeps the last 20 per node
+CREATE TABLE IF NOT EXISTS agent_profiles (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    seconds FLOAT NULL,
+    samples INT NULL,
+    summary TEXT NULL,
+    folded MEDIUMTEXT NULL,
+    folded_cpu MEDIUMTEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_agent_profiles_node (node_id, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
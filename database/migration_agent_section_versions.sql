@@ -0,0 +1,8 @@
+-- Last acknowledged delta-snapshot version per node and section (containers, ports, interfaces, upnp)
+CREATE TABLE IF NOT EXISTS agent_section_versions (
+    node_id INT NOT NULL,
+    section VARCHAR(32) NOT NULL,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (node_id, section)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
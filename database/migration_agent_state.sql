@@ -0,0 +1,5 @@
+-- Agent cycle state sent with each heartbeat: current phase, running/last cycle duration and collection period
+ALTER TABLE nodes ADD COLUMN agent_phase VARCHAR(128) NULL;
+ALTER TABLE nodes ADD COLUMN agent_cycle_seconds FLOAT NULL;
+ALTER TABLE nodes ADD COLUMN agent_last_cycle_seconds FLOAT NULL;
+ALTER TABLE nodes ADD COLUMN agent_cycle_interval FLOAT NULL;
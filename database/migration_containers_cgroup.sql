@@ -0,0 +1,6 @@
+-- Container resources read by the agent from cgroup v2: memory bytes/limit, block I/O rates and pid count
+ALTER TABLE containers ADD COLUMN memory_usage BIGINT NULL;
+ALTER TABLE containers ADD COLUMN memory_limit BIGINT NULL;
+ALTER TABLE containers ADD COLUMN block_read_bps DOUBLE NULL;
+ALTER TABLE containers ADD COLUMN block_write_bps DOUBLE NULL;
+ALTER TABLE containers ADD COLUMN pids INT NULL;
@@ -0,0 +1,16 @@
+-- Per-device disk I/O (bytes/s, IOPS, await, utilisation) computed by the agent from /proc/diskstats deltas
+CREATE TABLE IF NOT EXISTS disk_io_metrics (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT,
+    device VARCHAR(64),
+    read_bps DOUBLE,
+    write_bps DOUBLE,
+    read_iops FLOAT,
+    write_iops FLOAT,
+    await_ms FLOAT,
+    util FLOAT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
+    INDEX idx_node_ts (node_id, timestamp),
+    INDEX idx_timestamp (timestamp)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
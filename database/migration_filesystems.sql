@@ -0,0 +1,20 @@
+-- Per-mount filesystem usage (bytes and inodes) reported by the agent; current state, replaced on each upload
+CREATE TABLE IF NOT EXISTS filesystem_usage (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT,
+    mount VARCHAR(512),
+    device VARCHAR(255),
+    fstype VARCHAR(32),
+    network TINYINT(1) DEFAULT 0,
+    stale TINYINT(1) DEFAULT 0,
+    total BIGINT NULL,
+    used BIGINT NULL,
+    free BIGINT NULL,
+    percent FLOAT NULL,
+    inodes_total BIGINT NULL,
+    inodes_used BIGINT NULL,
+    inodes_percent FLOAT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
+    INDEX idx_node_id (node_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,7 @@
+-- Per-process and per-container GPU memory/utilisation attributed by the agent (NVML or nvidia-smi)
+ALTER TABLE processes ADD COLUMN gpu_memory BIGINT NULL;
+ALTER TABLE processes ADD COLUMN gpu_util FLOAT NULL;
+ALTER TABLE processes ADD COLUMN container_id VARCHAR(64) NULL;
+ALTER TABLE containers ADD COLUMN gpu_memory BIGINT NULL;
+ALTER TABLE containers ADD COLUMN gpu_util FLOAT NULL;
+ALTER TABLE containers ADD COLUMN gpu_pids INT NULL;
@@ -0,0 +1,11 @@
+-- GPU power, clocks, ECC error counters and fan speed from the agent's NVML / nvidia-smi stream
+ALTER TABLE gpu_metrics ADD COLUMN uuid VARCHAR(64) NULL;
+ALTER TABLE gpu_metrics ADD COLUMN memory_utilization FLOAT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN power_watts FLOAT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN power_limit_watts FLOAT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN clock_graphics_mhz INT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN clock_sm_mhz INT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN clock_memory_mhz INT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN ecc_corrected BIGINT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN ecc_uncorrected BIGINT NULL;
+ALTER TABLE gpu_metrics ADD COLUMN fan_percent FLOAT NULL;
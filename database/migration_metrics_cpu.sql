@@ -0,0 +1,7 @@
+-- CPU breakdown computed by the agent from /proc/stat deltas over the whole collection interval
+ALTER TABLE metrics ADD COLUMN cpu_user FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN cpu_system FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN cpu_iowait FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN cpu_steal FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN cpu_irq FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN cpu_per_core TEXT NULL;
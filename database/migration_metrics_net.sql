@@ -0,0 +1,4 @@
+-- Host traffic in bytes/s and per-interface counters/rates computed by the agent from /proc/net/dev deltas
+ALTER TABLE metrics ADD COLUMN network_in_rate DOUBLE NULL;
+ALTER TABLE metrics ADD COLUMN network_out_rate DOUBLE NULL;
+ALTER TABLE metrics ADD COLUMN net_interfaces TEXT NULL;
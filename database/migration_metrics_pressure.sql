@@ -0,0 +1,13 @@
+-- Saturation signals: 5/15-minute load, runnable/blocked tasks, context-switch/interrupt rates and PSI stall shares
+ALTER TABLE metrics ADD COLUMN load_avg5 FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN load_avg15 FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN procs_running INT NULL;
+ALTER TABLE metrics ADD COLUMN procs_blocked INT NULL;
+ALTER TABLE metrics ADD COLUMN ctxt_rate DOUBLE NULL;
+ALTER TABLE metrics ADD COLUMN intr_rate DOUBLE NULL;
+ALTER TABLE metrics ADD COLUMN psi_cpu_some FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN psi_memory_some FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN psi_memory_full FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN psi_io_some FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN psi_io_full FLOAT NULL;
+ALTER TABLE metrics ADD COLUMN pressure TEXT NULL;
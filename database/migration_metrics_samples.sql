@@ -0,0 +1,2 @@
+-- Per-interval aggregates (min/max/avg/p95/last) of the agent's high-resolution samples, JSON
+ALTER TABLE metrics ADD COLUMN samples TEXT NULL;
@@ -26,6 +26,10 @@ CREATE TABLE IF NOT EXISTS nodes (
     command_status VARCHAR(20) DEFAULT 'pending',
     command_timestamp TIMESTAMP NULL,
     command_result TEXT NULL,
+    agent_phase VARCHAR(128) NULL,
+    agent_cycle_seconds FLOAT NULL,
+    agent_last_cycle_seconds FLOAT NULL,
+    agent_cycle_interval FLOAT NULL,
     INDEX idx_status (status),
     INDEX idx_provider (provider_name)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -57,6 +61,28 @@ CREATE TABLE IF NOT EXISTS metrics (
     swap_percent FLOAT NULL,
     load_avg FLOAT NULL,
     cpu_count SMALLINT NULL,
+    cpu_user FLOAT NULL,
+    cpu_system FLOAT NULL,
+    cpu_iowait FLOAT NULL,
+    cpu_steal FLOAT NULL,
+    cpu_irq FLOAT NULL,
+    cpu_per_core TEXT NULL,
+    samples TEXT NULL,
+    network_in_rate DOUBLE NULL,
+    network_out_rate DOUBLE NULL,
+    net_interfaces TEXT NULL,
+    load_avg5 FLOAT NULL,
+    load_avg15 FLOAT NULL,
+    procs_running INT NULL,
+    procs_blocked INT NULL,
+    ctxt_rate DOUBLE NULL,
+    intr_rate DOUBLE NULL,
+    psi_cpu_some FLOAT NULL,
+    psi_memory_some FLOAT NULL,
+    psi_memory_full FLOAT NULL,
+    psi_io_some FLOAT NULL,
+    psi_io_full FLOAT NULL,
+    pressure TEXT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
     INDEX idx_node_id (node_id),
@@ -74,11 +100,57 @@ CREATE TABLE IF NOT EXISTS gpu_metrics (
     memory_used BIGINT,
     memory_total BIGINT,
     temperature FLOAT,
+    uuid VARCHAR(64) NULL,
+    memory_utilization FLOAT NULL,
+    power_watts FLOAT NULL,
+    power_limit_watts FLOAT NULL,
+    clock_graphics_mhz INT NULL,
+    clock_sm_mhz INT NULL,
+    clock_memory_mhz INT NULL,
+    ecc_corrected BIGINT NULL,
+    ecc_uncorrected BIGINT NULL,
+    fan_percent FLOAT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
     INDEX idx_node_id (node_id),
     INDEX idx_timestamp (timestamp)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+-- Таблица ввода-вывода по дискам (агент считает по приращениям /proc/diskstats)
+CREATE TABLE IF NOT EXISTS disk_io_metrics (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT,
+    device VARCHAR(64),
+    read_bps DOUBLE,
+    write_bps DOUBLE,
+    read_iops FLOAT,
+    write_iops FLOAT,
+    await_ms FLOAT,
+    util FLOAT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
+    INDEX idx_node_ts (node_id, timestamp),
+    INDEX idx_timestamp (timestamp)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+-- Таблица заполненности файловых систем (текущее состояние, по точке монтирования)
+CREATE TABLE IF NOT EXISTS filesystem_usage (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT,
+    mount VARCHAR(512),
+    device VARCHAR(255),
+    fstype VARCHAR(32),
+    network TINYINT(1) DEFAULT 0,
+    stale TINYINT(1) DEFAULT 0,
+    total BIGINT NULL,
+    used BIGINT NULL,
+    free BIGINT NULL,
+    percent FLOAT NULL,
+    inodes_total BIGINT NULL,
+    inodes_used BIGINT NULL,
+    inodes_percent FLOAT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
+    INDEX idx_node_id (node_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 -- Таблица процессов
 CREATE TABLE IF NOT EXISTS processes (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -88,6 +160,9 @@ CREATE TABLE IF NOT EXISTS processes (
     cpu_percent FLOAT,
     memory_percent FLOAT,
     status VARCHAR(20),
+    gpu_memory BIGINT NULL,
+    gpu_util FLOAT NULL,
+    container_id VARCHAR(64) NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
     INDEX idx_node_id (node_id)
@@ -107,6 +182,14 @@ CREATE TABLE IF NOT EXISTS containers (
     ipv4 VARCHAR(45) NULL,
     network_mode VARCHAR(128) NULL,
     raw_status VARCHAR(255) NULL,
+    memory_usage BIGINT NULL,
+    memory_limit BIGINT NULL,
+    block_read_bps DOUBLE NULL,
+    block_write_bps DOUBLE NULL,
+    pids INT NULL,
+    gpu_memory BIGINT NULL,
+    gpu_util FLOAT NULL,
+    gpu_pids INT NULL,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE,
     INDEX idx_node_id (node_id)
@@ -127,6 +210,27 @@ CREATE TABLE IF NOT EXISTS docker_networks (
     INDEX idx_node_id (node_id),
     FOREIGN KEY (node_id) REFERENCES nodes(id) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+-- Версии дельта-снимков секций агента (containers/ports/interfaces/upnp), к которым применяется следующая дельта
+CREATE TABLE IF NOT EXISTS agent_section_versions (
+    node_id INT NOT NULL,
+    section VARCHAR(32) NOT NULL,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (node_id, section)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+-- Профили агента (команда profile): сэмплированные стеки в folded-формате, последние 20 на ноду
+CREATE TABLE IF NOT EXISTS agent_profiles (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    node_id INT NOT NULL,
+    command VARCHAR(255) NOT NULL,
+    seconds FLOAT NULL,
+    samples INT NULL,
+    summary TEXT NULL,
+    folded MEDIUMTEXT NULL,
+    folded_cpu MEDIUMTEXT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_agent_profiles_node (node_id, created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 -- Таблица пользователей
 CREATE TABLE IF NOT EXISTS users (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -40,7 +40,7 @@ $forwardHeaders = [];
 $incomingHeaders = function_exists('getallheaders') ? getallheaders() : [];
 foreach ($incomingHeaders as $name => $value) {
     $normalized = strtolower($name);
-    if (in_array($normalized, ['content-type', 'authorization', 'accept'], true)) {
+    if (in_array($normalized, ['content-type', 'content-encoding', 'authorization', 'accept'], true)) {
         $forwardHeaders[] = $name . ': ' . $value;
     }
 }
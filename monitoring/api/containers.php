@@ -4,6 +4,8 @@ if (session_status() === PHP_SESSION_NONE) {
 }
 
 require_once __DIR__ . '/../includes/database.php';
+require_once __DIR__ . '/../includes/helpers.php';
+require_once __DIR__ . '/../includes/ingest.php';
 
 header('Content-Type: application/json; charset=utf-8');
 
@@ -39,45 +41,6 @@ if (!$isAuthorized) {
     exit;
 }
 
-function containers_ensure_schema(PDO $pdo): void
-{
-    static $done = false;
-    if ($done) {
-        return;
-    }
-    $done = true;
-
-    $alters = [
-        "ALTER TABLE containers ADD COLUMN networks TEXT NULL",
-        "ALTER TABLE containers ADD COLUMN ports TEXT NULL",
-        "ALTER TABLE containers ADD COLUMN ipv4 VARCHAR(45) NULL",
-        "ALTER TABLE containers ADD COLUMN network_mode VARCHAR(128) NULL",
-        "ALTER TABLE containers ADD COLUMN raw_status VARCHAR(255) NULL",
-    ];
-    foreach ($alters as $sql) {
-        try {
-            $pdo->exec($sql);
-        } catch (Exception $e) {
-            // column already exists
-        }
-    }
-
-    $pdo->exec("CREATE TABLE IF NOT EXISTS docker_networks (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        node_id INT NOT NULL,
-        network_id VARCHAR(64) NOT NULL,
-        name VARCHAR(255),
-        driver VARCHAR(64),
-        scope VARCHAR(32),
-        subnet VARCHAR(64),
-        gateway VARCHAR(45),
-        containers TEXT,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-        UNIQUE KEY uniq_node_net (node_id, network_id),
-        INDEX idx_node_id (node_id)
-    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
-}
-
 function containers_decode_json($value): array
 {
     if (is_array($value)) {
@@ -96,6 +59,13 @@ function containers_format_row(array $row): array
     $row['ports'] = containers_decode_json($row['ports'] ?? null);
     $row['cpu_percent'] = isset($row['cpu_percent']) ? (float)$row['cpu_percent'] : 0;
     $row['memory_percent'] = isset($row['memory_percent']) ? (float)$row['memory_percent'] : 0;
+    // null — нода без cgroup v2 (данные из docker stats) или контейнер ещё не прошёл второй сбор
+    foreach (['memory_usage', 'memory_limit', 'pids', 'gpu_memory', 'gpu_pids'] as $key) {
+        $row[$key] = isset($row[$key]) ? (int)$row[$key] : null;
+    }
+    foreach (['block_read_bps', 'block_write_bps', 'gpu_util'] as $key) {
+        $row[$key] = isset($row[$key]) ? (float)$row[$key] : null;
+    }
     return $row;
 }
 
@@ -284,7 +254,7 @@ function getContainerLogs($pdo, $nodeId, $containerId, $limit = 200) {
 function handlePost($pdo) {
     global $nodeInfo;
 
-    $raw = file_get_contents('php://input');
+    $raw = request_body();
     $data = $raw !== '' ? json_decode($raw, true) : null;
 
     if ($data === null && $raw !== '') {
@@ -360,78 +330,10 @@ function handlePost($pdo) {
     echo json_encode(['message' => 'Container updated']);
 }
 
-function replaceContainerSnapshot(PDO $pdo, int $nodeId, array $containers): void
-{
-    $deleteStmt = $pdo->prepare("DELETE FROM containers WHERE node_id = ?");
-    $deleteStmt->execute([$nodeId]);
-    if (!$containers) {
-        return;
-    }
-
-    $stmt = $pdo->prepare(
-        "INSERT INTO containers
-            (node_id, container_id, name, image, status, cpu_percent, memory_percent, networks, ports, ipv4, network_mode, raw_status)
-         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-    );
-    foreach ($containers as $container) {
-        $networks = $container['networks'] ?? [];
-        $ports = $container['ports'] ?? [];
-        $stmt->execute([
-            $nodeId,
-            $container['container_id'] ?? '',
-            $container['name'] ?? 'unknown',
-            $container['image'] ?? '',
-            $container['status'] ?? 'stopped',
-            $container['cpu_percent'] ?? 0,
-            $container['memory_percent'] ?? 0,
-            json_encode(is_array($networks) ? $networks : [], JSON_UNESCAPED_UNICODE),
-            json_encode(is_array($ports) ? $ports : [], JSON_UNESCAPED_UNICODE),
-            $container['ipv4'] ?? '',
-            $container['network_mode'] ?? '',
-            $container['raw_status'] ?? '',
-        ]);
-    }
-}
-
-function replaceNetworkSnapshot(PDO $pdo, int $nodeId, array $networks): void
-{
-    $deleteStmt = $pdo->prepare("DELETE FROM docker_networks WHERE node_id = ?");
-    $deleteStmt->execute([$nodeId]);
-    if (!$networks) {
-        return;
-    }
-
-    $stmt = $pdo->prepare(
-        "INSERT INTO docker_networks
-            (node_id, network_id, name, driver, scope, subnet, gateway, containers)
-         VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
-    );
-    foreach ($networks as $net) {
-        $members = $net['containers'] ?? $net['members'] ?? [];
-        if (!is_array($members)) {
-            $members = [];
-        }
-        $networkId = $net['network_id'] ?? $net['id'] ?? ($net['name'] ?? '');
-        if ($networkId === '') {
-            continue;
-        }
-        $stmt->execute([
-            $nodeId,
-            substr((string)$networkId, 0, 64),
-            $net['name'] ?? '',
-            $net['driver'] ?? '',
-            $net['scope'] ?? '',
-            $net['subnet'] ?? '',
-            $net['gateway'] ?? '',
-            json_encode($members, JSON_UNESCAPED_UNICODE),
-        ]);
-    }
-}
-
 function handleContainerAction($pdo) {
     $nodeId = $_GET['node_id'];
     $containerId = $_GET['container_id'];
-    $data = json_decode(file_get_contents('php://input'), true) ?: [];
+    $data = json_decode(request_body(), true) ?: [];
     $action = $data['action'] ?? ($_GET['action'] ?? '');
 
     if (!in_array($action, ['start', 'stop', 'restart', 'logs'], true)) {
@@ -0,0 +1,203 @@
+<?php
+// Единая выгрузка агента: все созревшие за цикл секции одним запросом (одна авторизация, один last_seen).
+// POST /api/ingest.php  {"v": 1, "sections": {"metrics": {...}, "processes": [...], "containers": {...},
+//                        "ports": [...], "interfaces": {...}, "upnp": {...}, "logs": [...]}}
+// Каждая секция пишется в своей транзакции; ответ — приём по секциям, агент повторяет только отвергнутые.
+// containers/ports/interfaces/upnp могут приходить дельтой: {"mode": "delta", "base": M, "version": N,
+// "<набор>": {"upsert": [...], "remove": [ключи]}}; на рассинхрон версий ответ {"ok": false, "resync": true}.
+if (session_status() === PHP_SESSION_NONE) {
+    session_start();
+}
+
+require_once __DIR__ . '/../includes/database.php';
+require_once __DIR__ . '/../includes/helpers.php';
+require_once __DIR__ . '/../includes/retention.php';
+require_once __DIR__ . '/../includes/ingest.php';
+require_once __DIR__ . '/../includes/upnp_store.php';
+
+header('Content-Type: application/json; charset=utf-8');
+
+$method = $_SERVER['REQUEST_METHOD'] ?? 'GET';
+if ($method !== 'POST') {
+    json_error('Method not allowed', 405);
+}
+
+$pdo = getDbConnection();
+$auth = require_api_auth($pdo);
+$nodeInfo = $auth['node'];
+if (!$nodeInfo) {
+    json_error('Node token required', 403);
+}
+$nodeId = (int)$nodeInfo['id'];
+
+$raw = request_body();
+$data = $raw !== '' ? json_decode($raw, true) : null;
+if (!is_array($data) || !isset($data['sections']) || !is_array($data['sections'])) {
+    json_error('Invalid JSON: sections object required');
+}
+
+function ingest_list($payload, string $key): array
+{
+    // Секция приходит либо списком, либо объектом {key: [...]}, как в отдельных эндпоинтах
+    if (is_array($payload) && isset($payload[$key]) && is_array($payload[$key])) {
+        return $payload[$key];
+    }
+    if (is_array($payload) && ($payload === [] || isset($payload[0]))) {
+        return $payload;
+    }
+    throw new InvalidArgumentException("{$key} list required");
+}
+
+function ingest_versioned_section(PDO $pdo, int $nodeId, string $name, array $payload): array
+{
+    // {"mode": "full"|"delta", "version": N, "base": M}: полный снимок заменяет данные секции,
+    // дельта применяется только поверх версии base — иначе просим агента прислать полный снимок
+    $appliers = [
+        'containers' => 'containers_apply_delta',
+        'ports' => 'ports_apply_delta',
+        'interfaces' => 'interfaces_apply_delta',
+        'upnp' => 'upnp_apply_delta',
+    ];
+    if (!isset($appliers[$name])) {
+        throw new InvalidArgumentException("section {$name} does not support versioned snapshots");
+    }
+    $mode = (string)$payload['mode'];
+    $version = (int)($payload['version'] ?? 0);
+    ingest_ensure_versions_table($pdo);
+
+    if ($mode === 'full') {
+        unset($payload['mode'], $payload['version'], $payload['base']);
+        $result = ingest_section($pdo, $nodeId, $name, $payload);
+        ingest_store_section_version($pdo, $nodeId, $name, $version);
+        return $result + ['version' => $version];
+    }
+    if ($mode !== 'delta') {
+        throw new InvalidArgumentException("unknown mode: {$mode}");
+    }
+
+    $stored = ingest_section_version($pdo, $nodeId, $name);
+    $base = isset($payload['base']) ? (int)$payload['base'] : null;
+    if ($stored === null || $base === null || $stored !== $base) {
+        return ['ok' => false, 'resync' => true, 'error' => 'version mismatch', 'version' => $stored];
+    }
+    if ($name === 'containers') {
+        containers_ensure_schema($pdo);
+    } elseif ($name === 'interfaces') {
+        ensure_network_interfaces_table($pdo);
+        ensure_network_neighbors_table($pdo);
+    } elseif ($name === 'upnp') {
+        upnp_ensure_schema($pdo);
+    }
+    $apply = $appliers[$name];
+    return ingest_in_transaction($pdo, static function () use ($pdo, $nodeId, $name, $payload, $version, $apply) {
+        $result = $apply($pdo, $nodeId, $payload);
+        ingest_store_section_version($pdo, $nodeId, $name, $version);
+        return $result + ['version' => $version];
+    });
+}
+
+function ingest_section(PDO $pdo, int $nodeId, string $name, $payload): array
+{
+    if (is_array($payload) && isset($payload['mode'])) {
+        return ingest_versioned_section($pdo, $nodeId, $name, $payload);
+    }
+    switch ($name) {
+        case 'metrics':
+            if (!is_array($payload) || !$payload) {
+                throw new InvalidArgumentException('metrics object required');
+            }
+            metrics_ensure_schema($pdo);
+            return ['id' => ingest_in_transaction($pdo, static fn() => ingest_metrics($pdo, $nodeId, $payload))];
+        case 'processes':
+            $processes = ingest_list($payload, 'processes');
+            processes_ensure_schema($pdo);
+            return ['count' => ingest_in_transaction($pdo, static fn() => ingest_processes($pdo, $nodeId, $processes))];
+        case 'containers':
+            $containers = ingest_list($payload, 'containers');
+            $networks = is_array($payload['networks'] ?? null) ? $payload['networks'] : null;
+            containers_ensure_schema($pdo);
+            ingest_in_transaction($pdo, static function () use ($pdo, $nodeId, $containers, $networks) {
+                replaceContainerSnapshot($pdo, $nodeId, $containers);
+                if ($networks !== null) {
+                    replaceNetworkSnapshot($pdo, $nodeId, $networks);
+                }
+                return null;
+            });
+            return ['count' => count($containers), 'networks' => $networks !== null ? count($networks) : null];
+        case 'ports':
+            $ports = ingest_list($payload, 'ports');
+            return ['count' => ingest_in_transaction($pdo, static fn() => ingest_ports($pdo, $nodeId, $ports))];
+        case 'interfaces':
+            $interfaces = ingest_list($payload, 'interfaces');
+            $neighbors = is_array($payload['neighbors'] ?? null) ? $payload['neighbors'] : [];
+            ensure_network_interfaces_table($pdo);
+            ensure_network_neighbors_table($pdo);
+            return ingest_in_transaction($pdo, static fn() => [
+                'count' => ingest_interfaces($pdo, $nodeId, $interfaces),
+                'neighbors' => ingest_neighbors($pdo, $nodeId, $neighbors),
+            ]);
+        case 'upnp':
+            upnp_ensure_schema($pdo);
+            if (!empty($payload['gone'])) {
+                $udns = is_array($payload['gone']) ? $payload['gone'] : [$payload['gone']];
+                return ['gone' => upnp_mark_gone($pdo, $nodeId, $udns)];
+            }
+            $devices = ingest_list($payload, 'devices');
+            return ['saved' => ingest_in_transaction($pdo, static function () use ($pdo, $nodeId, $devices) {
+                $saved = upnp_save_devices($pdo, $nodeId, $devices);
+                upnp_prune_missing($pdo, $nodeId, $devices);
+                return $saved;
+            })];
+        case 'logs':
+            $logs = ingest_list($payload, 'logs');
+            return ['count' => ingest_in_transaction($pdo, static fn() => ingest_logs($pdo, $nodeId, $logs))];
+    }
+    throw new InvalidArgumentException("unknown section: {$name}");
+}
+
+function ingest_in_transaction(PDO $pdo, callable $fn)
+{
+    // Один COMMIT на секцию вместо autocommit на каждую строку
+    $pdo->beginTransaction();
+    try {
+        $result = $fn();
+        $pdo->commit();
+        return $result;
+    } catch (Throwable $e) {
+        if ($pdo->inTransaction()) {
+            $pdo->rollBack();
+        }
+        throw $e;
+    }
+}
+
+try {
+    $pdo->prepare("UPDATE nodes SET status = 'online', last_seen = NOW() WHERE id = ?")->execute([$nodeId]);
+} catch (Throwable $e) {
+    json_exception($e, false);
+}
+
+$results = [];
+$accepted = 0;
+foreach ($data['sections'] as $name => $payload) {
+    $name = (string)$name;
+    try {
+        $results[$name] = ingest_section($pdo, $nodeId, $name, $payload) + ['ok' => true];
+        if ($results[$name]['ok']) {
+            $accepted++;
+        }
+    } catch (Throwable $e) {
+        error_log("[ingest.php] node_id={$nodeId} section={$name}: " . $e->getMessage());
+        $results[$name] = ['ok' => false, 'error' => $e->getMessage()];
+    }
+}
+
+if (($results['metrics']['ok'] ?? false) || ($results['logs']['ok'] ?? false)) {
+    retention_maybe_tick($pdo);
+}
+
+echo json_encode([
+    'accepted' => $accepted,
+    'rejected' => count($results) - $accepted,
+    'sections' => $results,
+], JSON_UNESCAPED_UNICODE);
@@ -4,7 +4,9 @@ if (session_status() === PHP_SESSION_NONE) {
 }
 
 require_once __DIR__ . '/../includes/database.php';
+require_once __DIR__ . '/../includes/helpers.php';
 require_once __DIR__ . '/../includes/retention.php';
+require_once __DIR__ . '/../includes/ingest.php';
 
 header('Content-Type: application/json; charset=utf-8');
 $pdo = getDbConnection();
@@ -187,7 +189,7 @@ try {
     }
 
     if ($method === 'POST') {
-        $raw = file_get_contents('php://input');
+        $raw = request_body();
         $data = $raw !== '' ? json_decode($raw, true) : null;
         if ($data === null && $raw !== '') {
             http_response_code(400);
@@ -216,65 +218,7 @@ try {
             exit;
         }
 
-        $stmtSystem = $pdo->prepare("INSERT INTO logs (node_id, level, message, timestamp, type) VALUES (?, ?, ?, ?, ?)");
-        $stmtProcess = $pdo->prepare("INSERT INTO process_logs (node_id, pid, process, level, message, timestamp) VALUES (?, ?, ?, ?, ?, ?)");
-        $stmtContainer = $pdo->prepare("INSERT INTO container_logs (node_id, container_id, level, message, timestamp) VALUES (?, ?, ?, ?, ?)");
-        $stmtSshAuth = $pdo->prepare("INSERT INTO ssh_auth_logs (node_id, level, process, username, ip_address, port, success, message, raw_message, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)");
-        $inserted = 0;
-
-        foreach ($logs as $log) {
-            $level = $log['level'] ?? 'info';
-            $message = $log['message'] ?? '';
-            $timestamp = $log['timestamp'] ?? date('Y-m-d H:i:s');
-            $type = $log['type'] ?? 'system';
-            if ($message === '' || $message === null) {
-                continue;
-            }
-
-            if ($type === 'process') {
-                $pid = isset($log['pid']) ? (int)$log['pid'] : null;
-                $stmtProcess->bindValue(1, $nodeId, PDO::PARAM_INT);
-                $stmtProcess->bindValue(2, $pid, $pid !== null ? PDO::PARAM_INT : PDO::PARAM_NULL);
-                $stmtProcess->bindValue(3, $log['process'] ?? 'system', PDO::PARAM_STR);
-                $stmtProcess->bindValue(4, $level, PDO::PARAM_STR);
-                $stmtProcess->bindValue(5, $message, PDO::PARAM_STR);
-                $stmtProcess->bindValue(6, $timestamp, PDO::PARAM_STR);
-                $stmtProcess->execute();
-            } elseif ($type === 'container' && !empty($log['container_id'])) {
-                $stmtContainer->execute([$nodeId, $log['container_id'], $level, $message, $timestamp]);
-            } elseif ($type === 'auth_ssh') {
-                $successForDb = null;
-                if (array_key_exists('success', $log) && $log['success'] !== null && $log['success'] !== '') {
-                    $successForDb = !empty($log['success']) && $log['success'] !== 'false' && $log['success'] !== '0' ? 1 : 0;
-                    if ($log['success'] === false || $log['success'] === 0 || $log['success'] === '0') {
-                        $successForDb = 0;
-                    }
-                    if ($log['success'] === true || $log['success'] === 1 || $log['success'] === '1') {
-                        $successForDb = 1;
-                    }
-                }
-                $port = isset($log['port']) ? (int)$log['port'] : null;
-                $stmtSshAuth->bindValue(1, $nodeId, PDO::PARAM_INT);
-                $stmtSshAuth->bindValue(2, $level, PDO::PARAM_STR);
-                $stmtSshAuth->bindValue(3, $log['process'] ?? 'sshd', PDO::PARAM_STR);
-                $stmtSshAuth->bindValue(4, $log['username'] ?? null, $log['username'] ? PDO::PARAM_STR : PDO::PARAM_NULL);
-                $stmtSshAuth->bindValue(5, $log['ip'] ?? ($log['ip_address'] ?? null), PDO::PARAM_STR);
-                $stmtSshAuth->bindValue(6, $port, $port !== null ? PDO::PARAM_INT : PDO::PARAM_NULL);
-                $stmtSshAuth->bindValue(7, $successForDb, $successForDb === null ? PDO::PARAM_NULL : PDO::PARAM_INT);
-                $stmtSshAuth->bindValue(8, $message, PDO::PARAM_STR);
-                $stmtSshAuth->bindValue(9, $log['raw_message'] ?? $message, PDO::PARAM_STR);
-                $stmtSshAuth->bindValue(10, $timestamp, PDO::PARAM_STR);
-                try {
-                    $stmtSshAuth->execute();
-                } catch (Exception $e) {
-                    error_log("Error inserting SSH log: " . $e->getMessage());
-                    continue;
-                }
-            } else {
-                $stmtSystem->execute([$nodeId, $level, $message, $timestamp, $type]);
-            }
-            $inserted++;
-        }
+        $inserted = ingest_logs($pdo, (int)$nodeId, $logs);
 
         retention_maybe_tick($pdo);
         echo json_encode(['message' => 'Logs saved', 'count' => $inserted]);
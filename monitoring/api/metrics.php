@@ -6,6 +6,7 @@ if (session_status() === PHP_SESSION_NONE) {
 require_once __DIR__ . '/../includes/database.php';
 require_once __DIR__ . '/../includes/helpers.php';
 require_once __DIR__ . '/../includes/retention.php';
+require_once __DIR__ . '/../includes/ingest.php';
 
 header('Content-Type: application/json; charset=utf-8');
 
@@ -24,30 +25,6 @@ if ($method === 'GET') {
     $nodeInfo = $auth['node'];
 }
 
-function metrics_ensure_schema(PDO $pdo): void
-{
-    static $done = false;
-    if ($done) {
-        return;
-    }
-    $done = true;
-    foreach ([
-        "ALTER TABLE metrics ADD COLUMN memory_used BIGINT NULL",
-        "ALTER TABLE metrics ADD COLUMN memory_total BIGINT NULL",
-        "ALTER TABLE metrics ADD COLUMN disk_used BIGINT NULL",
-        "ALTER TABLE metrics ADD COLUMN disk_total BIGINT NULL",
-        "ALTER TABLE metrics ADD COLUMN swap_percent FLOAT NULL",
-        "ALTER TABLE metrics ADD COLUMN load_avg FLOAT NULL",
-        "ALTER TABLE metrics ADD COLUMN cpu_count SMALLINT NULL",
-    ] as $sql) {
-        try {
-            $pdo->exec($sql);
-        } catch (Exception $e) {
-            // column exists
-        }
-    }
-}
-
 function metrics_bucket_seconds(int $from, int $to, int $limit): int
 {
     $span = max(60, $to - $from);
@@ -99,6 +76,10 @@ function handleGet($pdo) {
     }
 
     $bucket = metrics_bucket_seconds((int)$from, (int)$to, $limit);
+    if ($nodeId && !empty($_GET['disk_io'])) {
+        handleDiskIoGet($pdo, (int)$nodeId, (int)$from, (int)$to, $bucket);
+        return;
+    }
     $select = "FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(timestamp) / {$bucket}) * {$bucket}) AS ts,
                AVG(cpu_percent) AS cpu,
                AVG(memory_percent) AS ram,
@@ -110,7 +91,29 @@ function handleGet($pdo) {
                AVG(disk_used) AS disk_used,
                AVG(disk_total) AS disk_total,
                AVG(swap_percent) AS swap_percent,
-               AVG(load_avg) AS load_avg";
+               AVG(load_avg) AS load_avg,
+               AVG(cpu_user) AS cpu_user,
+               AVG(cpu_system) AS cpu_system,
+               AVG(cpu_iowait) AS cpu_iowait,
+               AVG(cpu_steal) AS cpu_steal,
+               AVG(cpu_irq) AS cpu_irq,
+               AVG(network_in_rate) AS network_in_rate,
+               AVG(network_out_rate) AS network_out_rate,
+               AVG(load_avg5) AS load_avg5,
+               AVG(load_avg15) AS load_avg15,
+               MAX(procs_running) AS procs_running,
+               MAX(procs_blocked) AS procs_blocked,
+               AVG(ctxt_rate) AS ctxt_rate,
+               AVG(intr_rate) AS intr_rate,
+               AVG(psi_cpu_some) AS psi_cpu_some,
+               AVG(psi_memory_some) AS psi_memory_some,
+               AVG(psi_memory_full) AS psi_memory_full,
+               AVG(psi_io_some) AS psi_io_some,
+               AVG(psi_io_full) AS psi_io_full,
+               MAX(CAST(JSON_UNQUOTE(JSON_EXTRACT(samples, '$.cpu.max')) AS DECIMAL(12,2))) AS cpu_max,
+               MAX(CAST(JSON_UNQUOTE(JSON_EXTRACT(samples, '$.memory.max')) AS DECIMAL(12,2))) AS ram_max,
+               MAX(CAST(JSON_UNQUOTE(JSON_EXTRACT(samples, '$.net_in.max')) AS DECIMAL(20,2))) AS network_in_max,
+               MAX(CAST(JSON_UNQUOTE(JSON_EXTRACT(samples, '$.net_out.max')) AS DECIMAL(20,2))) AS network_out_max";
 
     if ($nodeId) {
         $sql = "SELECT {$select}
@@ -147,16 +150,80 @@ function handleGet($pdo) {
             'disk_total' => (float)($m['disk_total'] ?? 0),
             'swap_percent' => (float)($m['swap_percent'] ?? 0),
             'load_avg' => (float)($m['load_avg'] ?? 0),
+            // null — точки старых агентов без разбивки CPU
+            'cpu_user' => $m['cpu_user'] !== null ? (float)$m['cpu_user'] : null,
+            'cpu_system' => $m['cpu_system'] !== null ? (float)$m['cpu_system'] : null,
+            'cpu_iowait' => $m['cpu_iowait'] !== null ? (float)$m['cpu_iowait'] : null,
+            'cpu_steal' => $m['cpu_steal'] !== null ? (float)$m['cpu_steal'] : null,
+            'cpu_irq' => $m['cpu_irq'] !== null ? (float)$m['cpu_irq'] : null,
+            // Байт/с по реальному времени между чтениями агента; null — точки старых агентов
+            'network_in_rate' => $m['network_in_rate'] !== null ? (float)$m['network_in_rate'] : null,
+            'network_out_rate' => $m['network_out_rate'] !== null ? (float)$m['network_out_rate'] : null,
+            // Насыщение: load 5/15, очередь (пик за корзину), ctxt/intr в секунду, PSI — % времени в stall
+            'load_avg5' => $m['load_avg5'] !== null ? (float)$m['load_avg5'] : null,
+            'load_avg15' => $m['load_avg15'] !== null ? (float)$m['load_avg15'] : null,
+            'procs_running' => $m['procs_running'] !== null ? (float)$m['procs_running'] : null,
+            'procs_blocked' => $m['procs_blocked'] !== null ? (float)$m['procs_blocked'] : null,
+            'ctxt_rate' => $m['ctxt_rate'] !== null ? (float)$m['ctxt_rate'] : null,
+            'intr_rate' => $m['intr_rate'] !== null ? (float)$m['intr_rate'] : null,
+            'psi_cpu_some' => $m['psi_cpu_some'] !== null ? (float)$m['psi_cpu_some'] : null,
+            'psi_memory_some' => $m['psi_memory_some'] !== null ? (float)$m['psi_memory_some'] : null,
+            'psi_memory_full' => $m['psi_memory_full'] !== null ? (float)$m['psi_memory_full'] : null,
+            'psi_io_some' => $m['psi_io_some'] !== null ? (float)$m['psi_io_some'] : null,
+            'psi_io_full' => $m['psi_io_full'] !== null ? (float)$m['psi_io_full'] : null,
+            // Пики внутри интервала по частым выборкам агента; network_*_max — байт/с
+            'cpu_max' => $m['cpu_max'] !== null ? (float)$m['cpu_max'] : null,
+            'ram_max' => $m['ram_max'] !== null ? (float)$m['ram_max'] : null,
+            'network_in_max' => $m['network_in_max'] !== null ? (float)$m['network_in_max'] : null,
+            'network_out_max' => $m['network_out_max'] !== null ? (float)$m['network_out_max'] : null,
         ];
     }, $metrics);
 
     echo json_encode(['data' => $data]);
 }
 
+// ?node_id=&disk_io=1 — ряды по каждому диску: байт/с, IOPS, await (мс), util (%) средние и пиковые за корзину
+function handleDiskIoGet(PDO $pdo, int $nodeId, int $from, int $to, int $bucket) {
+    $stmt = $pdo->prepare(
+        "SELECT device,
+                FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(timestamp) / {$bucket}) * {$bucket}) AS ts,
+                AVG(read_bps) AS read_bps,
+                AVG(write_bps) AS write_bps,
+                AVG(read_iops) AS read_iops,
+                AVG(write_iops) AS write_iops,
+                AVG(await_ms) AS await_ms,
+                MAX(await_ms) AS await_max,
+                AVG(util) AS util,
+                MAX(util) AS util_max
+         FROM disk_io_metrics
+         WHERE node_id = ?
+           AND timestamp BETWEEN FROM_UNIXTIME(?) AND FROM_UNIXTIME(?)
+         GROUP BY device, ts
+         ORDER BY device, ts ASC"
+    );
+    $stmt->execute([$nodeId, $from, $to]);
+    $devices = [];
+    foreach ($stmt->fetchAll(PDO::FETCH_ASSOC) as $m) {
+        $devices[$m['device']][] = [
+            'ts' => $m['ts'],
+            'read_bps' => (float)$m['read_bps'],
+            'write_bps' => (float)$m['write_bps'],
+            'read_iops' => (float)$m['read_iops'],
+            'write_iops' => (float)$m['write_iops'],
+            'await_ms' => (float)$m['await_ms'],
+            'await_max' => (float)$m['await_max'],
+            // null — агент не знает busy_time (не Linux)
+            'util' => $m['util'] !== null ? (float)$m['util'] : null,
+            'util_max' => $m['util_max'] !== null ? (float)$m['util_max'] : null,
+        ];
+    }
+    echo json_encode(['devices' => $devices]);
+}
+
 function handlePost($pdo) {
     global $nodeInfo;
 
-    $data = json_decode(file_get_contents('php://input'), true);
+    $data = json_decode(request_body(), true);
 
     if (!$data) {
         http_response_code(400);
@@ -166,7 +233,6 @@ function handlePost($pdo) {
 
     $nodeId = $nodeInfo ? $nodeInfo['id'] : ($data['node_id'] ?? null);
     $nodeName = null;
-    $gpuInfo = null;
 
     if (isset($data['metrics'])) {
         $metrics = $data['metrics'];
@@ -182,10 +248,8 @@ function handlePost($pdo) {
             }
         }
         $row = $metrics;
-        $gpuInfo = $metrics['gpu'] ?? null;
     } else {
         $row = $data;
-        $gpuInfo = $data['gpu'] ?? null;
     }
 
     if (!$nodeId) {
@@ -198,68 +262,9 @@ function handlePost($pdo) {
     $updateStmt = $pdo->prepare("UPDATE nodes SET status = 'online', last_seen = NOW() WHERE id = ?");
     $updateStmt->execute([$nodeId]);
 
-    $stmt = $pdo->prepare(
-        "INSERT INTO metrics
-            (node_id, cpu_percent, memory_percent, disk_percent, network_in, network_out,
-             memory_used, memory_total, disk_used, disk_total, swap_percent, load_avg, cpu_count)
-         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-    );
-    $stmt->execute([
-        $nodeId,
-        $row['cpu_percent'] ?? null,
-        $row['memory_percent'] ?? null,
-        $row['disk_percent'] ?? null,
-        $row['network_in'] ?? null,
-        $row['network_out'] ?? null,
-        $row['memory_used'] ?? null,
-        $row['memory_total'] ?? null,
-        $row['disk_used'] ?? null,
-        $row['disk_total'] ?? null,
-        $row['swap_percent'] ?? null,
-        $row['load_avg'] ?? null,
-        $row['cpu_count'] ?? null,
-    ]);
-    $id = $pdo->lastInsertId();
+    $id = ingest_metrics($pdo, (int)$nodeId, $row);
     retention_maybe_tick($pdo);
 
-    if ($gpuInfo && is_array($gpuInfo)) {
-        try {
-            $pdo->exec("CREATE TABLE IF NOT EXISTS gpu_metrics (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                node_id INT,
-                gpu_index INT,
-                gpu_name VARCHAR(255),
-                vendor VARCHAR(20),
-                utilization FLOAT,
-                memory_used BIGINT,
-                memory_total BIGINT,
-                temperature FLOAT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_node_id (node_id),
-                INDEX idx_timestamp (timestamp)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
-        } catch (Exception $e) {
-            error_log("Error creating gpu_metrics table: " . $e->getMessage());
-        }
-
-        $deleteGpuStmt = $pdo->prepare("DELETE FROM gpu_metrics WHERE node_id = ?");
-        $deleteGpuStmt->execute([$nodeId]);
-
-        $gpuStmt = $pdo->prepare("INSERT INTO gpu_metrics (node_id, gpu_index, gpu_name, vendor, utilization, memory_used, memory_total, temperature) VALUES (?, ?, ?, ?, ?, ?, ?, ?)");
-        foreach ($gpuInfo as $gpu) {
-            $gpuStmt->execute([
-                $nodeId,
-                $gpu['index'] ?? 0,
-                $gpu['name'] ?? 'Unknown',
-                $gpu['vendor'] ?? 'unknown',
-                $gpu['utilization'] ?? 0,
-                $gpu['memory_used'] ?? 0,
-                $gpu['memory_total'] ?? 0,
-                $gpu['temperature'] ?? 0
-            ]);
-        }
-    }
-
     http_response_code(201);
     echo json_encode(['id' => $id, 'message' => 'Metric created']);
 }
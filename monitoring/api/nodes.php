@@ -5,12 +5,18 @@ if (session_status() === PHP_SESSION_NONE) {
 }
 
 require_once __DIR__ . '/../includes/database.php';
+require_once __DIR__ . '/../includes/helpers.php';
 
 header('Content-Type: application/json; charset=utf-8');
 
 $method = $_SERVER['REQUEST_METHOD'] ?? 'GET';
 $pdo = getDbConnection();
 
+// Потолок длительности профиля — как profiler.MAX_SECONDS у агента (дольше агент всё равно обрежет)
+const AGENT_PROFILE_MAX_SECONDS = 300;
+// Через сколько секунд агенту, не получившему слот long-poll, спросить снова (агент добавляет разброс)
+const LONGPOLL_RETRY_AFTER = 5;
+
 // Функция проверки токена ноды (для агентов)
 function validateNodeToken($pdo, $token) {
     if (!$token) return null;
@@ -103,7 +109,12 @@ function handleGet($pdo) {
     $id = $_GET['id'] ?? null;
     $action = $_GET['action'] ?? null;
     
-    // Обработка get-command для агентов (единый формат ответа)
+    // Обработка get-command для агентов (единый формат ответа).
+    // wait=N (до 25 с) — long-poll: ответ держится, пока не появится команда или не выйдет время,
+    // так команда с панели доходит до агента не дольше чем за секунду без опроса раз в цикл. Ждущий запрос
+    // занимает воркер PHP-FPM целиком, поэтому одновременных long-poll не больше LONGPOLL_MAX_WAITERS
+    // (см. acquireLongPollSlot). Без свободного слота ответ сразу с "longpoll": false и retry_after —
+    // агент повторит через несколько секунд с разбросом, а не через цикл
     if ($action === 'get-command') {
         $result = [
             'status' => 'no-command',
@@ -111,55 +122,47 @@ function handleGet($pdo) {
             'command_status' => null,
             'command_timestamp' => null,
         ];
-
-        if (!$nodeInfo) {
-            // Если нет токена, пытаемся найти по имени
-            $nodeName = $_GET['id'] ?? null;
-            if ($nodeName) {
-                $stmt = $pdo->prepare("SELECT * FROM nodes WHERE name = ?");
-                $stmt->execute([$nodeName]);
-                $node = $stmt->fetch(PDO::FETCH_ASSOC);
-                if ($node && $node['command_status'] === 'pending' && $node['last_command']) {
-                    $result = [
-                        'status' => 'ok',
-                        'command' => $node['last_command'],
-                        'command_status' => $node['command_status'],
-                        'command_timestamp' => $node['command_timestamp'],
-                    ];
-                }
-            }
-        } else {
-            // Используем node_id из токена
-            $nodeId = $nodeInfo['id'];
-            $nodeName = $nodeInfo['name'];
-            
-            // Проверяем команду по node_id (основной способ)
-            $stmt = $pdo->prepare("SELECT last_command, command_status, command_timestamp FROM nodes WHERE id = ?");
-            $stmt->execute([$nodeId]);
-            $node = $stmt->fetch(PDO::FETCH_ASSOC);
-            
-            // Дополнительная проверка - может быть команда поставлена по node_name
-            if (!$node || !$node['last_command'] || $node['command_status'] !== 'pending') {
-                $stmt2 = $pdo->prepare("SELECT last_command, command_status, command_timestamp FROM nodes WHERE name = ?");
-                $stmt2->execute([$nodeName]);
-                $node2 = $stmt2->fetch(PDO::FETCH_ASSOC);
-                if ($node2 && $node2['command_status'] === 'pending' && $node2['last_command']) {
-                    $node = $node2;
-                    error_log("Command found by node_name={$nodeName}, node_id={$nodeId}, command={$node['last_command']}");
-                }
+        $wait = max(0, min(25, (int)($_GET['wait'] ?? 0)));
+        $slot = null;
+        if ($wait > 0) {
+            $slot = acquireLongPollSlot();
+            $result['longpoll'] = $slot !== null;
+            if ($slot === null) {
+                $wait = 0;
+                $result['retry_after'] = LONGPOLL_RETRY_AFTER;
             }
-            
-            if ($node && $node['command_status'] === 'pending' && $node['last_command']) {
-                $result = [
-                    'status' => 'ok',
-                    'command' => $node['last_command'],
-                    'command_status' => $node['command_status'],
-                    'command_timestamp' => $node['command_timestamp'],
-                ];
-                error_log("Command found for node_id={$nodeId}, node_name={$nodeName}, command={$node['last_command']}");
-            } else {
-                error_log("No command found for node_id={$nodeId}, node_name={$nodeName}, status=" . ($node['command_status'] ?? 'NULL') . ", command=" . ($node['last_command'] ?? 'NULL'));
+        }
+        if ($wait > 0) {
+            // Сессия не должна блокировать другие запросы того же клиента на всё время ожидания
+            session_write_close();
+            set_time_limit($wait + 10);
+        }
+        $nodeName = $nodeInfo ? $nodeInfo['name'] : ($_GET['id'] ?? null);
+        $deadline = microtime(true) + $wait;
+        // Пауза между проверками 0,5 → 1 с: команда доходит не позже чем через секунду,
+        // а простаивающая нода делает один SELECT в секунду, а не два
+        $pause = 500000;
+        while (true) {
+            $node = findPendingCommand($pdo, $nodeInfo, $nodeName);
+            if ($node || microtime(true) >= $deadline || connection_aborted()) {
+                break;
             }
+            usleep((int)min($pause, max(0, $deadline - microtime(true)) * 1000000));
+            $pause = min(1000000, $pause * 2);
+        }
+        if ($slot !== null) {
+            flock($slot, LOCK_UN);
+            fclose($slot);
+        }
+
+        if ($node) {
+            $result = [
+                'status' => 'ok',
+                'command' => $node['last_command'],
+                'command_status' => $node['command_status'],
+                'command_timestamp' => $node['command_timestamp'],
+            ] + $result;
+            error_log("Command found for node_name={$nodeName}, command={$node['last_command']}");
         }
 
         echo json_encode($result);
@@ -207,6 +210,7 @@ function handleGet($pdo) {
         
         // Вычисляем uptime и ping динамически
         $node['uptime'] = calculateUptime($node);
+        $node['agent_state'] = agentState($node);
         $node['ping'] = pingNode($node['host']);
         
         // Получаем последние метрики из таблицы metrics
@@ -231,7 +235,9 @@ function handleGet($pdo) {
         
         // Получаем последние GPU метрики
         try {
-            $gpuStmt = $pdo->prepare("SELECT gpu_index, gpu_name, vendor, utilization, memory_used, memory_total, temperature 
+            $gpuStmt = $pdo->prepare("SELECT gpu_index, gpu_name, vendor, utilization, memory_used, memory_total, temperature,
+                                            uuid, memory_utilization, power_watts, power_limit_watts, clock_graphics_mhz,
+                                            clock_sm_mhz, clock_memory_mhz, ecc_corrected, ecc_uncorrected, fan_percent 
                                      FROM gpu_metrics 
                                      WHERE node_id = ? 
                                      ORDER BY timestamp DESC 
@@ -240,12 +246,9 @@ function handleGet($pdo) {
             $gpuMetrics = $gpuStmt->fetchAll(PDO::FETCH_ASSOC);
             if ($gpuMetrics) {
                 $node['gpu'] = $gpuMetrics;
-                // Вычисляем среднюю загрузку GPU
-                $avgGpuUtil = 0;
-                if (count($gpuMetrics) > 0) {
-                    $avgGpuUtil = array_sum(array_column($gpuMetrics, 'utilization')) / count($gpuMetrics);
-                }
-                $node['gpu_usage'] = round($avgGpuUtil, 1);
+                // Средняя загрузка GPU — по картам, у которых она прочитана (NULL — нет данных, не 0%)
+                $gpuUtils = array_filter(array_column($gpuMetrics, 'utilization'), static fn($v) => $v !== null);
+                $node['gpu_usage'] = $gpuUtils ? round(array_sum($gpuUtils) / count($gpuUtils), 1) : null;
             } else {
                 $node['gpu'] = [];
                 $node['gpu_usage'] = null;
@@ -255,6 +258,20 @@ function handleGet($pdo) {
             $node['gpu'] = [];
             $node['gpu_usage'] = null;
         }
+
+        // Все файловые системы ноды (байты и inode), самые заполненные первыми
+        try {
+            $fsStmt = $pdo->prepare("SELECT mount, device, fstype, network, stale, total, used, free, percent,
+                                            inodes_total, inodes_used, inodes_percent, timestamp
+                                     FROM filesystem_usage
+                                     WHERE node_id = ?
+                                     ORDER BY GREATEST(COALESCE(percent, 0), COALESCE(inodes_percent, 0)) DESC, mount");
+            $fsStmt->execute([$id]);
+            $node['filesystems'] = $fsStmt->fetchAll(PDO::FETCH_ASSOC);
+        } catch (Exception $e) {
+            // Таблица filesystem_usage может не существовать
+            $node['filesystems'] = [];
+        }
         
         // Добавляем метрики в объект ноды (используем названия, которые ожидает фронтенд)
         if ($metrics) {
@@ -386,6 +403,7 @@ function handleGet($pdo) {
             }
             
             $node['uptime'] = calculateUptime($node);
+            $node['agent_state'] = agentState($node);
             // Пинг только если нода была online (last_seen не NULL) или если явно запрошен refresh
             // Для новых нод без агента пинг будет null
             if ($node['last_seen'] || $node['status'] === 'online') {
@@ -439,12 +457,9 @@ function handleGet($pdo) {
                 $gpuMetrics = $gpuStmt->fetchAll(PDO::FETCH_ASSOC);
                 if ($gpuMetrics) {
                     $node['gpu'] = $gpuMetrics;
-                    // Вычисляем среднюю загрузку GPU
-                    $avgGpuUtil = 0;
-                    if (count($gpuMetrics) > 0) {
-                        $avgGpuUtil = array_sum(array_column($gpuMetrics, 'utilization')) / count($gpuMetrics);
-                    }
-                    $node['gpu_usage'] = round($avgGpuUtil, 1);
+                    // Средняя загрузка GPU — по картам, у которых она прочитана (NULL — нет данных, не 0%)
+                    $gpuUtils = array_filter(array_column($gpuMetrics, 'utilization'), static fn($v) => $v !== null);
+                    $node['gpu_usage'] = $gpuUtils ? round(array_sum($gpuUtils) / count($gpuUtils), 1) : null;
                 } else {
                     $node['gpu'] = [];
                     $node['gpu_usage'] = null;
@@ -460,6 +475,92 @@ function handleGet($pdo) {
     }
 }
 
+function acquireLongPollSlot() {
+    // Слот long-poll — эксклюзивный flock одного из LONGPOLL_MAX_WAITERS файлов; снимается при fclose
+    // или со смертью воркера. null — все слоты заняты (или каталог недоступен).
+    // Размер: каждый слот держит воркер PHP-FPM до 25 с. Чтобы все ноды ждали команды long-poll'ом,
+    // LONGPOLL_MAX_WAITERS = числу нод, а pm.max_children = LONGPOLL_MAX_WAITERS + воркеры на выгрузку
+    // агентов и панель (не меньше 10). Ноды сверх слотов спрашивают раз в LONGPOLL_RETRY_AFTER секунд
+    $max = max(0, (int)(getenv('LONGPOLL_MAX_WAITERS') !== false ? getenv('LONGPOLL_MAX_WAITERS') : 4));
+    $dir = dirname(__DIR__) . '/data/longpoll';
+    if ($max === 0 || (!is_dir($dir) && !@mkdir($dir, 0750, true) && !is_dir($dir))) {
+        return null;
+    }
+    for ($i = 0; $i < $max; $i++) {
+        $fh = @fopen("{$dir}/slot{$i}.lock", 'c');
+        if (!$fh) {
+            return null;
+        }
+        if (flock($fh, LOCK_EX | LOCK_NB)) {
+            return $fh;
+        }
+        fclose($fh);
+    }
+    return null;
+}
+
+function findPendingCommand(PDO $pdo, $nodeInfo, $nodeName) {
+    // Ожидающая команда ноды: по node_id из токена; без токена — по имени (команда могла быть поставлена
+    // по node_name). С токеном запрос по имени не нужен: имя из токена — та же строка nodes
+    if ($nodeInfo) {
+        $stmt = $pdo->prepare("SELECT last_command, command_status, command_timestamp FROM nodes WHERE id = ?");
+        $stmt->execute([$nodeInfo['id']]);
+        $node = $stmt->fetch(PDO::FETCH_ASSOC);
+        if ($node && $node['command_status'] === 'pending' && $node['last_command']) {
+            return $node;
+        }
+        return null;
+    }
+    if (!$nodeName) {
+        return null;
+    }
+    $stmt = $pdo->prepare("SELECT last_command, command_status, command_timestamp FROM nodes WHERE name = ?");
+    $stmt->execute([$nodeName]);
+    $node = $stmt->fetch(PDO::FETCH_ASSOC);
+    if ($node && $node['command_status'] === 'pending' && $node['last_command']) {
+        return $node;
+    }
+    return null;
+}
+
+function ensureAgentStateColumns(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $done = true;
+    $alters = [
+        "ALTER TABLE nodes ADD COLUMN agent_phase VARCHAR(128) NULL",
+        "ALTER TABLE nodes ADD COLUMN agent_cycle_seconds FLOAT NULL",
+        "ALTER TABLE nodes ADD COLUMN agent_last_cycle_seconds FLOAT NULL",
+        "ALTER TABLE nodes ADD COLUMN agent_cycle_interval FLOAT NULL",
+    ];
+    foreach ($alters as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Throwable $e) {
+            // колонка уже есть
+        }
+    }
+}
+
+function agentState($node) {
+    // offline — heartbeat'ов нет; slow — heartbeat'ы идут, но текущий или прошлый цикл сбора
+    // дольше периода COLLECT_INTERVAL агента; ok — всё в пределах периода
+    $lastSeen = !empty($node['last_seen']) ? strtotime($node['last_seen']) : false;
+    if (($node['status'] ?? '') !== 'online' || !$lastSeen || time() - $lastSeen > 60) {
+        return 'offline';
+    }
+    $interval = (float)($node['agent_cycle_interval'] ?? 0);
+    if ($interval <= 0) {
+        return 'ok';
+    }
+    $current = (float)($node['agent_cycle_seconds'] ?? 0);
+    $last = (float)($node['agent_last_cycle_seconds'] ?? 0);
+    return max($current, $last) > $interval ? 'slow' : 'ok';
+}
+
 function calculateUptime($node) {
     // Uptime - это время с момента первого heartbeat (first_seen) или created_at
     // Если нода offline или нет last_seen - uptime = 0
@@ -619,7 +720,7 @@ function handlePost($pdo) {
     
     // Обработка действий с нодами: POST /api/nodes.php?id={id}&action=node-action
     if ($action && $nodeId) {
-        $data = json_decode(file_get_contents('php://input'), true) ?: [];
+        $data = json_decode(request_body(), true) ?: [];
         $nodeAction = $data['action'] ?? $action;
         
         // ОПАСНЫЕ КОМАНДЫ ОТКЛЮЧЕНЫ ПО УМОЛЧАНИЮ
@@ -641,6 +742,24 @@ function handlePost($pdo) {
             executeNodeAction($pdo, $nodeId, $nodeAction);
             return;
         }
+        // profile: {"action": "profile", "seconds": 30, "interval_ms": 10} — профайлер агента,
+        // результат в processes.php?action=profile; cancel: {"action": "cancel", "target": "docker-logs"}
+        // (без target — отмена всех выполняемых и ждущих команд агента)
+        if (in_array($nodeAction, ['profile', 'cancel'], true)) {
+            $command = buildAgentCommand($nodeAction, $data);
+            if ($command === null) {
+                http_response_code(400);
+                echo json_encode([
+                    'error' => 'Invalid parameters',
+                    'message' => $nodeAction === 'profile'
+                        ? 'seconds must be 1..' . AGENT_PROFILE_MAX_SECONDS . ', interval_ms 1..1000'
+                        : 'target must be a command prefix (letters, digits, space, _ . / : -)',
+                ]);
+                return;
+            }
+            executeNodeAction($pdo, $nodeId, $command);
+            return;
+        }
     }
     
     // Обработка специальных действий
@@ -666,10 +785,29 @@ function handlePost($pdo) {
         }
         
         $nodeId = $nodeInfo['id'];
+        $beat = json_decode(request_body(), true);
+        $beat = is_array($beat) ? $beat : [];
+        $num = static fn($v) => is_numeric($v) ? (float)$v : null;
         
-        // Обновляем last_seen и статус ноды
-        $updateStmt = $pdo->prepare("UPDATE nodes SET status = 'online', last_seen = NOW() WHERE id = ?");
-        $updateStmt->execute([$nodeId]);
+        // Обновляем last_seen и статус ноды; фаза цикла агента — чтобы отличать «медленный» от «мёртвого».
+        // Колонки — из schema_mysql.sql / migration_agent_state.sql; ALTER только если UPDATE на них споткнулся
+        // (иначе каждый heartbeat каждой ноды гонял бы четыре ALTER TABLE nodes)
+        $beatParams = [
+            isset($beat['phase']) ? mb_substr((string)$beat['phase'], 0, 128) : null,
+            $num($beat['cycle_seconds'] ?? null),
+            $num($beat['last_cycle_seconds'] ?? null),
+            $num($beat['cycle_interval'] ?? null),
+            $nodeId,
+        ];
+        $beatSql = "UPDATE nodes SET status = 'online', last_seen = NOW(),
+            agent_phase = ?, agent_cycle_seconds = ?, agent_last_cycle_seconds = ?, agent_cycle_interval = ?
+            WHERE id = ?";
+        try {
+            $pdo->prepare($beatSql)->execute($beatParams);
+        } catch (PDOException $e) {
+            ensureAgentStateColumns($pdo);
+            $pdo->prepare($beatSql)->execute($beatParams);
+        }
         
         echo json_encode([
             'status' => 'ok',
@@ -684,7 +822,7 @@ function handlePost($pdo) {
     // Отчет о статусе команды от агента: POST /api/nodes.php?id={name}&action=command-status
     if ($action === 'command-status') {
         global $nodeInfo;
-        $data = json_decode(file_get_contents('php://input'), true);
+        $data = json_decode(request_body(), true);
         if (!$data) {
             http_response_code(400);
             echo json_encode(['error' => 'Invalid JSON']);
@@ -723,16 +861,20 @@ function handlePost($pdo) {
         error_log("Current command in DB: " . ($current['last_command'] ?? 'NULL'));
         error_log("Current status in DB: " . ($current['command_status'] ?? 'NULL'));
         
-        // Если команда завершена (completed или failed), очищаем команду чтобы избежать повторного выполнения
-        if ($commandStatus === 'completed' || $commandStatus === 'failed') {
-            $updateStmt = $pdo->prepare("UPDATE nodes SET command_status = ?, last_command = NULL, command_timestamp = NULL WHERE id = ?");
-            $updateStmt->execute([$commandStatus, $targetNodeId]);
-            error_log("Command cleared: status={$commandStatus}, last_command=NULL");
+        // Агент выполняет команды параллельно, а слот команды у ноды один: статус применяем, только если
+        // в слоте всё ещё эта команда — поздний отчёт о старой не должен затереть новую pending
+        $sameCommand = $command === '' ? '' : ' AND last_command = ?';
+        $params = $command === '' ? [$commandStatus, $targetNodeId] : [$commandStatus, $targetNodeId, $command];
+        // Если команда завершена (completed, failed или cancelled), очищаем команду чтобы избежать повторного выполнения
+        if (in_array($commandStatus, ['completed', 'failed', 'cancelled'], true)) {
+            $updateStmt = $pdo->prepare("UPDATE nodes SET command_status = ?, last_command = NULL, command_timestamp = NULL WHERE id = ?" . $sameCommand);
+            $updateStmt->execute($params);
+            error_log("Command cleared: status={$commandStatus}, rows=" . $updateStmt->rowCount());
         } else {
-            // Для pending просто обновляем статус
-            $updateStmt = $pdo->prepare("UPDATE nodes SET command_status = ? WHERE id = ?");
-            $updateStmt->execute([$commandStatus, $targetNodeId]);
-            error_log("Command status updated: status={$commandStatus}");
+            // Для pending/running просто обновляем статус
+            $updateStmt = $pdo->prepare("UPDATE nodes SET command_status = ? WHERE id = ?" . $sameCommand);
+            $updateStmt->execute($params);
+            error_log("Command status updated: status={$commandStatus}, rows=" . $updateStmt->rowCount());
         }
         
         // Проверяем результат
@@ -746,7 +888,7 @@ function handlePost($pdo) {
     }
     
     // Обычное создание ноды
-    $data = json_decode(file_get_contents('php://input'), true);
+    $data = json_decode(request_body(), true);
     
     if (!$data) {
         http_response_code(400);
@@ -870,7 +1012,7 @@ function handlePut($pdo) {
         return;
     }
     
-    $data = json_decode(file_get_contents('php://input'), true);
+    $data = json_decode(request_body(), true);
     
     if (!$data) {
         http_response_code(400);
@@ -1101,6 +1243,34 @@ function refreshAllNodes($pdo) {
     echo json_encode(['success' => true, 'updated' => $updated]);
 }
 
+function buildAgentCommand(string $action, array $data): ?string {
+    // Строка команды для агента из параметров панели; null — параметры вне допустимого
+    if ($action === 'profile') {
+        $seconds = $data['seconds'] ?? 30;
+        $intervalMs = $data['interval_ms'] ?? 10;
+        if (!is_numeric($seconds) || !is_numeric($intervalMs)) {
+            return null;
+        }
+        $seconds = (int)$seconds;
+        $intervalMs = (int)$intervalMs;
+        if ($seconds < 1 || $seconds > AGENT_PROFILE_MAX_SECONDS || $intervalMs < 1 || $intervalMs > 1000) {
+            return null;
+        }
+        return "profile {$seconds} {$intervalMs}";
+    }
+    if ($action === 'cancel') {
+        $target = trim((string)($data['target'] ?? ''));
+        if ($target === '') {
+            return 'cancel';
+        }
+        if (!preg_match('/^[a-zA-Z0-9 _.\/:-]{1,200}$/', $target)) {
+            return null;
+        }
+        return "cancel {$target}";
+    }
+    return null;
+}
+
 function executeNodeAction($pdo, $nodeId, $action) {
     $stmt = $pdo->prepare("SELECT * FROM nodes WHERE id = ?");
     $stmt->execute([$nodeId]);
@@ -6,6 +6,7 @@ if (session_status() === PHP_SESSION_NONE) {
 
 require_once __DIR__ . '/../includes/database.php';
 require_once __DIR__ . '/../includes/helpers.php';
+require_once __DIR__ . '/../includes/ingest.php';
 
 header('Content-Type: application/json; charset=utf-8');
 
@@ -14,55 +15,6 @@ $pdo = getDbConnection();
 $auth = require_api_auth($pdo);
 $nodeInfo = $auth['node'];
 
-function ensure_network_interfaces_table(PDO $pdo): void
-{
-    $pdo->exec("CREATE TABLE IF NOT EXISTS network_interfaces (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        node_id INT NOT NULL,
-        name VARCHAR(100) NOT NULL,
-        ip VARCHAR(45),
-        ipv6 VARCHAR(45) DEFAULT NULL,
-        netmask VARCHAR(45),
-        ipv6_netmask VARCHAR(45) DEFAULT NULL,
-        gateway VARCHAR(45) DEFAULT NULL,
-        gateway6 VARCHAR(45) DEFAULT NULL,
-        status VARCHAR(20),
-        speed INT DEFAULT 0,
-        rx_bytes BIGINT DEFAULT 0,
-        tx_bytes BIGINT DEFAULT 0,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        INDEX idx_node_id (node_id),
-        INDEX idx_timestamp (timestamp)
-    )");
-    foreach ([
-        'ALTER TABLE network_interfaces ADD COLUMN gateway VARCHAR(45) DEFAULT NULL AFTER netmask',
-        'ALTER TABLE network_interfaces ADD COLUMN ipv6 VARCHAR(45) DEFAULT NULL AFTER ip',
-        'ALTER TABLE network_interfaces ADD COLUMN ipv6_netmask VARCHAR(45) DEFAULT NULL AFTER netmask',
-        'ALTER TABLE network_interfaces ADD COLUMN gateway6 VARCHAR(45) DEFAULT NULL AFTER gateway',
-    ] as $sql) {
-        try {
-            $pdo->exec($sql);
-        } catch (Exception $e) {
-            // column already exists
-        }
-    }
-}
-
-function ensure_network_neighbors_table(PDO $pdo): void
-{
-    $pdo->exec("CREATE TABLE IF NOT EXISTS network_neighbors (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        node_id INT NOT NULL,
-        ip VARCHAR(45) NOT NULL,
-        mac VARCHAR(32) DEFAULT NULL,
-        iface VARCHAR(100) DEFAULT NULL,
-        family TINYINT DEFAULT 4,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        INDEX idx_nn_node (node_id),
-        INDEX idx_nn_ip (ip)
-    )");
-}
-
 try {
     if ($method === 'GET') {
         $action = $_GET['action'] ?? null;
@@ -139,7 +91,7 @@ try {
         if (isset($_GET['node_id']) && isset($_GET['action'])) {
             $nodeId = $_GET['node_id'];
             
-            $data = json_decode(file_get_contents('php://input'), true);
+            $data = json_decode(request_body(), true);
             if (!$data) {
                 http_response_code(400);
                 echo json_encode(['error' => 'Invalid JSON']);
@@ -192,7 +144,7 @@ try {
         // Обработка интерфейсов от агента
         if (isset($_GET['action']) && $_GET['action'] === 'interfaces') {
             global $nodeInfo;
-            $raw = file_get_contents('php://input');
+            $raw = request_body();
             $data = $raw !== '' ? json_decode($raw, true) : null;
             
             if ($data === null && $raw !== '') {
@@ -216,48 +168,11 @@ try {
 
             $interfaces = $data['interfaces'] ?? [];
             $neighbors = $data['neighbors'] ?? [];
-            $deleteStmt = $pdo->prepare("DELETE FROM network_interfaces WHERE node_id = ?");
-            $deleteStmt->execute([$nodeId]);
-
-            if (count($interfaces) > 0) {
-                $stmt = $pdo->prepare("INSERT INTO network_interfaces (node_id, name, ip, ipv6, netmask, ipv6_netmask, gateway, gateway6, status, speed, rx_bytes, tx_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)");
-                foreach ($interfaces as $iface) {
-                    $stmt->execute([
-                        $nodeId,
-                        $iface['name'] ?? 'unknown',
-                        $iface['ip'] ?? null,
-                        $iface['ipv6'] ?? null,
-                        $iface['netmask'] ?? null,
-                        $iface['ipv6_netmask'] ?? null,
-                        $iface['gateway'] ?? null,
-                        $iface['gateway6'] ?? null,
-                        $iface['status'] ?? 'unknown',
-                        $iface['speed'] ?? 0,
-                        $iface['rx_bytes'] ?? 0,
-                        $iface['tx_bytes'] ?? 0
-                    ]);
-                }
-            }
+            ingest_interfaces($pdo, (int)$nodeId, $interfaces);
 
             try {
                 ensure_network_neighbors_table($pdo);
-                $pdo->prepare("DELETE FROM network_neighbors WHERE node_id = ?")->execute([$nodeId]);
-                if (count($neighbors) > 0) {
-                    $nstmt = $pdo->prepare("INSERT INTO network_neighbors (node_id, ip, mac, iface, family) VALUES (?, ?, ?, ?, ?)");
-                    foreach ($neighbors as $row) {
-                        $ip = trim((string)($row['ip'] ?? ''));
-                        if ($ip === '') {
-                            continue;
-                        }
-                        $nstmt->execute([
-                            $nodeId,
-                            mb_substr($ip, 0, 45),
-                            mb_substr((string)($row['mac'] ?? ''), 0, 32) ?: null,
-                            mb_substr((string)($row['iface'] ?? ''), 0, 100) ?: null,
-                            (int)($row['family'] ?? (strpos($ip, ':') !== false ? 6 : 4)),
-                        ]);
-                    }
-                }
+                ingest_neighbors($pdo, (int)$nodeId, $neighbors);
             } catch (Exception $e) {
                 error_log('network_neighbors: ' . $e->getMessage());
             }
@@ -268,7 +183,7 @@ try {
         
         // Прием данных о портах от агента
         global $nodeInfo;
-        $raw = file_get_contents('php://input');
+        $raw = request_body();
         $data = $raw !== '' ? json_decode($raw, true) : null;
         
         if ($data === null && $raw !== '') {
@@ -304,22 +219,8 @@ try {
         }
         
         if ($ports && count($ports) > 0) {
-            // Удаляем старые порты для этой ноды
-            $deleteStmt = $pdo->prepare("DELETE FROM ports WHERE node_id = ?");
-            $deleteStmt->execute([$nodeId]);
-            
-            // Вставляем новые порты
-            $stmt = $pdo->prepare("INSERT INTO ports (node_id, port, type, status, process_name, pid) VALUES (?, ?, ?, ?, ?, ?)");
-            foreach ($ports as $port) {
-                $stmt->execute([
-                    $nodeId,
-                    $port['port'] ?? 0,
-                    $port['type'] ?? 'tcp',
-                    $port['status'] ?? 'open',
-                    $port['process_name'] ?? null,
-                    $port['pid'] ?? null
-                ]);
-            }
+            // Снимок портов ноды заменяется целиком
+            ingest_ports($pdo, (int)$nodeId, $ports);
             
             echo json_encode(['message' => 'Ports updated', 'count' => count($ports)]);
             exit;
@@ -5,6 +5,7 @@ if (session_status() === PHP_SESSION_NONE) {
 
 require_once __DIR__ . '/../includes/database.php';
 require_once __DIR__ . '/../includes/helpers.php';
+require_once __DIR__ . '/../includes/ingest.php';
 
 header('Content-Type: application/json; charset=utf-8');
 
@@ -110,10 +111,91 @@ if ($method === 'GET' && isset($_GET['get-result']) && $_GET['get-result'] == '1
     exit;
 }
 
+function ensure_agent_profiles_table(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $pdo->exec("CREATE TABLE IF NOT EXISTS agent_profiles (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        node_id INT NOT NULL,
+        command VARCHAR(255) NOT NULL,
+        seconds FLOAT NULL,
+        samples INT NULL,
+        summary TEXT NULL,
+        folded MEDIUMTEXT NULL,
+        folded_cpu MEDIUMTEXT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_agent_profiles_node (node_id, created_at)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+    $done = true;
+}
+
+function save_agent_profile(PDO $pdo, int $nodeId, string $command, array $profile): int
+{
+    // Свёрнутые стеки — отдельными полями (их отдаёт ?action=profile&format=folded), остальное — сводкой
+    ensure_agent_profiles_table($pdo);
+    $folded = (string)($profile['folded'] ?? '');
+    $foldedCpu = (string)($profile['folded_cpu'] ?? '');
+    unset($profile['folded'], $profile['folded_cpu']);
+    $stmt = $pdo->prepare("INSERT INTO agent_profiles (node_id, command, seconds, samples, summary, folded, folded_cpu)
+        VALUES (?, ?, ?, ?, ?, ?, ?)");
+    $stmt->execute([
+        $nodeId,
+        mb_substr($command, 0, 255),
+        isset($profile['seconds']) ? (float)$profile['seconds'] : null,
+        isset($profile['samples']) ? (int)$profile['samples'] : null,
+        json_encode($profile, JSON_UNESCAPED_UNICODE),
+        $folded,
+        $foldedCpu,
+    ]);
+    $id = (int)$pdo->lastInsertId();
+    // Храним последние 20 профилей ноды
+    $pdo->prepare("DELETE FROM agent_profiles WHERE node_id = ? AND id NOT IN (
+        SELECT id FROM (SELECT id FROM agent_profiles WHERE node_id = ? ORDER BY id DESC LIMIT 20) keep)")
+        ->execute([$nodeId, $nodeId]);
+    return $id;
+}
+
+// Профиль агента (команда profile): GET /api/processes.php?action=profile&node_id=X[&id=N][&format=folded|folded_cpu]
+// format=folded — текст для flamegraph.pl / speedscope, иначе JSON со сводкой
+if ($method === 'GET' && ($_GET['action'] ?? '') === 'profile' && isset($_GET['node_id'])) {
+    ensure_agent_profiles_table($pdo);
+    $nodeId = (int)$_GET['node_id'];
+    if (isset($_GET['id'])) {
+        $stmt = $pdo->prepare("SELECT * FROM agent_profiles WHERE node_id = ? AND id = ?");
+        $stmt->execute([$nodeId, (int)$_GET['id']]);
+    } else {
+        $stmt = $pdo->prepare("SELECT * FROM agent_profiles WHERE node_id = ? ORDER BY id DESC LIMIT 1");
+        $stmt->execute([$nodeId]);
+    }
+    $profile = $stmt->fetch(PDO::FETCH_ASSOC);
+    if (!$profile) {
+        json_error('Profile not found', 404);
+    }
+    $format = $_GET['format'] ?? 'json';
+    if ($format === 'folded' || $format === 'folded_cpu') {
+        header('Content-Type: text/plain; charset=utf-8');
+        header('Content-Disposition: attachment; filename="agent-' . $nodeId . '-' . $profile['id'] . '.' . $format . '.txt"');
+        echo $profile[$format];
+        exit;
+    }
+    echo json_encode([
+        'id' => (int)$profile['id'],
+        'command' => $profile['command'],
+        'created_at' => $profile['created_at'],
+        'summary' => json_decode($profile['summary'] ?? 'null', true),
+        'folded' => $profile['folded'],
+        'folded_cpu' => $profile['folded_cpu'],
+    ], JSON_UNESCAPED_UNICODE);
+    exit;
+}
+
 // Прием результата команды от агента: POST /api/processes.php?action=command-result
 if ($method === 'POST' && isset($_GET['action']) && $_GET['action'] === 'command-result') {
     global $nodeInfo;
-    $data = json_decode(file_get_contents('php://input'), true);
+    $data = json_decode(request_body(), true);
     
     if (!$nodeInfo) {
         http_response_code(401);
@@ -124,13 +206,39 @@ if ($method === 'POST' && isset($_GET['action']) && $_GET['action'] === 'command
     $nodeId = $nodeInfo['id'];
     $command = $data['command'] ?? '';
     $logs = $data['logs'] ?? [];
+    if (isset($data['profile']) && is_array($data['profile'])) {
+        // Результат profile: стеки — в agent_profiles, в command_result — только ссылка на профиль
+        try {
+            $profileId = save_agent_profile($pdo, (int)$nodeId, (string)$command, $data['profile']);
+        } catch (Throwable $e) {
+            json_exception($e);
+        }
+        $logs = [[
+            'type' => 'profile',
+            'level' => 'info',
+            'message' => "Profile #{$profileId}: " . (int)($data['profile']['samples'] ?? 0) . ' samples',
+            'profile_id' => $profileId,
+        ]];
+    }
     
     error_log("Received command result from node_id={$nodeId}, command={$command}, logs_count=" . count($logs));
     
-    // Сохраняем результат команды
+    // Сохраняем результат команды. Команды выполняются асинхронно, а слот у ноды один: поздний результат
+    // старой команды (docker-logs, get-process-logs) не должен пометить completed новую pending, которую
+    // агент ещё не забрал. Пишем, только если в слоте эта команда или слот уже очищен её статусом
     $resultJson = json_encode($logs, JSON_UNESCAPED_UNICODE);
-    $stmt = $pdo->prepare("UPDATE nodes SET command_result = ?, command_status = 'completed' WHERE id = ?");
-    $stmt->execute([$resultJson, $nodeId]);
+    if ($command === '') {
+        $stmt = $pdo->prepare("UPDATE nodes SET command_result = ?, command_status = 'completed' WHERE id = ?");
+        $stmt->execute([$resultJson, $nodeId]);
+    } else {
+        $stmt = $pdo->prepare("UPDATE nodes SET command_result = ?,
+                                   command_status = IF(last_command = ?, 'completed', command_status)
+                               WHERE id = ? AND (last_command = ? OR last_command IS NULL)");
+        $stmt->execute([$resultJson, $command, $nodeId, $command]);
+    }
+    if ($stmt->rowCount() === 0) {
+        error_log("Command result not applied: node_id={$nodeId}, command={$command} (newer command in slot or same result)");
+    }
     
     // Проверяем что результат сохранен
     $checkStmt = $pdo->prepare("SELECT command_result, command_status FROM nodes WHERE id = ?");
@@ -152,7 +260,7 @@ if ($method === 'POST' && isset($_GET['node_id']) && isset($_GET['pid']) && isse
     $pid = $_GET['pid'];
     $action = $_GET['action'];
     
-    $data = json_decode(file_get_contents('php://input'), true) ?: [];
+    $data = json_decode(request_body(), true) ?: [];
     $action = $data['action'] ?? $action;
     
     if (!in_array($action, ['kill', 'restart'])) {
@@ -234,7 +342,7 @@ function handleGet($pdo) {
 function handlePost($pdo) {
     global $nodeInfo;
     
-    $data = json_decode(file_get_contents('php://input'), true);
+    $data = json_decode(request_body(), true);
     
     if (!$data) {
         http_response_code(400);
@@ -259,24 +367,11 @@ function handlePost($pdo) {
         return;
     }
     
-    // Удаляем старые процессы для этой ноды
-    $deleteStmt = $pdo->prepare("DELETE FROM processes WHERE node_id = ?");
-    $deleteStmt->execute([$nodeId]);
+    // Снимок процессов ноды заменяется целиком
+    processes_ensure_schema($pdo);
+    ingest_processes($pdo, (int)$nodeId, $processes ?: []);
     
-    if ($processes && count($processes) > 0) {
-        // Вставляем новые процессы
-        $stmt = $pdo->prepare("INSERT INTO processes (node_id, pid, name, cpu_percent, memory_percent, status) VALUES (?, ?, ?, ?, ?, ?)");
-        foreach ($processes as $process) {
-            $stmt->execute([
-                $nodeId,
-                $process['pid'] ?? 0,
-                $process['name'] ?? 'unknown',
-                $process['cpu_percent'] ?? 0,
-                $process['memory_percent'] ?? 0,
-                $process['status'] ?? 'running'
-            ]);
-        }
-    } else {
+    if (!$processes) {
         // Один процесс (старый формат)
         $pid = $data['pid'] ?? null;
         $name = $data['name'] ?? null;
@@ -304,7 +399,7 @@ if ($method === 'POST' && isset($_GET['node_id']) && isset($_GET['pid']) && isse
     $pid = $_GET['pid'];
     $action = $_GET['action'];
     
-    $data = json_decode(file_get_contents('php://input'), true) ?: [];
+    $data = json_decode(request_body(), true) ?: [];
     $action = $data['action'] ?? $action;
     
     if (!in_array($action, ['kill', 'restart'])) {
@@ -100,7 +100,7 @@ try {
         // Обработка отчетов от агентов
         if ($action === 'report') {
             
-            $data = json_decode(file_get_contents('php://input'), true);
+            $data = json_decode(request_body(), true);
             if (!$data) {
                 http_response_code(400);
                 echo json_encode(['error' => 'Invalid JSON']);
@@ -225,7 +225,7 @@ try {
         } elseif ($action === 'result') {
             // Авторизация уже проверена выше для action=result
             
-            $data = json_decode(file_get_contents('php://input'), true);
+            $data = json_decode(request_body(), true);
             if (!$data) {
                 http_response_code(400);
                 echo json_encode(['error' => 'Invalid JSON']);
@@ -301,8 +301,8 @@ try {
                 $checkStmt->execute([$node['id']]);
                 $currentNode = $checkStmt->fetch(PDO::FETCH_ASSOC);
                 
-                // Не устанавливаем команду check-updates, если уже есть pending команда
-                if ($currentNode && $currentNode['command_status'] === 'pending' && $currentNode['last_command']) {
+                // Не устанавливаем команду check-updates, если уже есть pending (или выполняемая агентом) команда
+                if ($currentNode && in_array($currentNode['command_status'], ['pending', 'running'], true) && $currentNode['last_command']) {
                     // Проверяем, не истекла ли команда (более 5 минут)
                     $commandAge = time() - strtotime($currentNode['command_timestamp']);
                     if ($commandAge < 300) { // 5 минут
@@ -317,7 +317,7 @@ try {
                 }
                 
                 // Не ставим check-updates если уже есть check-updates в pending (даже если недавно выполнилась)
-                if ($currentNode && $currentNode['last_command'] === 'check-updates' && $currentNode['command_status'] === 'pending') {
+                if ($currentNode && $currentNode['last_command'] === 'check-updates' && in_array($currentNode['command_status'], ['pending', 'running'], true)) {
                     $commandAge = time() - strtotime($currentNode['command_timestamp']);
                     if ($commandAge < 60) { // 1 минута - не ставим новую команду если недавно уже была check-updates
                         error_log("Skipping check-updates for node {$node['name']} (ID: {$node['id']}): check-updates was queued {$commandAge}s ago");
@@ -346,7 +346,7 @@ try {
                         ) THEN 'completed'
                         WHEN n.last_command IS NOT NULL 
                             AND n.last_command LIKE CONCAT('install-update ', nu.package, '%')
-                            AND n.command_status = 'pending' 
+                            AND n.command_status IN ('pending', 'running') 
                             AND n.command_timestamp > DATE_SUB(NOW(), INTERVAL 10 MINUTE) THEN 'pending'
                         WHEN n.last_command IS NOT NULL 
                             AND n.last_command LIKE CONCAT('install-update ', nu.package, '%')
@@ -372,7 +372,7 @@ try {
                         ) THEN 'completed'
                         WHEN n.last_command IS NOT NULL 
                             AND n.last_command LIKE CONCAT('install-update ', nu.package, '%')
-                            AND n.command_status = 'pending' 
+                            AND n.command_status IN ('pending', 'running') 
                             AND n.command_timestamp > DATE_SUB(NOW(), INTERVAL 10 MINUTE) THEN 'pending'
                         WHEN n.last_command IS NOT NULL 
                             AND n.last_command LIKE CONCAT('install-update ', nu.package, '%')
@@ -421,7 +421,7 @@ try {
                 'last_check' => $lastCheck
             ]);
         } elseif ($action === 'install') {
-            $data = json_decode(file_get_contents('php://input'), true);
+            $data = json_decode(request_body(), true);
             $updates = $data['updates'] ?? [];
             
             if (empty($updates)) {
@@ -22,6 +22,29 @@ if (!function_exists('json_exception')) {
     }
 }
 
+if (!function_exists('request_body')) {
+    // Тело запроса; Content-Encoding: gzip/deflate от агента распаковывается прозрачно.
+    // Потолок распакованного размера защищает от «zip-бомбы».
+    function request_body(int $maxBytes = 67108864): string
+    {
+        static $body = null;
+        if ($body !== null) {
+            return $body;
+        }
+        $raw = (string)file_get_contents('php://input');
+        $encoding = strtolower(trim((string)($_SERVER['HTTP_CONTENT_ENCODING'] ?? '')));
+        if ($raw !== '' && in_array($encoding, ['gzip', 'x-gzip', 'deflate'], true)) {
+            $decoded = @zlib_decode($raw, $maxBytes);
+            if ($decoded === false) {
+                json_error('Invalid ' . $encoding . ' request body', 400);
+            }
+            $raw = $decoded;
+        }
+        $body = $raw;
+        return $body;
+    }
+}
+
 if (!function_exists('log_auth_event')) {
     function log_auth_event(PDO $pdo, $userId, $username, $eventType, $success, $message = null) {
         try {
@@ -0,0 +1,822 @@
+<?php
+/**
+ * Приём данных агента: запись секций снимка (метрики, процессы, Docker, порты, интерфейсы, логи).
+ * Функции только пишут в БД; авторизация, разбор тела и ответ — на стороне api/*.php.
+ * Схема создаётся отдельно (*_ensure_schema / ensure_*_table), до транзакции: DDL в MySQL коммитит неявно.
+ */
+
+function metrics_ensure_schema(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $done = true;
+    foreach ([
+        "ALTER TABLE metrics ADD COLUMN memory_used BIGINT NULL",
+        "ALTER TABLE metrics ADD COLUMN memory_total BIGINT NULL",
+        "ALTER TABLE metrics ADD COLUMN disk_used BIGINT NULL",
+        "ALTER TABLE metrics ADD COLUMN disk_total BIGINT NULL",
+        "ALTER TABLE metrics ADD COLUMN swap_percent FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN load_avg FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_count SMALLINT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_user FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_system FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_iowait FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_steal FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_irq FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN cpu_per_core TEXT NULL",
+        "ALTER TABLE metrics ADD COLUMN samples TEXT NULL",
+        "ALTER TABLE metrics ADD COLUMN network_in_rate DOUBLE NULL",
+        "ALTER TABLE metrics ADD COLUMN network_out_rate DOUBLE NULL",
+        "ALTER TABLE metrics ADD COLUMN net_interfaces TEXT NULL",
+        "ALTER TABLE metrics ADD COLUMN load_avg5 FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN load_avg15 FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN procs_running INT NULL",
+        "ALTER TABLE metrics ADD COLUMN procs_blocked INT NULL",
+        "ALTER TABLE metrics ADD COLUMN ctxt_rate DOUBLE NULL",
+        "ALTER TABLE metrics ADD COLUMN intr_rate DOUBLE NULL",
+        "ALTER TABLE metrics ADD COLUMN psi_cpu_some FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN psi_memory_some FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN psi_memory_full FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN psi_io_some FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN psi_io_full FLOAT NULL",
+        "ALTER TABLE metrics ADD COLUMN pressure TEXT NULL",
+    ] as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Exception $e) {
+            // column exists
+        }
+    }
+    try {
+        $pdo->exec("CREATE TABLE IF NOT EXISTS gpu_metrics (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            node_id INT,
+            gpu_index INT,
+            gpu_name VARCHAR(255),
+            vendor VARCHAR(20),
+            utilization FLOAT,
+            memory_used BIGINT,
+            memory_total BIGINT,
+            temperature FLOAT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_node_id (node_id),
+            INDEX idx_timestamp (timestamp)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+    } catch (Exception $e) {
+        error_log("Error creating gpu_metrics table: " . $e->getMessage());
+    }
+    // Мощность, частоты, ECC и вентилятор — от NVML / nvidia-smi агента; у AMD и старых агентов NULL
+    foreach ([
+        "ALTER TABLE gpu_metrics ADD COLUMN uuid VARCHAR(64) NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN memory_utilization FLOAT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN power_watts FLOAT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN power_limit_watts FLOAT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN clock_graphics_mhz INT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN clock_sm_mhz INT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN clock_memory_mhz INT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN ecc_corrected BIGINT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN ecc_uncorrected BIGINT NULL",
+        "ALTER TABLE gpu_metrics ADD COLUMN fan_percent FLOAT NULL",
+    ] as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Exception $e) {
+            // column exists
+        }
+    }
+    try {
+        $pdo->exec("CREATE TABLE IF NOT EXISTS disk_io_metrics (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            node_id INT,
+            device VARCHAR(64),
+            read_bps DOUBLE,
+            write_bps DOUBLE,
+            read_iops FLOAT,
+            write_iops FLOAT,
+            await_ms FLOAT,
+            util FLOAT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_node_ts (node_id, timestamp),
+            INDEX idx_timestamp (timestamp)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+    } catch (Exception $e) {
+        error_log("Error creating disk_io_metrics table: " . $e->getMessage());
+    }
+    try {
+        $pdo->exec("CREATE TABLE IF NOT EXISTS filesystem_usage (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            node_id INT,
+            mount VARCHAR(512),
+            device VARCHAR(255),
+            fstype VARCHAR(32),
+            network TINYINT(1) DEFAULT 0,
+            stale TINYINT(1) DEFAULT 0,
+            total BIGINT NULL,
+            used BIGINT NULL,
+            free BIGINT NULL,
+            percent FLOAT NULL,
+            inodes_total BIGINT NULL,
+            inodes_used BIGINT NULL,
+            inodes_percent FLOAT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_node_id (node_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+    } catch (Exception $e) {
+        error_log("Error creating filesystem_usage table: " . $e->getMessage());
+    }
+}
+
+
+function ingest_metrics(PDO $pdo, int $nodeId, array $row): int
+{
+    // collected_at (unix time агента) ставит точку на время сбора — важно для досылки из spool агента.
+    // Время из будущего или старше 30 дней не принимаем: такая точка пишется на NOW().
+    $collectedAt = isset($row['collected_at']) && is_numeric($row['collected_at']) ? (int)$row['collected_at'] : null;
+    if ($collectedAt !== null && ($collectedAt > time() + 300 || $collectedAt < time() - 30 * 86400)) {
+        $collectedAt = null;
+    }
+    // Разбивка CPU (агент считает её по приращениям /proc/stat за весь интервал); irq — вместе с softirq
+    $cpuTimes = isset($row['cpu_times']) && is_array($row['cpu_times']) ? $row['cpu_times'] : [];
+    $cpuField = static function (string ...$keys) use ($cpuTimes) {
+        $sum = null;
+        foreach ($keys as $key) {
+            if (isset($cpuTimes[$key]) && is_numeric($cpuTimes[$key])) {
+                $sum = ($sum ?? 0.0) + (float)$cpuTimes[$key];
+            }
+        }
+        return $sum;
+    };
+    $perCore = isset($row['cpu_per_core']) && is_array($row['cpu_per_core'])
+        ? json_encode(array_map('floatval', array_values($row['cpu_per_core'])))
+        : null;
+    // Агрегаты частых выборок агента за интервал: {cpu: {min, max, avg, p95, last}, memory: ..., period}
+    $samples = isset($row['samples']) && is_array($row['samples']) ? json_encode($row['samples']) : null;
+    // Трафик по интерфейсам за интервал: {eth0: {rx_bytes, rx_bps, rx_pps, rx_errors_ps, ..., reset}}
+    $netInterfaces = isset($row['net_interfaces']) && is_array($row['net_interfaces'])
+        ? json_encode(array_slice($row['net_interfaces'], 0, 64, true))
+        : null;
+    // PSI: {cpu|memory|io: {some|full: {avg10, avg60, avg300, stall}}}; в колонки — stall (% интервала,
+    // посчитан агентом по приращению total), у старых ядер/агентов без него — avg60
+    $pressure = isset($row['pressure']) && is_array($row['pressure']) ? $row['pressure'] : [];
+    $psi = static function (string $resource, string $kind) use ($pressure) {
+        $values = $pressure[$resource][$kind] ?? null;
+        if (!is_array($values)) {
+            return null;
+        }
+        foreach (['stall', 'avg60'] as $key) {
+            if (isset($values[$key]) && is_numeric($values[$key])) {
+                return (float)$values[$key];
+            }
+        }
+        return null;
+    };
+    $num = static function (string $key) use ($row) {
+        return isset($row[$key]) && is_numeric($row[$key]) ? $row[$key] : null;
+    };
+    $stmt = $pdo->prepare(
+        "INSERT INTO metrics
+            (node_id, cpu_percent, memory_percent, disk_percent, network_in, network_out,
+             memory_used, memory_total, disk_used, disk_total, swap_percent, load_avg, cpu_count,
+             cpu_user, cpu_system, cpu_iowait, cpu_steal, cpu_irq, cpu_per_core, samples,
+             network_in_rate, network_out_rate, net_interfaces,
+             load_avg5, load_avg15, procs_running, procs_blocked, ctxt_rate, intr_rate,
+             psi_cpu_some, psi_memory_some, psi_memory_full, psi_io_some, psi_io_full, pressure, timestamp)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                 ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(FROM_UNIXTIME(?), CURRENT_TIMESTAMP))"
+    );
+    $stmt->execute([
+        $nodeId,
+        $row['cpu_percent'] ?? null,
+        $row['memory_percent'] ?? null,
+        $row['disk_percent'] ?? null,
+        $row['network_in'] ?? null,
+        $row['network_out'] ?? null,
+        $row['memory_used'] ?? null,
+        $row['memory_total'] ?? null,
+        $row['disk_used'] ?? null,
+        $row['disk_total'] ?? null,
+        $row['swap_percent'] ?? null,
+        $row['load_avg'] ?? null,
+        $row['cpu_count'] ?? null,
+        $cpuField('user', 'nice'),
+        $cpuField('system'),
+        $cpuField('iowait'),
+        $cpuField('steal'),
+        $cpuField('irq', 'softirq'),
+        $perCore,
+        $samples,
+        isset($row['network_in_rate']) && is_numeric($row['network_in_rate']) ? (float)$row['network_in_rate'] : null,
+        isset($row['network_out_rate']) && is_numeric($row['network_out_rate']) ? (float)$row['network_out_rate'] : null,
+        $netInterfaces,
+        $num('load_avg5'),
+        $num('load_avg15'),
+        $num('procs_running'),
+        $num('procs_blocked'),
+        $num('ctxt_rate'),
+        $num('intr_rate'),
+        $psi('cpu', 'some'),
+        $psi('memory', 'some'),
+        $psi('memory', 'full'),
+        $psi('io', 'some'),
+        $psi('io', 'full'),
+        $pressure ? json_encode($pressure) : null,
+        $collectedAt,
+    ]);
+    $id = (int)$pdo->lastInsertId();
+
+    // Ввод-вывод по дискам за интервал (агент считает по приращениям /proc/diskstats) — история, с тем же временем точки
+    $diskIo = isset($row['disk_io']) && is_array($row['disk_io']) ? array_slice($row['disk_io'], 0, 64) : [];
+    if ($diskIo) {
+        $ioStmt = $pdo->prepare(
+            "INSERT INTO disk_io_metrics
+                (node_id, device, read_bps, write_bps, read_iops, write_iops, await_ms, util, timestamp)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(FROM_UNIXTIME(?), CURRENT_TIMESTAMP))"
+        );
+        foreach ($diskIo as $dev) {
+            if (!is_array($dev) || empty($dev['device'])) {
+                continue;
+            }
+            $ioStmt->execute([
+                $nodeId,
+                substr((string)$dev['device'], 0, 64),
+                (float)($dev['read_bps'] ?? 0),
+                (float)($dev['write_bps'] ?? 0),
+                (float)($dev['read_iops'] ?? 0),
+                (float)($dev['write_iops'] ?? 0),
+                (float)($dev['await_ms'] ?? 0),
+                isset($dev['util']) && is_numeric($dev['util']) ? (float)$dev['util'] : null,
+                $collectedAt,
+            ]);
+        }
+    }
+
+    // gpu_metrics и filesystem_usage — текущее состояние, а не история: досылаемая старая точка его не перезаписывает
+    $gpuInfo = $row['gpu'] ?? null;
+    $stale = $collectedAt !== null && $collectedAt < time() - 300;
+    $filesystems = isset($row['filesystems']) && is_array($row['filesystems']) ? array_slice($row['filesystems'], 0, 200) : null;
+    if ($filesystems !== null && !$stale) {
+        $pdo->prepare("DELETE FROM filesystem_usage WHERE node_id = ?")->execute([$nodeId]);
+        $fsStmt = $pdo->prepare(
+            "INSERT INTO filesystem_usage
+                (node_id, mount, device, fstype, network, stale, total, used, free, percent,
+                 inodes_total, inodes_used, inodes_percent)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        );
+        $num = static function (array $fs, string $key) {
+            return isset($fs[$key]) && is_numeric($fs[$key]) ? $fs[$key] : null;
+        };
+        foreach ($filesystems as $fs) {
+            if (!is_array($fs) || empty($fs['mount'])) {
+                continue;
+            }
+            // stale — сетевая ФС не ответила на statvfs: цифры последние известные или их нет совсем
+            $fsStmt->execute([
+                $nodeId,
+                substr((string)$fs['mount'], 0, 512),
+                substr((string)($fs['device'] ?? ''), 0, 255),
+                substr((string)($fs['fstype'] ?? ''), 0, 32),
+                !empty($fs['network']) ? 1 : 0,
+                !empty($fs['stale']) ? 1 : 0,
+                $num($fs, 'total'),
+                $num($fs, 'used'),
+                $num($fs, 'free'),
+                $num($fs, 'percent'),
+                $num($fs, 'inodes_total'),
+                $num($fs, 'inodes_used'),
+                $num($fs, 'inodes_percent'),
+            ]);
+        }
+    }
+    if ($gpuInfo && is_array($gpuInfo) && !$stale) {
+        $deleteGpuStmt = $pdo->prepare("DELETE FROM gpu_metrics WHERE node_id = ?");
+        $deleteGpuStmt->execute([$nodeId]);
+
+        $gpuStmt = $pdo->prepare("INSERT INTO gpu_metrics (node_id, gpu_index, gpu_name, vendor, utilization, memory_used, memory_total, temperature, uuid, memory_utilization, power_watts, power_limit_watts, clock_graphics_mhz, clock_sm_mhz, clock_memory_mhz, ecc_corrected, ecc_uncorrected, fan_percent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)");
+        foreach ($gpuInfo as $gpu) {
+            $gpuStmt->execute([
+                $nodeId,
+                $gpu['index'] ?? 0,
+                $gpu['name'] ?? 'Unknown',
+                $gpu['vendor'] ?? 'unknown',
+                // Не прочитанное агентом (null) так и храним: «нет данных» не выдаётся за простой при 0 °C
+                $gpu['utilization'] ?? null,
+                $gpu['memory_used'] ?? null,
+                $gpu['memory_total'] ?? null,
+                $gpu['temperature'] ?? null,
+                $gpu['uuid'] ?? null,
+                $gpu['memory_utilization'] ?? null,
+                $gpu['power_watts'] ?? null,
+                $gpu['power_limit_watts'] ?? null,
+                $gpu['clock_graphics_mhz'] ?? null,
+                $gpu['clock_sm_mhz'] ?? null,
+                $gpu['clock_memory_mhz'] ?? null,
+                $gpu['ecc_corrected'] ?? null,
+                $gpu['ecc_uncorrected'] ?? null,
+                $gpu['fan_percent'] ?? null
+            ]);
+        }
+    }
+    return $id;
+}
+
+function processes_ensure_schema(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $done = true;
+    // Память и загрузка GPU процесса и его контейнер — только у процессов на GPU, у остальных NULL
+    foreach ([
+        "ALTER TABLE processes ADD COLUMN gpu_memory BIGINT NULL",
+        "ALTER TABLE processes ADD COLUMN gpu_util FLOAT NULL",
+        "ALTER TABLE processes ADD COLUMN container_id VARCHAR(64) NULL",
+    ] as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Exception $e) {
+            // column already exists
+        }
+    }
+}
+
+function ingest_processes(PDO $pdo, int $nodeId, array $processes): int
+{
+    $deleteStmt = $pdo->prepare("DELETE FROM processes WHERE node_id = ?");
+    $deleteStmt->execute([$nodeId]);
+    if (!$processes) {
+        return 0;
+    }
+    $stmt = $pdo->prepare("INSERT INTO processes (node_id, pid, name, cpu_percent, memory_percent, status, gpu_memory, gpu_util, container_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)");
+    foreach ($processes as $process) {
+        $stmt->execute([
+            $nodeId,
+            $process['pid'] ?? 0,
+            $process['name'] ?? 'unknown',
+            $process['cpu_percent'] ?? 0,
+            $process['memory_percent'] ?? 0,
+            $process['status'] ?? 'running',
+            isset($process['gpu_memory']) && is_numeric($process['gpu_memory']) ? $process['gpu_memory'] : null,
+            isset($process['gpu_util']) && is_numeric($process['gpu_util']) ? $process['gpu_util'] : null,
+            isset($process['container_id']) && is_string($process['container_id']) ? $process['container_id'] : null,
+        ]);
+    }
+    return count($processes);
+}
+
+function containers_ensure_schema(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $done = true;
+
+    $alters = [
+        "ALTER TABLE containers ADD COLUMN networks TEXT NULL",
+        "ALTER TABLE containers ADD COLUMN ports TEXT NULL",
+        "ALTER TABLE containers ADD COLUMN ipv4 VARCHAR(45) NULL",
+        "ALTER TABLE containers ADD COLUMN network_mode VARCHAR(128) NULL",
+        "ALTER TABLE containers ADD COLUMN raw_status VARCHAR(255) NULL",
+        "ALTER TABLE containers ADD COLUMN memory_usage BIGINT NULL",
+        "ALTER TABLE containers ADD COLUMN memory_limit BIGINT NULL",
+        "ALTER TABLE containers ADD COLUMN block_read_bps DOUBLE NULL",
+        "ALTER TABLE containers ADD COLUMN block_write_bps DOUBLE NULL",
+        "ALTER TABLE containers ADD COLUMN pids INT NULL",
+        "ALTER TABLE containers ADD COLUMN gpu_memory BIGINT NULL",
+        "ALTER TABLE containers ADD COLUMN gpu_util FLOAT NULL",
+        "ALTER TABLE containers ADD COLUMN gpu_pids INT NULL",
+    ];
+    foreach ($alters as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Exception $e) {
+            // column already exists
+        }
+    }
+
+    $pdo->exec("CREATE TABLE IF NOT EXISTS docker_networks (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        node_id INT NOT NULL,
+        network_id VARCHAR(64) NOT NULL,
+        name VARCHAR(255),
+        driver VARCHAR(64),
+        scope VARCHAR(32),
+        subnet VARCHAR(64),
+        gateway VARCHAR(45),
+        containers TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        UNIQUE KEY uniq_node_net (node_id, network_id),
+        INDEX idx_node_id (node_id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+}
+
+function replaceContainerSnapshot(PDO $pdo, int $nodeId, array $containers): void
+{
+    $deleteStmt = $pdo->prepare("DELETE FROM containers WHERE node_id = ?");
+    $deleteStmt->execute([$nodeId]);
+    containers_insert_rows($pdo, $nodeId, $containers);
+}
+
+function containers_insert_rows(PDO $pdo, int $nodeId, array $containers): void
+{
+    if (!$containers) {
+        return;
+    }
+    $stmt = $pdo->prepare(
+        "INSERT INTO containers
+            (node_id, container_id, name, image, status, cpu_percent, memory_percent, networks, ports, ipv4, network_mode, raw_status,
+             memory_usage, memory_limit, block_read_bps, block_write_bps, pids, gpu_memory, gpu_util, gpu_pids)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    );
+    // Байты памяти, скорости блочного I/O и число процессов агент берёт из cgroup v2; с docker stats их нет (NULL).
+    // GPU — сумма по процессам контейнера на картах; NULL — контейнер GPU не использует
+    $num = static function (array $container, string $key) {
+        return isset($container[$key]) && is_numeric($container[$key]) ? $container[$key] : null;
+    };
+    foreach ($containers as $container) {
+        $networks = $container['networks'] ?? [];
+        $ports = $container['ports'] ?? [];
+        $stmt->execute([
+            $nodeId,
+            $container['container_id'] ?? '',
+            $container['name'] ?? 'unknown',
+            $container['image'] ?? '',
+            $container['status'] ?? 'stopped',
+            $container['cpu_percent'] ?? 0,
+            $container['memory_percent'] ?? 0,
+            json_encode(is_array($networks) ? $networks : [], JSON_UNESCAPED_UNICODE),
+            json_encode(is_array($ports) ? $ports : [], JSON_UNESCAPED_UNICODE),
+            $container['ipv4'] ?? '',
+            $container['network_mode'] ?? '',
+            $container['raw_status'] ?? '',
+            $num($container, 'memory_usage'),
+            $num($container, 'memory_limit'),
+            $num($container, 'block_read_bps'),
+            $num($container, 'block_write_bps'),
+            $num($container, 'pids'),
+            $num($container, 'gpu_memory'),
+            $num($container, 'gpu_util'),
+            $num($container, 'gpu_pids'),
+        ]);
+    }
+}
+
+function replaceNetworkSnapshot(PDO $pdo, int $nodeId, array $networks): void
+{
+    $deleteStmt = $pdo->prepare("DELETE FROM docker_networks WHERE node_id = ?");
+    $deleteStmt->execute([$nodeId]);
+    docker_networks_insert_rows($pdo, $nodeId, $networks);
+}
+
+function docker_network_key(array $net): string
+{
+    return substr((string)($net['network_id'] ?? $net['id'] ?? ($net['name'] ?? '')), 0, 64);
+}
+
+function docker_networks_insert_rows(PDO $pdo, int $nodeId, array $networks): void
+{
+    if (!$networks) {
+        return;
+    }
+    $stmt = $pdo->prepare(
+        "INSERT INTO docker_networks
+            (node_id, network_id, name, driver, scope, subnet, gateway, containers)
+         VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    );
+    foreach ($networks as $net) {
+        $members = $net['containers'] ?? $net['members'] ?? [];
+        if (!is_array($members)) {
+            $members = [];
+        }
+        $networkId = docker_network_key($net);
+        if ($networkId === '') {
+            continue;
+        }
+        $stmt->execute([
+            $nodeId,
+            $networkId,
+            $net['name'] ?? '',
+            $net['driver'] ?? '',
+            $net['scope'] ?? '',
+            $net['subnet'] ?? '',
+            $net['gateway'] ?? '',
+            json_encode($members, JSON_UNESCAPED_UNICODE),
+        ]);
+    }
+}
+
+function ensure_network_interfaces_table(PDO $pdo): void
+{
+    $pdo->exec("CREATE TABLE IF NOT EXISTS network_interfaces (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        node_id INT NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        ip VARCHAR(45),
+        ipv6 VARCHAR(45) DEFAULT NULL,
+        netmask VARCHAR(45),
+        ipv6_netmask VARCHAR(45) DEFAULT NULL,
+        gateway VARCHAR(45) DEFAULT NULL,
+        gateway6 VARCHAR(45) DEFAULT NULL,
+        status VARCHAR(20),
+        speed INT DEFAULT 0,
+        rx_bytes BIGINT DEFAULT 0,
+        tx_bytes BIGINT DEFAULT 0,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_node_id (node_id),
+        INDEX idx_timestamp (timestamp)
+    )");
+    foreach ([
+        'ALTER TABLE network_interfaces ADD COLUMN gateway VARCHAR(45) DEFAULT NULL AFTER netmask',
+        'ALTER TABLE network_interfaces ADD COLUMN ipv6 VARCHAR(45) DEFAULT NULL AFTER ip',
+        'ALTER TABLE network_interfaces ADD COLUMN ipv6_netmask VARCHAR(45) DEFAULT NULL AFTER netmask',
+        'ALTER TABLE network_interfaces ADD COLUMN gateway6 VARCHAR(45) DEFAULT NULL AFTER gateway',
+    ] as $sql) {
+        try {
+            $pdo->exec($sql);
+        } catch (Exception $e) {
+            // column already exists
+        }
+    }
+}
+
+function ensure_network_neighbors_table(PDO $pdo): void
+{
+    $pdo->exec("CREATE TABLE IF NOT EXISTS network_neighbors (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        node_id INT NOT NULL,
+        ip VARCHAR(45) NOT NULL,
+        mac VARCHAR(32) DEFAULT NULL,
+        iface VARCHAR(100) DEFAULT NULL,
+        family TINYINT DEFAULT 4,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_nn_node (node_id),
+        INDEX idx_nn_ip (ip)
+    )");
+}
+
+function ingest_ports(PDO $pdo, int $nodeId, array $ports): int
+{
+    $deleteStmt = $pdo->prepare("DELETE FROM ports WHERE node_id = ?");
+    $deleteStmt->execute([$nodeId]);
+    return ports_insert_rows($pdo, $nodeId, $ports);
+}
+
+function ports_insert_rows(PDO $pdo, int $nodeId, array $ports): int
+{
+    if (!$ports) {
+        return 0;
+    }
+    $stmt = $pdo->prepare("INSERT INTO ports (node_id, port, type, status, process_name, pid) VALUES (?, ?, ?, ?, ?, ?)");
+    foreach ($ports as $port) {
+        $stmt->execute([
+            $nodeId,
+            $port['port'] ?? 0,
+            $port['type'] ?? 'tcp',
+            $port['status'] ?? 'open',
+            $port['process_name'] ?? null,
+            $port['pid'] ?? null
+        ]);
+    }
+    return count($ports);
+}
+
+function ingest_interfaces(PDO $pdo, int $nodeId, array $interfaces): int
+{
+    $deleteStmt = $pdo->prepare("DELETE FROM network_interfaces WHERE node_id = ?");
+    $deleteStmt->execute([$nodeId]);
+    return interfaces_insert_rows($pdo, $nodeId, $interfaces);
+}
+
+function interfaces_insert_rows(PDO $pdo, int $nodeId, array $interfaces): int
+{
+    if (!$interfaces) {
+        return 0;
+    }
+    $stmt = $pdo->prepare("INSERT INTO network_interfaces (node_id, name, ip, ipv6, netmask, ipv6_netmask, gateway, gateway6, status, speed, rx_bytes, tx_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)");
+    foreach ($interfaces as $iface) {
+        $stmt->execute([
+            $nodeId,
+            $iface['name'] ?? 'unknown',
+            $iface['ip'] ?? null,
+            $iface['ipv6'] ?? null,
+            $iface['netmask'] ?? null,
+            $iface['ipv6_netmask'] ?? null,
+            $iface['gateway'] ?? null,
+            $iface['gateway6'] ?? null,
+            $iface['status'] ?? 'unknown',
+            $iface['speed'] ?? 0,
+            $iface['rx_bytes'] ?? 0,
+            $iface['tx_bytes'] ?? 0
+        ]);
+    }
+    return count($interfaces);
+}
+
+function ingest_neighbors(PDO $pdo, int $nodeId, array $neighbors): int
+{
+    $pdo->prepare("DELETE FROM network_neighbors WHERE node_id = ?")->execute([$nodeId]);
+    return neighbors_insert_rows($pdo, $nodeId, $neighbors);
+}
+
+function neighbors_insert_rows(PDO $pdo, int $nodeId, array $neighbors): int
+{
+    if (!$neighbors) {
+        return 0;
+    }
+    $inserted = 0;
+    $nstmt = $pdo->prepare("INSERT INTO network_neighbors (node_id, ip, mac, iface, family) VALUES (?, ?, ?, ?, ?)");
+    foreach ($neighbors as $row) {
+        $ip = trim((string)($row['ip'] ?? ''));
+        if ($ip === '') {
+            continue;
+        }
+        $nstmt->execute([
+            $nodeId,
+            mb_substr($ip, 0, 45),
+            mb_substr((string)($row['mac'] ?? ''), 0, 32) ?: null,
+            mb_substr((string)($row['iface'] ?? ''), 0, 100) ?: null,
+            (int)($row['family'] ?? (strpos($ip, ':') !== false ? 6 : 4)),
+        ]);
+        $inserted++;
+    }
+    return $inserted;
+}
+
+function ingest_logs(PDO $pdo, int $nodeId, array $logs): int
+{
+    $stmtSystem = $pdo->prepare("INSERT INTO logs (node_id, level, message, timestamp, type) VALUES (?, ?, ?, ?, ?)");
+    $stmtProcess = $pdo->prepare("INSERT INTO process_logs (node_id, pid, process, level, message, timestamp) VALUES (?, ?, ?, ?, ?, ?)");
+    $stmtContainer = $pdo->prepare("INSERT INTO container_logs (node_id, container_id, level, message, timestamp) VALUES (?, ?, ?, ?, ?)");
+    $stmtSshAuth = $pdo->prepare("INSERT INTO ssh_auth_logs (node_id, level, process, username, ip_address, port, success, message, raw_message, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)");
+    $inserted = 0;
+
+    foreach ($logs as $log) {
+        $level = $log['level'] ?? 'info';
+        $message = $log['message'] ?? '';
+        $timestamp = $log['timestamp'] ?? date('Y-m-d H:i:s');
+        $type = $log['type'] ?? 'system';
+        if ($message === '' || $message === null) {
+            continue;
+        }
+
+        if ($type === 'process') {
+            $pid = isset($log['pid']) ? (int)$log['pid'] : null;
+            $stmtProcess->bindValue(1, $nodeId, PDO::PARAM_INT);
+            $stmtProcess->bindValue(2, $pid, $pid !== null ? PDO::PARAM_INT : PDO::PARAM_NULL);
+            $stmtProcess->bindValue(3, $log['process'] ?? 'system', PDO::PARAM_STR);
+            $stmtProcess->bindValue(4, $level, PDO::PARAM_STR);
+            $stmtProcess->bindValue(5, $message, PDO::PARAM_STR);
+            $stmtProcess->bindValue(6, $timestamp, PDO::PARAM_STR);
+            $stmtProcess->execute();
+        } elseif ($type === 'container' && !empty($log['container_id'])) {
+            $stmtContainer->execute([$nodeId, $log['container_id'], $level, $message, $timestamp]);
+        } elseif ($type === 'auth_ssh') {
+            $successForDb = null;
+            if (array_key_exists('success', $log) && $log['success'] !== null && $log['success'] !== '') {
+                $successForDb = !empty($log['success']) && $log['success'] !== 'false' && $log['success'] !== '0' ? 1 : 0;
+                if ($log['success'] === false || $log['success'] === 0 || $log['success'] === '0') {
+                    $successForDb = 0;
+                }
+                if ($log['success'] === true || $log['success'] === 1 || $log['success'] === '1') {
+                    $successForDb = 1;
+                }
+            }
+            $port = isset($log['port']) ? (int)$log['port'] : null;
+            $stmtSshAuth->bindValue(1, $nodeId, PDO::PARAM_INT);
+            $stmtSshAuth->bindValue(2, $level, PDO::PARAM_STR);
+            $stmtSshAuth->bindValue(3, $log['process'] ?? 'sshd', PDO::PARAM_STR);
+            $stmtSshAuth->bindValue(4, $log['username'] ?? null, !empty($log['username']) ? PDO::PARAM_STR : PDO::PARAM_NULL);
+            $stmtSshAuth->bindValue(5, $log['ip'] ?? ($log['ip_address'] ?? null), PDO::PARAM_STR);
+            $stmtSshAuth->bindValue(6, $port, $port !== null ? PDO::PARAM_INT : PDO::PARAM_NULL);
+            $stmtSshAuth->bindValue(7, $successForDb, $successForDb === null ? PDO::PARAM_NULL : PDO::PARAM_INT);
+            $stmtSshAuth->bindValue(8, $message, PDO::PARAM_STR);
+            $stmtSshAuth->bindValue(9, $log['raw_message'] ?? $message, PDO::PARAM_STR);
+            $stmtSshAuth->bindValue(10, $timestamp, PDO::PARAM_STR);
+            try {
+                $stmtSshAuth->execute();
+            } catch (Exception $e) {
+                error_log("Error inserting SSH log: " . $e->getMessage());
+                continue;
+            }
+        } else {
+            $stmtSystem->execute([$nodeId, $level, $message, $timestamp, $type]);
+        }
+        $inserted++;
+    }
+    return $inserted;
+}
+
+/*
+ * Дельта-снимки: агент шлёт только добавленные/изменённые (upsert) и исчезнувшие (remove) элементы
+ * относительно версии, которую мастер подтвердил раньше. Версия хранится по (node_id, section);
+ * несовпадение base — сигнал агенту прислать полный снимок.
+ */
+function ingest_ensure_versions_table(PDO $pdo): void
+{
+    static $done = false;
+    if ($done) {
+        return;
+    }
+    $done = true;
+    $pdo->exec("CREATE TABLE IF NOT EXISTS agent_section_versions (
+        node_id INT NOT NULL,
+        section VARCHAR(32) NOT NULL,
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (node_id, section)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci");
+}
+
+function ingest_section_version(PDO $pdo, int $nodeId, string $section): ?int
+{
+    $stmt = $pdo->prepare("SELECT version FROM agent_section_versions WHERE node_id = ? AND section = ?");
+    $stmt->execute([$nodeId, $section]);
+    $version = $stmt->fetchColumn();
+    return $version === false ? null : (int)$version;
+}
+
+function ingest_store_section_version(PDO $pdo, int $nodeId, string $section, int $version): void
+{
+    $pdo->prepare(
+        "INSERT INTO agent_section_versions (node_id, section, version) VALUES (?, ?, ?)
+         ON DUPLICATE KEY UPDATE version = VALUES(version)"
+    )->execute([$nodeId, $section, $version]);
+}
+
+function ingest_delta_part($payload, string $key): array
+{
+    $part = is_array($payload[$key] ?? null) ? $payload[$key] : [];
+    $upsert = is_array($part['upsert'] ?? null) ? array_values(array_filter($part['upsert'], 'is_array')) : [];
+    $remove = is_array($part['remove'] ?? null) ? array_map('strval', $part['remove']) : [];
+    return [$upsert, $remove];
+}
+
+function ingest_delete_keys(PDO $pdo, string $table, string $column, int $nodeId, array $keys): void
+{
+    // $table/$column — только константы из этого файла
+    $keys = array_values(array_unique(array_filter($keys, static fn($k) => $k !== '')));
+    foreach (array_chunk($keys, 500) as $chunk) {
+        $in = implode(',', array_fill(0, count($chunk), '?'));
+        $pdo->prepare("DELETE FROM {$table} WHERE node_id = ? AND {$column} IN ({$in})")
+            ->execute(array_merge([$nodeId], $chunk));
+    }
+}
+
+function containers_apply_delta(PDO $pdo, int $nodeId, array $payload): array
+{
+    [$upsert, $remove] = ingest_delta_part($payload, 'containers');
+    $keys = array_merge($remove, array_map(static fn($c) => (string)($c['container_id'] ?? ''), $upsert));
+    ingest_delete_keys($pdo, 'containers', 'container_id', $nodeId, $keys);
+    containers_insert_rows($pdo, $nodeId, $upsert);
+
+    [$netUpsert, $netRemove] = ingest_delta_part($payload, 'networks');
+    $netKeys = array_merge(
+        array_map(static fn($k) => substr($k, 0, 64), $netRemove),
+        array_map('docker_network_key', $netUpsert)
+    );
+    ingest_delete_keys($pdo, 'docker_networks', 'network_id', $nodeId, $netKeys);
+    docker_networks_insert_rows($pdo, $nodeId, $netUpsert);
+    return ['upserted' => count($upsert) + count($netUpsert), 'removed' => count($remove) + count($netRemove)];
+}
+
+function ports_apply_delta(PDO $pdo, int $nodeId, array $payload): array
+{
+    // Ключ порта — "port/proto", как у агента
+    [$upsert, $remove] = ingest_delta_part($payload, 'ports');
+    $keys = $remove;
+    foreach ($upsert as $port) {
+        $keys[] = (int)($port['port'] ?? 0) . '/' . ($port['type'] ?? 'tcp');
+    }
+    $del = $pdo->prepare("DELETE FROM ports WHERE node_id = ? AND port = ? AND type = ?");
+    foreach (array_unique($keys) as $key) {
+        [$port, $proto] = array_pad(explode('/', $key, 2), 2, 'tcp');
+        $del->execute([$nodeId, (int)$port, $proto]);
+    }
+    ports_insert_rows($pdo, $nodeId, $upsert);
+    return ['upserted' => count($upsert), 'removed' => count($remove)];
+}
+
+function interfaces_apply_delta(PDO $pdo, int $nodeId, array $payload): array
+{
+    [$upsert, $remove] = ingest_delta_part($payload, 'interfaces');
+    $keys = array_merge($remove, array_map(static fn($i) => (string)($i['name'] ?? ''), $upsert));
+    ingest_delete_keys($pdo, 'network_interfaces', 'name', $nodeId, $keys);
+    interfaces_insert_rows($pdo, $nodeId, $upsert);
+
+    // Ключ соседа — "ip|iface" (iface может быть пустым)
+    [$nUpsert, $nRemove] = ingest_delta_part($payload, 'neighbors');
+    $nKeys = $nRemove;
+    foreach ($nUpsert as $row) {
+        $nKeys[] = trim((string)($row['ip'] ?? '')) . '|' . (string)($row['iface'] ?? '');
+    }
+    $del = $pdo->prepare("DELETE FROM network_neighbors WHERE node_id = ? AND ip = ? AND iface <=> ?");
+    foreach (array_unique($nKeys) as $key) {
+        [$ip, $iface] = array_pad(explode('|', $key, 2), 2, '');
+        $del->execute([$nodeId, mb_substr($ip, 0, 45), $iface !== '' ? mb_substr($iface, 0, 100) : null]);
+    }
+    neighbors_insert_rows($pdo, $nodeId, $nUpsert);
+    return ['upserted' => count($upsert) + count($nUpsert), 'removed' => count($remove) + count($nRemove)];
+}
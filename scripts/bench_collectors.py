@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк коллекторов агента на записанных фикстурах: время (wall/CPU) и пиковая память на коллектор.
+
+Фикстуры — каталог с поддельным /proc и выводом внешних команд (ss, docker, journalctl, auth.log).
+Коллекторы выполняются как есть: psutil и agent/procfs.py читают поддельный /proc (psutil.PROCFS_PATH),
+subprocess.run отдаёт записанный вывод вместо запуска ss/docker/journalctl.
+
+    python scripts/bench_collectors.py                        # синтетические фикстуры (5000 процессов, 300 контейнеров)
+    python scripts/bench_collectors.py --record /tmp/fx       # записать фикстуры с этой ноды
+    python scripts/bench_collectors.py --fixtures /tmp/fx --save base.json
+    python scripts/bench_collectors.py --fixtures /tmp/fx --compare base.json   # код 1 при регрессии
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "agent"))
+
+# Файлы фикстур относительно каталога: вывод команд и логи
+CMD_FILES = {
+    "ss": "cmd/ss_tlnp.txt",
+    "docker_ps": "cmd/docker_ps.txt",
+    "docker_inspect": "cmd/docker_inspect.json",
+    "docker_stats": "cmd/docker_stats.txt",
+    "docker_network_ls": "cmd/docker_network_ls.txt",
+    "docker_network_inspect": "cmd/docker_network_inspect.json",
+    "journal_system": "cmd/journal_system.txt",
+    "journal_sshd": "cmd/journal_sshd.txt",
+}
+LOG_FILES = {
+    "/var/log/syslog": "log/syslog",
+    "/var/log/messages": "log/messages",
+    "/var/log/auth.log": "log/auth.log",
+    "/var/log/secure": "log/secure",
+}
+# Что копировать из настоящего /proc при --record (кроме каталогов процессов)
+PROC_FILES = ("stat", "meminfo", "vmstat", "filesystems", "loadavg", "uptime", "net/dev", "diskstats", "self/mounts",
+              "pressure/cpu", "pressure/memory", "pressure/io")
+PID_FILES = ("stat", "statm", "status", "cmdline")
+# Файлы cgroup v2 контейнера, которые читает agent/cgroups.py
+CGROUP_FILES = ("cpu.stat", "memory.current", "memory.max", "memory.stat", "io.stat", "pids.current")
+
+SSH_MESSAGES = (
+    "Accepted publickey for deploy from {ip} port {port} ssh2: ED25519 SHA256:abcdef",
+    "Accepted password for root from {ip} port {port} ssh2",
+    "Failed password for root from {ip} port {port} ssh2",
+    "Failed password for invalid user {user} from {ip} port {port} ssh2",
+    "Invalid user {user} from {ip} port {port}",
+    "pam_unix(sshd:auth): authentication failure; logname= uid=0 euid=0 tty=ssh ruser= rhost={ip}  user={user}",
+    "Disconnected from authenticating user {user} {ip} port {port} [preauth]",
+    "Received disconnect from {ip} port {port}:11: Bye Bye [preauth]",
+    "Connection closed by {ip} port {port} [preauth]",
+    "Connection reset by {ip} port {port} [preauth]",
+)
+SYSTEM_MESSAGES = (
+    ("systemd", "Started Session {n} of user root."),
+    ("systemd", "Starting Daily apt download activities..."),
+    ("kernel", "[UFW BLOCK] IN=eth0 OUT= SRC={ip} DST=10.0.0.2 PROTO=TCP SPT={port} DPT=22"),
+    ("dockerd", "level=warning msg=\"Health check for container {n} failed\""),
+    ("containerd", "shim disconnected id={n}"),
+    ("CRON", "(root) CMD (command -v debian-sa1 > /dev/null && debian-sa1 1 1)"),
+    ("nginx", "connect() failed (111: Connection refused) while connecting to upstream"),
+    ("smartd", "Device: /dev/sda [SAT], SMART Usage Attribute: 194 Temperature_Celsius changed from 35 to 36"),
+)
+PROCESS_NAMES = ("nginx", "php-fpm8.2", "python3", "postgres", "redis-server", "dockerd", "containerd-shim",
+                 "sshd", "node", "java", "kworker/3:1-events", "systemd-journald", "bash", "cron", "mysqld")
+
+
+def _write(base: pathlib.Path, rel: str, text: str) -> None:
+    path = base / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def _ip(rnd: random.Random) -> str:
+    return f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(1, 254)}"
+
+
+def generate(base: pathlib.Path, procs: int, containers: int, sockets: int, log_lines: int, seed: int = 1) -> None:
+    # Синтетические фикстуры большой ноды; seed фиксирован, чтобы прогоны были сравнимы
+    rnd = random.Random(seed)
+    btime = 1_760_000_000
+    cpus = 16
+
+    cpu_line = lambda name: f"{name} {' '.join(str(rnd.randint(10_000, 9_000_000)) for _ in range(10))}"
+    _write(base, "proc/stat", "\n".join(
+        [cpu_line("cpu")] + [cpu_line(f"cpu{i}") for i in range(cpus)] + [
+            "intr 912345678 " + " ".join("0" for _ in range(64)),
+            "ctxt 1234567890", f"btime {btime}", "processes 9876543",
+            "procs_running 3", "procs_blocked 0",
+        ]) + "\n")
+    mem_kb = 64 * 1024 * 1024
+    _write(base, "proc/meminfo", "".join(f"{k}:{v:>16} kB\n" for k, v in (
+        ("MemTotal", mem_kb), ("MemFree", mem_kb // 8), ("MemAvailable", mem_kb // 3), ("Buffers", 512_000),
+        ("Cached", mem_kb // 5), ("SwapCached", 0), ("Active", mem_kb // 3), ("Inactive", mem_kb // 4),
+        ("Shmem", 300_000), ("Slab", 900_000), ("SReclaimable", 700_000), ("SUnreclaim", 200_000),
+        ("SwapTotal", 8 * 1024 * 1024), ("SwapFree", 7 * 1024 * 1024),
+    )))
+    disks = [f"sd{c}" for c in "abcd"] + [f"nvme{i}n1" for i in range(4)]
+    _write(base, "proc/diskstats", "".join(
+        f"8 {n * 16} {name} " + " ".join(str(rnd.randint(0, 10**9)) for _ in range(17)) + "\n"
+        for n, name in enumerate(disks)))
+    for resource in ("cpu", "memory", "io"):
+        _write(base, f"proc/pressure/{resource}", "".join(
+            f"{kind} avg10=1.25 avg60=0.80 avg300=0.51 total={rnd.randint(10**6, 10**10)}\n" for kind in ("some", "full")))
+    _write(base, "proc/vmstat", "pgpgin 123456\npgpgout 654321\npswpin 100\npswpout 200\n")
+    _write(base, "proc/filesystems", "nodev\tsysfs\nnodev\ttmpfs\nnodev\tproc\nnodev\toverlay\n\text4\n\txfs\n\tvfat\n")
+    _write(base, "proc/self/mounts", "\n".join([
+        "/dev/root / ext4 rw,relatime 0 0",
+        "proc /proc proc rw,nosuid,nodev,noexec,relatime 0 0",
+        "tmpfs /run tmpfs rw,nosuid,nodev,size=6553600k,mode=755 0 0",
+        "/dev/sda15 /boot/efi vfat rw,relatime 0 0",
+    ] + [f"overlay /var/lib/docker/overlay2/{i:064x}/merged overlay rw,relatime 0 0" for i in range(containers)]) + "\n")
+    ifaces = ["lo", "eth0", "eth1", "docker0"] + [f"br-{i:012x}" for i in range(8)] + [f"veth{i:07x}" for i in range(containers)]
+    _write(base, "proc/net/dev", "Inter-|   Receive                                                |  Transmit\n"
+           " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+           + "".join(f"{name:>6}: {rnd.randint(0, 10**12)} {rnd.randint(0, 10**9)} 0 0 0 0 0 0 "
+                     f"{rnd.randint(0, 10**12)} {rnd.randint(0, 10**9)} 0 0 0 0 0 0\n" for name in ifaces))
+
+    pids = list(range(1, procs + 1))
+    for pid in pids:
+        name = rnd.choice(PROCESS_NAMES)
+        state = rnd.choice("SSSSSSSRID")
+        fields = [state, str(max(1, pid // 7)), str(pid), str(pid), "0", "-1", "4194560",
+                  *(str(rnd.randint(0, 10**6)) for _ in range(4)),
+                  str(rnd.randint(0, 10**6)), str(rnd.randint(0, 10**5)), "0", "0", "20", "0",
+                  str(rnd.randint(1, 64)), "0", str(rnd.randint(100, 10**7)),
+                  str(rnd.randint(10**6, 10**10)), str(rnd.randint(100, 10**6))]
+        fields += ["0"] * (50 - len(fields))
+        _write(base, f"proc/{pid}/stat", f"{pid} ({name}) {' '.join(fields)}\n")
+        _write(base, f"proc/{pid}/statm", " ".join(str(rnd.randint(100, 10**6)) for _ in range(7)) + "\n")
+        _write(base, f"proc/{pid}/status", f"Name:\t{name}\nState:\t{state} (sleeping)\nPid:\t{pid}\n"
+               f"PPid:\t{max(1, pid // 7)}\nUid:\t0\t0\t0\t0\nGid:\t0\t0\t0\t0\nThreads:\t4\n")
+        _write(base, f"proc/{pid}/cmdline", f"/usr/bin/{name}\0--config\0/etc/{name}.conf\0")
+
+    lines = ["State  Recv-Q Send-Q Local Address:Port Peer Address:Port Process"]
+    for i in range(sockets):
+        pid = rnd.choice(pids)
+        addr = rnd.choice(("0.0.0.0", "127.0.0.1", "[::]", "10.0.0.2"))
+        lines.append(f"LISTEN 0      4096   {addr}:{1024 + i} 0.0.0.0:* "
+                     f"users:((\"{rnd.choice(PROCESS_NAMES)}\",pid={pid},fd={rnd.randint(3, 900)}))")
+    _write(base, CMD_FILES["ss"], "\n".join(lines) + "\n")
+
+    networks = [{"Id": f"{i:064x}", "Name": "bridge" if i == 0 else f"stack{i}_default", "Driver": "bridge",
+                 "Scope": "local", "IPAM": {"Driver": "default", "Config": [{"Subnet": f"172.{17 + i}.0.0/16",
+                                                                             "Gateway": f"172.{17 + i}.0.1"}]},
+                 "Containers": {}} for i in range(8)]
+    inspected, stats = [], []
+    for i in range(containers):
+        cid = "".join(rnd.choice("0123456789abcdef") for _ in range(64))
+        net = networks[i % len(networks)]
+        ip = net["IPAM"]["Config"][0]["Subnet"].rsplit(".", 2)[0] + f".{i // 250}.{i % 250 + 2}"
+        running = rnd.random() < 0.85
+        net["Containers"][cid] = {"Name": f"app-{i}", "IPv4Address": f"{ip}/16", "MacAddress": "02:42:ac:11:00:02"}
+        inspected.append({
+            "Id": cid, "Name": f"/app-{i}", "Created": "2026-01-01T00:00:00.000000000Z",
+            "State": {"Status": "running" if running else "exited", "Running": running, "Pid": rnd.choice(pids),
+                      "ExitCode": 0 if running else 137, "Error": "",
+                      "StartedAt": "2026-01-01T00:00:01.000000000Z", "FinishedAt": "0001-01-01T00:00:00Z"},
+            "Image": "sha256:" + "ab" * 32,
+            "Config": {"Image": f"registry.local/app{i % 40}:1.{i % 9}",
+                       "Env": [f"VAR_{k}=value-{k}-{i}" for k in range(20)],
+                       "Labels": {f"com.example.label{k}": f"v{k}" for k in range(15)},
+                       "Cmd": ["/bin/sh", "-c", "exec app"], "ExposedPorts": {"80/tcp": {}, "443/tcp": {}}},
+            "HostConfig": {"NetworkMode": net["Name"], "RestartPolicy": {"Name": "unless-stopped"},
+                           "Binds": [f"/srv/app{i}:/data:rw"], "Memory": 0, "CpuShares": 0},
+            "Mounts": [{"Type": "bind", "Source": f"/srv/app{i}", "Destination": "/data", "RW": True}],
+            "GraphDriver": {"Name": "overlay2", "Data": {"MergedDir": f"/var/lib/docker/overlay2/{cid}/merged"}},
+            "NetworkSettings": {
+                "Ports": {"80/tcp": [{"HostIp": "0.0.0.0", "HostPort": str(20000 + i)}], "443/tcp": None},
+                "Networks": {net["Name"]: {"IPAddress": ip, "Gateway": net["IPAM"]["Config"][0]["Gateway"],
+                                           "MacAddress": "02:42:ac:11:00:02"}},
+            },
+        })
+        if running:
+            stats.append(f"{cid[:12]}|{rnd.uniform(0, 400):.2f}%|{rnd.uniform(0, 30):.2f}%")
+            scope = f"sys/fs/cgroup/system.slice/docker-{cid}.scope"
+            _write(base, f"{scope}/cpu.stat", f"usage_usec {rnd.randint(10**6, 10**12)}\nuser_usec 1\nsystem_usec 1\n"
+                                              "nr_periods 0\nnr_throttled 0\nthrottled_usec 0\n")
+            _write(base, f"{scope}/memory.current", f"{rnd.randint(10**7, 10**9)}\n")
+            _write(base, f"{scope}/memory.max", rnd.choice(("max", str(2 * 1024 ** 3))) + "\n")
+            _write(base, f"{scope}/memory.stat", "".join(f"{k} {rnd.randint(0, 10**8)}\n" for k in (
+                "anon", "file", "kernel_stack", "slab", "active_anon", "inactive_anon", "active_file", "inactive_file")))
+            _write(base, f"{scope}/io.stat", f"8:0 rbytes={rnd.randint(0, 10**11)} wbytes={rnd.randint(0, 10**11)} "
+                                             f"rios={rnd.randint(0, 10**7)} wios={rnd.randint(0, 10**7)} dbytes=0 dios=0\n")
+            _write(base, f"{scope}/pids.current", f"{rnd.randint(1, 200)}\n")
+    _write(base, "sys/fs/cgroup/cgroup.controllers", "cpuset cpu io memory hugetlb pids rdma misc\n")
+    _write(base, CMD_FILES["docker_ps"], "\n".join(c["Id"][:12] for c in inspected) + "\n")
+    _write(base, CMD_FILES["docker_inspect"], json.dumps(inspected, indent=4))
+    _write(base, CMD_FILES["docker_stats"], "\n".join(stats) + "\n")
+    _write(base, CMD_FILES["docker_network_ls"], "\n".join(n["Id"][:12] for n in networks) + "\n")
+    _write(base, CMD_FILES["docker_network_inspect"], json.dumps(networks, indent=4))
+
+    def fill(msg: str) -> str:
+        return msg.format(ip=_ip(rnd), port=rnd.randint(1024, 65535), n=rnd.randint(1, 10**6),
+                          user=rnd.choice(("admin", "test", "oracle", "ubuntu", "git")))
+
+    start = time.time() - log_lines
+    system, sshd, syslog, auth = [], [], [], []
+    for i in range(log_lines):
+        ts = start + i
+        iso = time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime(ts))
+        classic = time.strftime("%b %d %H:%M:%S", time.gmtime(ts))
+        process, msg = rnd.choice(SYSTEM_MESSAGES)
+        msg = fill(msg)
+        system.append(f"{iso} node01 {process}[{rnd.choice(pids)}]: {msg}")
+        syslog.append(f"{classic} node01 {process}[{rnd.choice(pids)}]: {msg}")
+        msg = fill(rnd.choice(SSH_MESSAGES))
+        sshd.append(f"{iso} node01 sshd[{rnd.choice(pids)}]: {msg}")
+        auth.append(f"{classic} node01 sshd[{rnd.choice(pids)}]: {msg}")
+    _write(base, CMD_FILES["journal_system"], "\n".join(system) + "\n")
+    _write(base, CMD_FILES["journal_sshd"], "\n".join(sshd) + "\n")
+    _write(base, LOG_FILES["/var/log/syslog"], "\n".join(syslog) + "\n")
+    _write(base, LOG_FILES["/var/log/auth.log"], "\n".join(auth) + "\n")
+    _write(base, "manifest.json", json.dumps({
+        "source": "generated", "seed": seed, "procs": procs, "containers": containers,
+        "sockets": sockets, "log_lines": log_lines,
+    }, indent=2))
+
+
+def record(base: pathlib.Path, log_lines: int) -> None:
+    # Снимок этой ноды: /proc без содержимого памяти процессов и вывод тех же команд, что вызывает агент
+    def capture(args):
+        try:
+            return subprocess.run(args, capture_output=True, text=True, timeout=60).stdout
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            return ""
+
+    for rel in PROC_FILES:
+        try:
+            _write(base, f"proc/{rel}", pathlib.Path("/proc", rel).read_text(encoding="utf-8", errors="replace"))
+        except OSError:
+            pass
+    procs = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            data = {rel: pathlib.Path("/proc", entry, rel).read_bytes() for rel in PID_FILES}
+        except OSError:
+            continue
+        for rel, raw in data.items():
+            path = base / "proc" / entry / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(raw)
+        procs += 1
+
+    _write(base, CMD_FILES["ss"], capture(["ss", "-tlnp"]))
+    ids = capture(["docker", "ps", "-aq"])
+    _write(base, CMD_FILES["docker_ps"], ids)
+    ids = ids.split()
+    _write(base, CMD_FILES["docker_inspect"], capture(["docker", "inspect", *ids]) if ids else "[]")
+    _write(base, CMD_FILES["docker_stats"], capture(
+        ["docker", "stats", "--no-stream", "--format", "{{.ID}}|{{.CPUPerc}}|{{.MemPerc}}", *ids]) if ids else "")
+    if os.path.exists("/sys/fs/cgroup/cgroup.controllers"):
+        # cgroup v2: каталоги контейнеров по тем же путям (pid из фикстуры inspect в поддельном /proc не найдётся)
+        from cgroups import CgroupReader
+        reader = CgroupReader()
+        _write(base, "sys/fs/cgroup/cgroup.controllers", "")
+        try:
+            inspected = json.loads(pathlib.Path(base, CMD_FILES["docker_inspect"]).read_text() or "[]")
+        except ValueError:
+            inspected = []
+        for item in inspected:
+            cid = item.get("Id") or ""
+            path = reader.path_for(cid, (item.get("State") or {}).get("Pid") or 0)
+            if not path:
+                continue
+            scope = f"sys/fs/cgroup/system.slice/docker-{cid}.scope"
+            for name in CGROUP_FILES:
+                try:
+                    _write(base, f"{scope}/{name}", pathlib.Path(path, name).read_text())
+                except OSError:
+                    pass
+    nets = capture(["docker", "network", "ls", "-q"])
+    _write(base, CMD_FILES["docker_network_ls"], nets)
+    _write(base, CMD_FILES["docker_network_inspect"],
+           capture(["docker", "network", "inspect", *nets.split()]) if nets.split() else "[]")
+    _write(base, CMD_FILES["journal_system"], capture(
+        ["journalctl", "-p", "info", "--no-pager", "-n", str(log_lines), "--output=short-iso"]))
+    _write(base, CMD_FILES["journal_sshd"], capture(
+        ["journalctl", "-t", "sshd", "-u", "ssh", "-u", "sshd", "--no-pager", "-n", str(log_lines), "--output=short-iso"]))
+    for real, rel in LOG_FILES.items():
+        if os.path.exists(real):
+            _write(base, rel, capture(["tail", "-n", str(log_lines), real]))
+    _write(base, "manifest.json", json.dumps({
+        "source": "recorded", "host": socket.gethostname(), "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "procs": procs, "containers": len(ids), "log_lines": log_lines,
+    }, indent=2))
+
+
+class Replay:
+    # Подмена subprocess.run: команды агента получают вывод из фикстур, остальное — FileNotFoundError,
+    # как на ноде без соответствующего бинаря (nvidia-smi, rocm-smi, lsb_release)
+    def __init__(self, base: pathlib.Path):
+        self.base = base
+        self.journald = True
+        self.text = {}
+        for key, rel in CMD_FILES.items():
+            path = base / rel
+            self.text[key] = path.read_text(encoding="utf-8", errors="replace") if path.exists() else ""
+        # docker inspect выдаёт JSON запрошенных id — держим каждую запись сериализованной заранее
+        self.inspect = self._by_id(self.text["docker_inspect"])
+        self.network_inspect = self._by_id(self.text["docker_network_inspect"])
+        # Журналы режем по строкам один раз: -n/tail отдают только хвост, как настоящие утилиты
+        self.lines = {key: self.text[key].splitlines() for key in ("journal_system", "journal_sshd")}
+        for real, rel in LOG_FILES.items():
+            path = base / rel
+            if path.exists():
+                self.lines[real] = path.read_text(encoding="utf-8", errors="replace").splitlines()
+
+    @staticmethod
+    def _by_id(raw: str) -> dict:
+        try:
+            items = json.loads(raw or "[]")
+        except json.JSONDecodeError:
+            return {}
+        return {item.get("Id", ""): json.dumps(item, indent=4) for item in items if isinstance(item, dict)}
+
+    @staticmethod
+    def _select(index: dict, ids) -> str:
+        found = [raw for full, raw in index.items() if any(full.startswith(i) for i in ids)]
+        return "[\n" + ",\n".join(found) + "\n]\n"
+
+    @staticmethod
+    def _tail(lines: list, args) -> str:
+        limit = int(args[args.index("-n") + 1]) if "-n" in args else len(lines)
+        return "\n".join(lines[-limit:]) + "\n" if limit and lines else ""
+
+    def output(self, args) -> str:
+        prog, rest = os.path.basename(args[0]), list(args[1:])
+        if prog in ("ss", "netstat"):
+            return self.text["ss"]
+        if prog == "docker" and rest[:1] == ["ps"]:
+            return self.text["docker_ps"]
+        if prog == "docker" and rest[:1] == ["inspect"]:
+            return self._select(self.inspect, rest[1:])
+        if prog == "docker" and rest[:1] == ["stats"]:
+            ids = [a for a in rest[1:] if not a.startswith("-") and "{{" not in a]
+            return "\n".join(l for l in self.text["docker_stats"].splitlines() if l.split("|", 1)[0] in ids) + "\n"
+        if prog == "docker" and rest[:2] == ["network", "ls"]:
+            return self.text["docker_network_ls"]
+        if prog == "docker" and rest[:2] == ["network", "inspect"]:
+            return self._select(self.network_inspect, rest[2:])
+        if prog == "journalctl" and self.journald:
+            return self._tail(self.lines["journal_sshd" if "sshd" in rest else "journal_system"], rest)
+        if prog == "tail" and rest[-1] in self.lines:
+            return self._tail(self.lines[rest[-1]], rest)
+        raise FileNotFoundError(2, "No such file or directory", args[0])
+
+    def run(self, args, capture_output=False, text=False, timeout=None, check=False, **kwargs):
+        out = self.output(list(args))
+        return subprocess.CompletedProcess(args, 0, out if text else out.encode(), "" if text else b"")
+
+    def exists(self, path, _real=os.path.exists):
+        # Файловые логи: /var/log/* берутся из фикстуры, прочие пути — как есть
+        if path in LOG_FILES:
+            return (self.base / LOG_FILES[path]).exists()
+        return _real(path)
+
+
+def benchmarks():
+    # (имя, подготовка агента/подмены, вызов)
+    def journald(on):
+        def setup(agent, replay):
+            replay.journald = on
+            agent._log_cursors = {}
+        return setup
+
+    def none(agent, replay):
+        replay.journald = True
+
+    return [
+        ("collect_metrics", none, lambda a: a.collect_metrics()),
+        ("collect_processes", none, lambda a: a.collect_processes()),
+        ("collect_docker_snapshot", none, lambda a: a.collect_docker_snapshot()),
+        ("collect_ports", none, lambda a: a.collect_ports()),
+        ("collect_system_logs[journald]", journald(True), lambda a: a.collect_system_logs()),
+        ("collect_system_logs[syslog]", journald(False), lambda a: a.collect_system_logs()),
+        ("collect_ssh_auth_logs[journald]", journald(True), lambda a: a.collect_ssh_auth_logs()),
+        ("collect_ssh_auth_logs[auth.log]", journald(False), lambda a: a.collect_ssh_auth_logs()),
+    ]
+
+
+def _size(result) -> int:
+    if isinstance(result, dict):
+        return len(result.get("containers") or result)
+    return len(result) if hasattr(result, "__len__") else 1
+
+
+def run_benchmarks(base: pathlib.Path, repeat: int, only=None) -> dict:
+    import psutil
+    os.environ["SPOOL_ENABLED"] = "false"
+    import main as agent_main
+
+    replay = Replay(base)
+    psutil.PROCFS_PATH = str(base / "proc")
+    real_run, real_exists = subprocess.run, os.path.exists
+    subprocess.run, os.path.exists = replay.run, replay.exists
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent = agent_main.MonitoringAgent("http://127.0.0.1:9", "bench", "bench")
+            # Быстрые читатели /proc — тоже с фикстур; /sys у фикстур нет, поэтому диски считаются по всем строкам
+            if agent._proc is not None:
+                agent._proc = agent_main.ProcFS(root=str(base / "proc"), sys_root=str(base / "sys"))
+                agent._cpu_times = agent._read_cpu_times()
+                agent._disk_io = agent._read_disk_io()
+            # cgroup v2 — из фикстур; без них (запись с cgroup v1) — docker stats, как на такой ноде
+            cgroup_root = base / "sys" / "fs" / "cgroup"
+            agent._cgroups = agent_main.CgroupReader(root=str(cgroup_root), proc_root=str(base / "proc"))
+            if not agent._cgroups.available():
+                agent._cgroups = None
+            # Точки монтирования — из фикстур; interval=0: statvfs на каждом прогоне, без кэша
+            agent._fs = agent_main.FsUsage(proc_root=str(base / "proc"), interval=0)
+        for name, setup, call in benchmarks():
+            if only and not any(o in name for o in only):
+                continue
+            wall, cpu = [], []
+            items = 0
+            # Первый прогон — прогрев (кэши psutil, импорт csv и т.п.), в статистику не входит
+            for i in range(repeat + 1):
+                setup(agent, replay)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    w0, c0 = time.perf_counter(), time.process_time()
+                    result = call(agent)
+                    w1, c1 = time.perf_counter(), time.process_time()
+                if i:
+                    wall.append(w1 - w0)
+                    cpu.append(c1 - c0)
+                items = _size(result)
+            setup(agent, replay)
+            tracemalloc.start()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    call(agent)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            results[name] = {
+                "runs": repeat,
+                "wall_ms": round(statistics.median(wall) * 1000, 2),
+                "wall_max_ms": round(max(wall) * 1000, 2),
+                "cpu_ms": round(statistics.median(cpu) * 1000, 2),
+                "peak_kib": round(peak / 1024, 1),
+                "items": items,
+            }
+    finally:
+        subprocess.run, os.path.exists = real_run, real_exists
+        psutil.PROCFS_PATH = "/proc"
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, floor_ms: float) -> list:
+    # Регрессия: CPU-время или пик памяти выросли больше чем в threshold раз (и CPU — больше чем на floor_ms)
+    problems = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if cur["cpu_ms"] > base["cpu_ms"] * threshold and cur["cpu_ms"] - base["cpu_ms"] > floor_ms:
+            problems.append(f"{name}: cpu {base['cpu_ms']} -> {cur['cpu_ms']} ms")
+        if cur["peak_kib"] > base["peak_kib"] * threshold and cur["peak_kib"] - base["peak_kib"] > 256:
+            problems.append(f"{name}: peak {base['peak_kib']} -> {cur['peak_kib']} KiB")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк коллекторов агента на фикстурах")
+    parser.add_argument("--fixtures", help="каталог фикстур (по умолчанию — синтетические во временном каталоге)")
+    parser.add_argument("--record", metavar="DIR", help="записать фикстуры с этой ноды и выйти")
+    parser.add_argument("--generate", metavar="DIR", help="сгенерировать синтетические фикстуры и выйти")
+    parser.add_argument("--procs", type=int, default=5000)
+    parser.add_argument("--containers", type=int, default=300)
+    parser.add_argument("--sockets", type=int, default=3000)
+    parser.add_argument("--log-lines", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", help="только коллекторы, в имени которых есть подстрока")
+    parser.add_argument("--save", help="сохранить результаты в JSON (база для --compare)")
+    parser.add_argument("--compare", help="JSON прошлого прогона; код выхода 1 при регрессии")
+    parser.add_argument("--threshold", type=float, default=1.3)
+    parser.add_argument("--floor-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    sizes = dict(procs=args.procs, containers=args.containers, sockets=args.sockets, log_lines=args.log_lines)
+    if args.record:
+        record(pathlib.Path(args.record), args.log_lines)
+        print(f"Fixtures recorded to {args.record}")
+        return 0
+    if args.generate:
+        generate(pathlib.Path(args.generate), **sizes)
+        print(f"Fixtures generated in {args.generate}")
+        return 0
+
+    tmp = None
+    if args.fixtures:
+        base = pathlib.Path(args.fixtures)
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench-fixtures-")
+        base = pathlib.Path(tmp)
+        generate(base, **sizes)
+    try:
+        manifest = json.loads((base / "manifest.json").read_text(encoding="utf-8")) if (base / "manifest.json").exists() else {}
+        results = run_benchmarks(base, max(1, args.repeat), args.only)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"fixtures: {manifest or base}")
+    print(f"{'collector':34} {'wall ms':>9} {'max ms':>9} {'cpu ms':>9} {'peak KiB':>10} {'items':>7}")
+    for name, r in results.items():
+        print(f"{name:34} {r['wall_ms']:>9} {r['wall_max_ms']:>9} {r['cpu_ms']:>9} {r['peak_kib']:>10} {r['items']:>7}")
+    if args.save:
+        pathlib.Path(args.save).write_text(json.dumps({"fixtures": manifest, "results": results}, indent=2), encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8")).get("results", {})
+        problems = compare(results, baseline, args.threshold, args.floor_ms)
+        for line in problems:
+            print(f"REGRESSION {line}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк старта агента: время импорта agent/main.py и время до первого heartbeat / первой выгрузки метрик.
+
+Импорт меряется через python -X importtime в чистом процессе; необязательные подсистемы (UPnP, SNMP,
+http.server) при импорте грузиться не должны. Затем агент запускается против локального поддельного
+мастера, и фиксируется, когда пришли первый heartbeat, первый конверт с метриками и когда агент
+поднял необязательные подсистемы.
+
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --import-budget-ms 400 --metrics-budget-ms 5000   # код 1 при превышении
+"""
+import argparse
+import json
+import os
+import pathlib
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+AGENT_DIR = ROOT / "agent"
+# Модули, которые не должны импортироваться вместе с main.py (urllib.request и csv тянет сам requests)
+LAZY_MODULES = ("upnp", "snmp_if", "net_ident", "xml.etree.ElementTree", "http.server", "profiler")
+
+
+def measure_import(runs: int):
+    # -X importtime пишет в stderr: "import time: self | cumulative | module" (микросекунды)
+    subprocess.run([sys.executable, "-m", "compileall", "-q", str(AGENT_DIR)], check=False)
+    totals, modules = [], {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main"],
+            cwd=AGENT_DIR, capture_output=True, text=True, timeout=60,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import main failed: {proc.stderr[-500:]}")
+        rows = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = line[len("import time:"):].split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].rstrip()
+            # Отступ имени — глубина вложенности: " main", "   requests", ...
+            rows.append((name.strip(), int(parts[1]), len(name) - len(name.lstrip())))
+        # Поддерево main: строки между предыдущим модулем верхнего уровня (site, encodings) и самим main
+        end = next((i for i, row in enumerate(rows) if row[0] == "main" and row[2] == 1), len(rows) - 1)
+        start = end
+        while start > 0 and rows[start - 1][2] > 1:
+            start -= 1
+        modules = {name: (cumulative, depth) for name, cumulative, depth in rows[start:end + 1]}
+        totals.append(modules.get("main", (0, 0))[0] / 1000)
+    # Прямые зависимости main — по убыванию накопленного времени
+    top = sorted(((n, c / 1000) for n, (c, depth) in modules.items() if depth == 3), key=lambda x: -x[1])
+    return {
+        "median_ms": round(statistics.median(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "top": [(n, round(ms, 1)) for n, ms in top[:10]],
+        "lazy_loaded": [m for m in LAZY_MODULES if m in modules],
+    }
+
+
+class FakeMaster(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _MasterHandler)
+        self.events = queue.Queue()
+
+
+class _MasterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _body(self) -> bytes:
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+        if self.headers.get("Content-Encoding", "") in ("gzip", "deflate"):
+            raw = zlib.decompress(raw, 47)
+        return raw
+
+    def _send(self, payload: dict) -> None:
+        out = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_POST(self):
+        body = self._body()
+        now = time.monotonic()
+        if "action=heartbeat" in self.path:
+            self.server.events.put(("heartbeat", now))
+            self._send({"ok": True})
+        elif self.path.startswith("/api/ingest.php"):
+            try:
+                sections = json.loads(body).get("sections") or {}
+            except ValueError:
+                sections = {}
+            for name in sections:
+                self.server.events.put((name, now))
+            self._send({"sections": {name: {"ok": True} for name in sections}})
+        else:
+            self._send({"ok": True})
+
+    def do_GET(self):
+        # get-command: команд нет; long-poll не держим, чтобы агент не висел на остановке
+        self._send({"status": "no-command"})
+
+    def log_message(self, *args):
+        return
+
+
+def measure_first_upload(timeout: float):
+    master = FakeMaster()
+    threading.Thread(target=master.serve_forever, daemon=True).start()
+    work = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(
+        os.environ,
+        MASTER_URL=f"http://127.0.0.1:{master.server_address[1]}",
+        NODE_NAME="bench-startup", NODE_TOKEN="bench-startup-token",
+        SPOOL_DIR=os.path.join(work, "spool"), HEALTH_PORT="0",
+        COMMAND_POLL_WAIT="0", COMMAND_INTERVAL="60", PYTHONUNBUFFERED="1",
+    )
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, str(AGENT_DIR / "main.py")],
+        cwd=work, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    marks = {}
+
+    def read_stdout():
+        for line in proc.stdout:
+            if "starting optional subsystems" in line and "optional" not in marks:
+                marks["optional"] = time.monotonic()
+            if "UPnP SSDP NOTIFY" in line and "upnp_listeners" not in marks:
+                marks["upnp_listeners"] = time.monotonic()
+
+    threading.Thread(target=read_stdout, daemon=True).start()
+    try:
+        deadline = started + timeout
+        while time.monotonic() < deadline and not ({"heartbeat", "metrics"} <= marks.keys() and "optional" in marks):
+            try:
+                name, at = master.events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            marks.setdefault(name, at)
+        time.sleep(0.5)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        master.shutdown()
+    return {k: round((v - started) * 1000) for k, v in sorted(marks.items(), key=lambda kv: kv[1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк старта агента")
+    parser.add_argument("--runs", type=int, default=5, help="повторов измерения импорта")
+    parser.add_argument("--import-budget-ms", type=float, default=250.0)
+    parser.add_argument("--heartbeat-budget-ms", type=float, default=2000.0)
+    parser.add_argument("--metrics-budget-ms", type=float, default=5000.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="сколько ждать первой выгрузки")
+    parser.add_argument("--import-only", action="store_true", help="только время импорта, без запуска агента")
+    parser.add_argument("--json", action="store_true", help="результат одним JSON")
+    args = parser.parse_args()
+
+    result = {"import": measure_import(max(1, args.runs))}
+    if not args.import_only:
+        result["startup_ms"] = measure_first_upload(args.timeout)
+
+    problems = []
+    imp = result["import"]
+    if imp["median_ms"] > args.import_budget_ms:
+        problems.append(f"import main: {imp['median_ms']} ms > budget {args.import_budget_ms:g} ms")
+    if imp["lazy_loaded"]:
+        problems.append(f"import main loads optional modules: {', '.join(imp['lazy_loaded'])}")
+    startup = result.get("startup_ms")
+    if startup is not None:
+        for mark, budget in (("heartbeat", args.heartbeat_budget_ms), ("metrics", args.metrics_budget_ms)):
+            if mark not in startup:
+                problems.append(f"no first {mark} within {args.timeout:g}s")
+            elif startup[mark] > budget:
+                problems.append(f"first {mark}: {startup[mark]} ms > budget {budget:g} ms")
+        if "optional" in startup and "metrics" in startup and startup["optional"] < startup["metrics"]:
+            problems.append("optional subsystems started before the first metrics upload")
+    result["problems"] = problems
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"import main: median {imp['median_ms']} ms, max {imp['max_ms']} ms (budget {args.import_budget_ms:g} ms)")
+        for name, ms in imp["top"]:
+            print(f"  {name:28} {ms:>8} ms")
+        if startup is not None:
+            print("startup (ms after exec): " + ", ".join(f"{k}={v}" for k, v in startup.items()))
+        for line in problems:
+            print(f"BUDGET {line}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Проверка GPU-бэкендов агента (agent/gpu.py) без драйвера NVIDIA: поддельная libnvidia-ml и поддельный
+поток nvidia-smi --loop-ms. Проверяется: NOT_SUPPORTED -> None, переинициализация после GPU_IS_LOST,
+разбор строк потока, устаревание строк зависшего nvidia-smi и что без NVML процессы на GPU
+не опрашиваются разовым nvidia-smi на каждый сбор.
+
+    python scripts/check_gpu.py        # код 1, если хоть одна проверка не прошла
+"""
+import pathlib
+import sys
+import threading
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "agent"))
+
+import gpu  # noqa: E402
+from gpu import (NVML_ERROR_GPU_IS_LOST, NVML_ERROR_NOT_SUPPORTED, NVML_SUCCESS,  # noqa: E402
+                 GpuTelemetry, NvmlBackend, SmiStream)
+
+MIB = 1024 * 1024
+FAILURES = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f": {detail}" if detail and not ok else ""))
+    if not ok:
+        FAILURES.append(name)
+
+
+def _out(ref):
+    # byref(x) в поддельную функцию приходит как CArgObject; сам объект — в _obj
+    return ref._obj
+
+
+class FakeNvml:
+    # Две карты; у второй нет загрузки, ECC и вентилятора (NOT_SUPPORTED), температура первой может «потерять» GPU
+    def __init__(self):
+        self.inits = 0
+        self.shutdowns = 0
+        self.lost = False
+
+    def nvmlInit_v2(self):
+        self.inits += 1
+        return NVML_SUCCESS
+
+    def nvmlShutdown(self):
+        self.shutdowns += 1
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetCount_v2(self, count):
+        _out(count).value = 2
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetHandleByIndex_v2(self, index, handle):
+        _out(handle).value = 100 + index.value
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetName(self, handle, buf, size):
+        buf.value = b"Tesla T4" if handle.value == 100 else b"GeForce RTX 3090"
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetUUID(self, handle, buf, size):
+        buf.value = b"GPU-%d" % handle.value
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetUtilizationRates(self, handle, util):
+        if handle.value == 101:
+            return NVML_ERROR_NOT_SUPPORTED
+        _out(util).gpu, _out(util).memory = 42, 7
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetMemoryInfo(self, handle, mem):
+        _out(mem).total, _out(mem).used = 16 * 1024 * MIB, 3 * 1024 * MIB
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetTemperature(self, handle, sensor, value):
+        if self.lost and handle.value == 100:
+            return NVML_ERROR_GPU_IS_LOST
+        _out(value).value = 61
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetPowerUsage(self, handle, value):
+        _out(value).value = 70500
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetEnforcedPowerLimit(self, handle, value):
+        _out(value).value = 70000
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetClockInfo(self, handle, clock, value):
+        _out(value).value = (1590, 1590, 5001)[clock.value]
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetTotalEccErrors(self, handle, error_type, counter_type, value):
+        if handle.value == 101:
+            return NVML_ERROR_NOT_SUPPORTED
+        _out(value).value = 3 if error_type.value else 0
+        return NVML_SUCCESS
+
+    def nvmlDeviceGetFanSpeed(self, handle, value):
+        if handle.value == 101:
+            return NVML_ERROR_NOT_SUPPORTED
+        _out(value).value = 30
+        return NVML_SUCCESS
+
+
+def check_nvml():
+    lib = FakeNvml()
+    backend = NvmlBackend(lib)
+    rows = backend.read()
+    check("nvml: все карты прочитаны", rows is not None and len(rows) == 2, repr(rows))
+    if not rows:
+        return
+    first, second = rows
+    check("nvml: память в МиБ", first["memory_used"] == 3072 and first["memory_total"] == 16384, repr(first))
+    check("nvml: мощность в ваттах", first["power_watts"] == 70.5 and first["power_limit_watts"] == 70.0, repr(first))
+    check("nvml: ECC и вентилятор", first["ecc_uncorrected"] == 3 and first["fan_percent"] == 30, repr(first))
+    check("nvml: NOT_SUPPORTED -> None",
+          second["ecc_corrected"] is None and second["ecc_uncorrected"] is None and second["fan_percent"] is None
+          and second["utilization"] is None and second["memory_utilization"] is None,
+          repr(second))
+    check("nvml: init один раз на несколько чтений", backend.read() is not None and lib.inits == 1, f"inits={lib.inits}")
+
+    lib.lost = True
+    check("nvml: GPU_IS_LOST -> None (запасной путь)", backend.read() is None)
+    check("nvml: после потери NVML закрыт", lib.shutdowns == 1, f"shutdowns={lib.shutdowns}")
+    lib.lost = False
+    rows = backend.read()
+    check("nvml: переинициализация на следующем чтении", rows is not None and len(rows) == 2 and lib.inits == 2,
+          f"inits={lib.inits}")
+
+
+class HangingStdout:
+    # stdout nvidia-smi: отдаёт заданные строки и «зависает» до release()
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.gate = threading.Event()
+
+    def __iter__(self):
+        yield from self.lines
+        self.gate.wait()
+
+    def release(self):
+        self.gate.set()
+
+
+class FakePopen:
+    started = []
+
+    def __init__(self, args, **kwargs):
+        self.args = args
+        self.stdout = HangingStdout([
+            "0, Tesla T4, GPU-100, 37, 5, 1024, 15360, 55, 30.12, 70.00, 300, 300, 405, 0, 2, 30\n",
+            "1, GeForce RTX 3090, GPU-101, 90, 40, 20000, 24576, 80, 350.5, 370.00, 1900, 1900, 9750, "
+            "[N/A], [N/A], [Not Supported]\n",
+        ])
+        FakePopen.started.append(self)
+
+    def poll(self):
+        return None if not self.stdout.gate.is_set() else 0
+
+    def wait(self):
+        self.stdout.gate.wait()
+        return 0
+
+    def terminate(self):
+        self.stdout.release()
+
+
+def check_smi_stream():
+    stream = SmiStream(loop_ms=100, popen=FakePopen, log=lambda msg: None)
+    stream.read()
+    time.sleep(0.05)
+    rows = stream.read()
+    check("smi-loop: строки потока разобраны", len(rows) == 2, repr(rows))
+    if len(rows) == 2:
+        check("smi-loop: --loop-ms в аргументах", "--loop-ms=100" in FakePopen.started[0].args)
+        check("smi-loop: [N/A]/[Not Supported] -> None",
+              rows[1]["ecc_corrected"] is None and rows[1]["fan_percent"] is None, repr(rows[1]))
+        check("smi-loop: числа", rows[0]["memory_used"] == 1024 and rows[0]["power_watts"] == 30.12, repr(rows[0]))
+    check("smi-loop: процесс запущен один раз", len(FakePopen.started) == 1, f"started={len(FakePopen.started)}")
+    # Поток «завис»: новых строк нет дольше трёх периодов — старые цифры не выдаются за текущие
+    time.sleep(0.4)
+    check("smi-loop: строки зависшего потока устаревают", stream.read() == [])
+    stream.close()
+
+
+def check_apps_interval():
+    # exec/smi-loop: --query-compute-apps не чаще apps_interval, сколько бы сборщиков ни спрашивало
+    calls = []
+    real = gpu.smi_processes
+    gpu.smi_processes = lambda binary, uuids=None, run=None: calls.append(binary) or {7: {
+        "gpu_memory": MIB, "gpu_util": None, "gpus": []}}
+    try:
+        telemetry = GpuTelemetry("exec", log=lambda msg: None, apps_interval=60)
+        telemetry._chosen, telemetry._smi = True, "nvidia-smi"
+        first = telemetry.processes()
+        telemetry.processes()
+        telemetry.processes()
+    finally:
+        gpu.smi_processes = real
+    check("apps: разовый nvidia-smi один раз за apps_interval", len(calls) == 1, f"calls={len(calls)}")
+    check("apps: результат из кэша", first.get(7, {}).get("gpu_memory") == MIB, repr(first))
+
+
+def main():
+    check_nvml()
+    check_smi_stream()
+    check_apps_interval()
+    if FAILURES:
+        print(f"{len(FAILURES)} check(s) failed")
+        return 1
+    print("all checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,7 @@ import shutil
 import subprocess
 import sys
 import urllib.parse
+import zlib
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
@@ -70,7 +71,26 @@ if not FRONTEND_ROOT.exists():
     sys.stderr.write(f"ПРЕДУПРЕЖДЕНИЕ: Директория {FRONTEND_ROOT} не найдена.\n")
 
 
+MAX_REQUEST_BODY = 64 * 1024 * 1024  # потолок распакованного тела запроса
+
+
+def _decompress_body(data: bytes) -> bytes:
+    # gzip и zlib (wbits=47 определяет формат сам); голый deflate — запасной вариант
+    for wbits in (47, -15):
+        decomp = zlib.decompressobj(wbits)
+        try:
+            out = decomp.decompress(data, MAX_REQUEST_BODY)
+        except zlib.error:
+            continue
+        if decomp.unconsumed_tail:
+            raise ValueError("decompressed body too large")
+        return out
+    raise zlib.error("unsupported compressed data")
+
+
 class PHPRequestHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 — агенты держат keep-alive соединения; каждый ответ обязан нести Content-Length
+    protocol_version = "HTTP/1.1"
     extensions_map = {
         **SimpleHTTPRequestHandler.extensions_map,
         ".php": "text/html",
@@ -114,6 +134,7 @@ class PHPRequestHandler(SimpleHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, PATCH, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
         self.send_header("Access-Control-Max-Age", "3600")
+        self.send_header("Content-Length", "0")
         self.end_headers()
         return
     
@@ -135,10 +156,21 @@ class PHPRequestHandler(SimpleHTTPRequestHandler):
         if length:
             body = self.rfile.read(length)
 
+        # Сжатое тело (агент шлёт Content-Encoding: gzip) распаковываем здесь, PHP получает обычный JSON
+        encoding = self.headers.get("Content-Encoding", "").strip().lower()
+        if body and encoding in ("gzip", "deflate"):
+            try:
+                body = _decompress_body(body)
+            except (zlib.error, ValueError) as e:
+                self.send_error(400, f"Bad {encoding} body: {e}")
+                return
+
         env = os.environ.copy()
         # Передаем все HTTP заголовки в переменные окружения для PHP
         http_headers = {}
         for header_name, header_value in self.headers.items():
+            if encoding in ("gzip", "deflate") and header_name.lower() == "content-encoding":
+                continue
             # Преобразуем имя заголовка в формат HTTP_* для PHP
             env_name = "HTTP_" + header_name.upper().replace("-", "_")
             http_headers[env_name] = header_value
@@ -192,12 +224,12 @@ class PHPRequestHandler(SimpleHTTPRequestHandler):
             sys.stderr.write(f"Существует: {os.path.exists(script_path)}\n")
             sys.stderr.write(f"STDOUT (первые 500 символов): {stdout_preview}\n")
             
+            error_body = f"Ошибка PHP ({proc.returncode}):\n{error_msg}\n\nSTDOUT:\n{stdout_preview}".encode("utf-8", "ignore")
             self.send_response(500)
             self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(error_body)))
             self.end_headers()
-            self.wfile.write(
-                f"Ошибка PHP ({proc.returncode}):\n{error_msg}\n\nSTDOUT:\n{stdout_preview}".encode("utf-8", "ignore")
-            )
+            self.wfile.write(error_body)
             return
 
         if not stdout:
@@ -285,24 +317,25 @@ class PHPRequestHandler(SimpleHTTPRequestHandler):
                 sys.stderr.write(f"Размер header_blob: {len(header_blob)} байт\n")
                 sys.stderr.write(f"Первые 200 символов header_blob: {header_blob[:200].decode(errors='ignore')}\n")
 
+        # Если тело пустое, но это не редирект - отправляем минимальный HTML для диагностики
+        if len(payload) == 0 and status_code == 200 and not location_header:
+            sys.stderr.write(f"ОШИБКА: Пустое тело ответа при статусе 200 для {script_path}\n")
+            payload = "<!DOCTYPE html><html><head><meta charset='UTF-8'><title>Error</title></head><body><h1>Empty response</h1><p>Script returned no content. Check server logs.</p></body></html>".encode('utf-8')
+
         self.send_response(status_code)
         # Важно: Set-Cookie заголовки должны быть отправлены первыми
         for key, value in response_headers:
             if key.lower() == "set-cookie":
                 self.send_header(key, value)
-        # Остальные заголовки
+        # Остальные заголовки (Content-Length считаем сами по фактическому телу)
         for key, value in response_headers:
-            if key.lower() != "set-cookie":
+            if key.lower() not in ("set-cookie", "content-length"):
                 self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
         self.end_headers()
         
-        # Если тело пустое, но это не редирект - отправляем минимальный HTML для диагностики
-        if len(payload) == 0 and status_code == 200 and not location_header:
-            sys.stderr.write(f"ОШИБКА: Пустое тело ответа при статусе 200 для {script_path}\n")
-            payload = "<!DOCTYPE html><html><head><meta charset='UTF-8'><title>Error</title></head><body><h1>Empty response</h1><p>Script returned no content. Check server logs.</p></body></html>".encode('utf-8')
-        
         # Для редиректа тело может быть пустым - это нормально
-        if payload:
+        if payload and self.command != "HEAD":
             self.wfile.write(payload)
 
 